@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark de carga do search_memory: p50/p99 com 1, 10 e 50 clientes, com e sem micro-batching de embeddings"""
+
+import io
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import server
+from server import search_memory, add_memories_bulk
+
+USER_ID = "benchmark_concurrent"
+CLIENTS = [1, 10, 50]
+REQUESTS_PER_CLIENT = 10
+# Parte das buscas repete a mesma query ao mesmo tempo (agentes pedindo o mesmo contexto)
+SHARED_QUERY_EVERY = 5
+
+server._ensure_mem0()
+batcher = server._embedding_batcher()
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_clients(clients: int) -> tuple[list[float], float]:
+    """Cada cliente faz REQUESTS_PER_CLIENT buscas; queries únicas evitam os caches de busca/embedding."""
+    run_id = uuid.uuid4().hex[:8]
+
+    def client(index: int) -> list[float]:
+        timings = []
+        for i in range(REQUESTS_PER_CLIENT):
+            if i % SHARED_QUERY_EVERY == 0:
+                query = f"shared question {run_id} {i}"
+            else:
+                query = f"client {index} question {run_id} {i} about repository patterns"
+            start = time.perf_counter()
+            search_memory(query, user_id=USER_ID, limit=5)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        timings = [t for result in pool.map(client, range(clients)) for t in result]
+    return timings, time.perf_counter() - started
+
+
+print("=" * 72)
+print("BENCHMARK: search_memory concorrente (micro-batching de embeddings)")
+print("=" * 72)
+
+existing = server.mem0.get_all(user_id=USER_ID, limit=1)
+existing = existing.get("results", existing) if isinstance(existing, dict) else existing
+if not existing:
+    print(f"\nSeeding 200 memórias para '{USER_ID}'...")
+    add_memories_bulk([{"text": f"[BENCHMARK] note {i} about repository patterns"} for i in range(200)], user_id=USER_ID)
+
+configured_window = batcher.window
+print(f"\n{'modo':<10} | {'clientes':>8} | {'p50 (ms)':>9} | {'p99 (ms)':>9} | {'buscas/s':>8} | {'lotes':>5} | {'embeds':>6}")
+print("-" * 72)
+for label, window in (("sem batch", 0.0), ("batch", configured_window or 0.005)):
+    batcher.window = window
+    for clients in CLIENTS:
+        before = batcher.stats()
+        timings, elapsed = run_clients(clients)
+        after = batcher.stats()
+        print(
+            f"{label:<10} | {clients:>8} | {statistics.median(timings):>9.1f} | {percentile(timings, 99):>9.1f} | "
+            f"{len(timings) / elapsed:>8.1f} | {after['batch_calls'] - before['batch_calls']:>5} | "
+            f"{(after['requests'] - before['requests']) - (after['coalesced'] - before['coalesced']):>6}"
+        )
+batcher.window = configured_window
+
+print("=" * 72)
+print("embeds = chamadas ao provedor; o ganho de latência depende do custo real de cada embed no Ollama")
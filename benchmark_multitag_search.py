@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark search_memory com múltiplas tags: N buscas (legado) vs busca única (índice de tags)"""
+
+import io
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import server
+from server import build_mem0, search_memory, add_memories_bulk, _merge_results_or
+
+USER_ID = "benchmark_multitag"
+QUERY = "repository pattern for data access"
+TAG_COUNTS = [1, 5, 20]
+REPEAT = 10
+TAGS = [f"bench_tag_{i}" for i in range(20)]
+
+if server.mem0 is None:
+    print("Initializing Mem0...")
+    server.mem0 = build_mem0()
+
+
+def legacy_search(query: str, tags: list[str], limit: int = 5) -> list[dict]:
+    """Estratégia antiga: uma busca vetorial por tag + união no servidor."""
+    partials = []
+    for tag in tags:
+        res = server.mem0.search(query, user_id=USER_ID, filters={"tags": tag}, limit=limit)
+        partials.append(res.get("results", res) if isinstance(res, dict) else res)
+    return _merge_results_or(partials, limit=limit)
+
+
+def single_pass_search(query: str, tags: list[str], limit: int = 5) -> list[dict]:
+    server.search_cache.clear()  # mede a busca, não o cache de resultados
+    return search_memory(query, user_id=USER_ID, tags=tags, limit=limit)["results"]
+
+
+def measure(fn, tags: list[str]) -> list[float]:
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn(QUERY, tags)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+print("=" * 60)
+print("BENCHMARK: search_memory multi-tag (N buscas vs busca única)")
+print("=" * 60)
+
+existing = server.mem0.get_all(user_id=USER_ID, limit=1)
+existing = existing.get("results", existing) if isinstance(existing, dict) else existing
+if not existing:
+    print(f"\nSeeding {len(TAGS) * 10} memórias para '{USER_ID}'...")
+    add_memories_bulk(
+        [{"text": f"[BENCHMARK] note {i} about {TAGS[i % len(TAGS)]}", "tags": [TAGS[i % len(TAGS)]]}
+         for i in range(len(TAGS) * 10)],
+        user_id=USER_ID,
+    )
+
+print(f"\n{'tags':>5} | {'legado p50 (ms)':>16} | {'único p50 (ms)':>15} | {'ganho':>6}")
+print("-" * 55)
+for count in TAG_COUNTS:
+    tags = TAGS[:count]
+    legacy = statistics.median(measure(legacy_search, tags))
+    single = statistics.median(measure(single_pass_search, tags))
+    print(f"{count:>5} | {legacy:>16.1f} | {single:>15.1f} | {legacy / single:>5.1f}x")
+
+print("=" * 60)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark de serialização: json.loads(json.dumps(default=str)) vs _jsonable vs orjson em 1k resultados"""
+
+import io
+import json
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from server import _jsonable, orjson
+
+RESULT_COUNT = 1000
+REPEAT = 20
+
+
+def build_results(count: int) -> dict:
+    """Monta um payload no formato do mem0.search/get_all com datetimes no metadata."""
+    now = datetime.now()
+    return {
+        "results": [
+            {
+                "id": f"00000000-0000-0000-0000-{i:012d}",
+                "memory": f"[BENCHMARK] Always use parameterized queries ({i})",
+                "hash": f"{i:032x}",
+                "score": 0.1 + (i % 100) / 1000,
+                "user_id": "benchmark_serialization",
+                "created_at": now - timedelta(minutes=i),
+                "updated_at": None,
+                "metadata": {
+                    "tags": ["python", "python.django", "security"],
+                    "language": "python",
+                    "severity": "MUST",
+                    "has_examples": bool(i % 2),
+                    "indexed_at": now,
+                },
+            }
+            for i in range(count)
+        ]
+    }
+
+
+def roundtrip(payload):
+    return json.loads(json.dumps(payload, default=str))
+
+
+def measure(fn, payload) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn(payload)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+payload = build_results(RESULT_COUNT)
+assert _jsonable(payload) == roundtrip(payload), "_jsonable diverge do round-trip json"
+
+print("=" * 60)
+print(f"BENCHMARK: serialização de {RESULT_COUNT} resultados (p50 de {REPEAT} execuções)")
+print("=" * 60)
+
+baseline = measure(roundtrip, payload)
+rows = [("json round-trip (antigo)", baseline), ("_jsonable", measure(_jsonable, payload))]
+if orjson is not None:
+    rows.append(("_jsonable + orjson.dumps", measure(lambda p: orjson.dumps(_jsonable(p)), payload)))
+    rows.append(("json.dumps(_jsonable)", measure(lambda p: json.dumps(_jsonable(p)), payload)))
+else:
+    print("\norjson não instalado: resposta HTTP usa o JSONResponse padrão")
+
+print(f"\n{'estratégia':<26} | {'p50 (ms)':>9} | {'ganho':>6}")
+print("-" * 48)
+for name, p50 in rows:
+    print(f"{name:<26} | {p50:>9.2f} | {baseline / p50:>5.1f}x")
+
+print("=" * 60)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Ollama falso para os testes: embeddings determinísticos (bag of words com hash) e um LLM
+que devolve os fatos configurados. Sobe em uma porta livre e isola o estado do servidor
+(Chroma, SQLite, caches) num diretório temporário — precisa rodar antes de `import server`.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DIMS = 64
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def embed_text(text: str, dims: int = DIMS) -> list[float]:
+    """Textos com as mesmas palavras ficam próximos; textos iguais têm o mesmo vetor."""
+    vector = [0.0] * dims
+    for word in _WORD_RE.findall(text.lower()) or [""]:
+        digest = hashlib.sha256(word.encode()).digest()
+        for i in range(dims):
+            vector[i] += (digest[i % 32] - 127.5) / 127.5
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class StubOllama(BaseHTTPRequestHandler):
+    """Responde /api/tags, /api/embed (lote), /api/embeddings, /api/chat e /api/generate."""
+
+    calls: dict[str, int] = {}
+    embedded: list[str] = []
+    # Modelo pedido em cada chamada ao /api/chat, na ordem
+    chat_models: list[str] = []
+    # Fatos devolvidos pela extração do LLM (lista vazia = o LLM não extrai nada)
+    facts: list[str] = []
+    # Evento devolvido na etapa de atualização: "ADD" ou "UPDATE" (sobre as memórias existentes
+    # que o mem0 enviou ao LLM, na ordem dos ids temporários "0", "1", ...)
+    memory_event = "ADD"
+    _lock = threading.Lock()
+
+    def _count(self, name: str, texts: list[str] | None = None):
+        with StubOllama._lock:
+            StubOllama.calls[name] = StubOllama.calls.get(name, 0) + 1
+            StubOllama.embedded.extend(texts or [])
+
+    def _send(self, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.startswith("/api/tags"):
+            models = [os.environ["EMBEDDING_MODEL"], os.environ["LLM_MODEL"]]
+            self._send({"models": [{"name": name, "model": name} for name in models]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path == "/api/embed":
+            texts = body.get("input", "")
+            texts = [texts] if isinstance(texts, str) else list(texts)
+            self._count("embed", texts)
+            self._send({"model": body.get("model"), "embeddings": [embed_text(t) for t in texts]})
+        elif self.path == "/api/embeddings":
+            self._count("embeddings", [body.get("prompt", "")])
+            self._send({"embedding": embed_text(body.get("prompt", ""))})
+        elif self.path == "/api/chat":
+            self._count("chat")
+            StubOllama.chat_models.append(body.get("model"))
+            system = any(m.get("role") == "system" for m in body.get("messages", []))
+            content = {"facts": list(StubOllama.facts)} if system else {
+                "memory": [{"id": str(i), "text": fact, "event": StubOllama.memory_event} for i, fact in enumerate(StubOllama.facts)]
+            }
+            self._send({"model": body.get("model"), "message": {"role": "assistant", "content": json.dumps(content)}, "done": True})
+        elif self.path == "/api/generate":
+            self._count("generate")
+            self._send({"model": body.get("model"), "response": "", "done": True})
+        else:
+            self.send_error(404)
+
+    def log_message(self, *args):
+        pass
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.calls.clear()
+            cls.embedded.clear()
+            cls.chat_models.clear()
+
+
+def start_stub_environment() -> str:
+    """Sobe o stub e aponta o servidor para ele e para um diretório de dados temporário."""
+    stub = ThreadingHTTPServer(("127.0.0.1", 0), StubOllama)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    data_dir = tempfile.mkdtemp(prefix="mem0-lite-test-")
+    os.environ.update({
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{stub.server_address[1]}",
+        "EMBEDDING_PROVIDER": "ollama",
+        "EMBEDDING_MODEL": "stub-embed",
+        "EMBEDDING_DIMS": str(DIMS),
+        "LLM_PROVIDER": "ollama",
+        "LLM_MODEL": "stub-llm",
+        "CHROMA_PERSIST_DIR": os.path.join(data_dir, "chroma"),
+        "DATABASE_URL": f"sqlite:///{os.path.join(data_dir, 'mem0.db')}",
+        "HISTORY_DB_PATH": os.path.join(data_dir, "mem0.db"),
+        "STATE_DB_PATH": os.path.join(data_dir, "state.db"),
+        "EMBEDDING_CACHE_PATH": os.path.join(data_dir, "embedding_cache.db"),
+        "LLM_CACHE_PATH": os.path.join(data_dir, "llm_cache.db"),
+        "TRACE_SLOW_LOG_PATH": os.path.join(data_dir, "slow_calls.jsonl"),
+        "MEM0_WARMUP": "false",
+        "OLLAMA_KEEPALIVE_ENABLED": "false",
+        "MEM0_TELEMETRY": "False",
+        "DEFAULT_USER_ID": "tester",
+    })
+    return data_dir
@@ -1,21 +1,72 @@
+import time
+
+_startup_started = time.perf_counter()
+
+import asyncio
+import bisect
+import concurrent.futures
+import contextvars
+import functools
 import os
 import json
-import os
+import hashlib
+import importlib
+import inspect
+import queue
+import random
+import re
 import sqlite3
-from contextlib import asynccontextmanager
+import sys
+import threading
+import types
+import unicodedata
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack, asynccontextmanager, contextmanager
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from typing import TYPE_CHECKING, Optional, List, Dict, Any
 from uuid import uuid4
 
-from fastapi import FastAPI
+# Perfil de inicialização (--startup-profile): fases medidas em sequência desde o primeiro import
+_startup_phases: list[tuple[str, float]] = []
+_startup_mark = _startup_started
+
+
+def _mark_startup_phase(name: str, elapsed_ms: float | None = None):
+    """Registra uma fase; sem elapsed_ms mede o tempo desde a marca anterior."""
+    global _startup_mark
+    now = time.perf_counter()
+    if elapsed_ms is None:
+        elapsed_ms = (now - _startup_mark) * 1000
+        _startup_mark = now
+    _startup_phases.append((name, elapsed_ms))
+
+
+_mark_startup_phase("import: stdlib")
+
+import httpx
+import numpy as np
+
+_mark_startup_phase("import: numpy")
+
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from mcp.server.fastmcp import FastMCP
-import uvicorn
 
-# Mem0 (pacote correto)
-from mem0.memory.main import Memory
+_mark_startup_phase("import: mcp/pydantic/dotenv")
+
+try:
+    # orjson serializa as respostas HTTP ~5-10x mais rápido que o json da stdlib
+    import orjson
+except ImportError:
+    orjson = None
+
+# Mem0, FastAPI e uvicorn são importados sob demanda (_ensure_mem0 / create_http_app):
+# o modo stdio e os scripts auxiliares não pagam por eles no import
+if TYPE_CHECKING:
+    from mem0.memory.main import Memory
 
 load_dotenv()
 
@@ -78,20 +129,152 @@ LLM_PROVIDER = os.getenv("LLM_PROVIDER", "ollama")
 LLM_MODEL = os.getenv("LLM_MODEL", "llama3.1:8b")
 # Controla se o mem0.add usa inferência de LLM (padrão: True)
 MEM0_INFER = os.getenv("MEM0_INFER", "true").strip().lower() not in {"0", "false", "no"}
+# Constrói o mem0 em background ao iniciar o servidor (senão, na primeira chamada de tool)
+MEM0_WARMUP = os.getenv("MEM0_WARMUP", "true").strip().lower() not in {"0", "false", "no"}
 
 # Usuário padrão quando user_id não for informado (prioriza .env, depois USERNAME do SO)
 DEFAULT_USER_ID = os.getenv("DEFAULT_USER_ID") or os.getenv("USERNAME", "default")
 
+# --- Pipeline assíncrono de escrita ------------------------------------------
+# SQLite auxiliar do servidor (jobs em background e demais estados próprios)
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", str(BASE_DIR / "mem0_lite_state.db"))
+# Modo padrão do add_memory: "infer" (síncrono), "infer_async" (grava bruto e infere em background),
+# "raw" (só embedding, sem LLM) ou "auto" (raw para entradas curtas e estruturadas, infer nas demais)
+ADD_MEMORY_MODE = os.getenv("ADD_MEMORY_MODE", "infer").strip().lower()
+ADD_MODES = {"auto", "raw", "infer", "infer_async"}
+# Modo "auto": textos estruturados até este tamanho são gravados sem extração do LLM
+ADD_AUTO_RAW_MAX_CHARS = int(os.getenv("ADD_AUTO_RAW_MAX_CHARS", "280"))
+ASYNC_INFER_WORKERS = int(os.getenv("ASYNC_INFER_WORKERS", "1"))
+# Limite de jobs pendentes; acima disso add_memory responde "queue_full" (backpressure)
+ASYNC_INFER_QUEUE_MAX = int(os.getenv("ASYNC_INFER_QUEUE_MAX", "100"))
+# Segundos aguardando vaga na fila antes de recusar (0 = recusa imediata)
+ASYNC_INFER_QUEUE_TIMEOUT = float(os.getenv("ASYNC_INFER_QUEUE_TIMEOUT", "0"))
+ASYNC_INFER_MAX_ATTEMPTS = max(1, int(os.getenv("ASYNC_INFER_MAX_ATTEMPTS", "3")))
+# Backoff exponencial entre tentativas de um job que falhou (ex.: Ollama fora do ar)
+ASYNC_INFER_RETRY_BACKOFF_SECONDS = float(os.getenv("ASYNC_INFER_RETRY_BACKOFF_SECONDS", "5"))
+ASYNC_INFER_RETRY_MAX_BACKOFF_SECONDS = float(os.getenv("ASYNC_INFER_RETRY_MAX_BACKOFF_SECONDS", "300"))
+
+# --- Ingestão em lote ----------------------------------------------------------
+BULK_EMBED_BATCH_SIZE = int(os.getenv("BULK_EMBED_BATCH_SIZE", "64"))
+# Requisições paralelas ao embedder quando o provedor não oferece embed_batch nativo
+BULK_EMBED_CONCURRENCY = int(os.getenv("BULK_EMBED_CONCURRENCY", "4"))
+
+# --- Execução dos tools fora do event loop ------------------------------------
+# Chamadas síncronas ao mem0 rodam em pools de threads separados: escritas lentas (LLM)
+# não ocupam as vagas das leituras, e o event loop do uvicorn segue atendendo o SSE.
+TOOL_WRITE_WORKERS = max(1, int(os.getenv("TOOL_WRITE_WORKERS", "2")))
+TOOL_READ_WORKERS = max(1, int(os.getenv("TOOL_READ_WORKERS", "8")))
+
+# --- Ollama: warm-up e keep-alive ----------------------------------------------
+# Uma ou mais instâncias (separadas por vírgula): as chamadas do embedder e do LLM são
+# distribuídas em round-robin, com failover para a próxima instância em erro de conexão
+OLLAMA_BASE_URLS = [
+    url.strip().rstrip("/")
+    for url in os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434").split(",")
+    if url.strip()
+]
+OLLAMA_BASE_URL = OLLAMA_BASE_URLS[0]
+# Pool HTTP compartilhado (keep-alive) usado pelo embedder e pelo LLM
+OLLAMA_POOL_MAX_CONNECTIONS = int(os.getenv("OLLAMA_POOL_MAX_CONNECTIONS", "20"))
+OLLAMA_POOL_MAX_KEEPALIVE = int(os.getenv("OLLAMA_POOL_MAX_KEEPALIVE", "10"))
+OLLAMA_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_CONNECT_TIMEOUT_SECONDS", "5"))
+# Geração com LLM local pode levar minutos
+OLLAMA_READ_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_READ_TIMEOUT_SECONDS", "300"))
+# Novas tentativas só para falhas de conexão e 502/503/504 (backoff exponencial com jitter)
+OLLAMA_RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
+OLLAMA_RETRY_BACKOFF_SECONDS = float(os.getenv("OLLAMA_RETRY_BACKOFF_SECONDS", "0.2"))
+# Instância que falhou sai do rodízio por esse tempo
+OLLAMA_INSTANCE_DOWN_SECONDS = float(os.getenv("OLLAMA_INSTANCE_DOWN_SECONDS", "10"))
+# Pré-carrega EMBEDDING_MODEL/LLM_MODEL no start e renova o keep_alive enquanto houver tráfego
+OLLAMA_KEEPALIVE_ENABLED = os.getenv("OLLAMA_KEEPALIVE_ENABLED", "true").strip().lower() not in {"0", "false", "no"}
+# Duração pedida ao Ollama em cada ping (formato do Ollama: "30m", "1h", "-1" = sempre)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Intervalo entre pings; abaixo de 5 min porque cada requisição do mem0 redefine o keep_alive para o padrão (5m)
+OLLAMA_KEEPALIVE_INTERVAL_SECONDS = float(os.getenv("OLLAMA_KEEPALIVE_INTERVAL_SECONDS", "240"))
+# Sem chamadas de tool por esse tempo, os pings param e o Ollama pode descarregar os modelos
+OLLAMA_KEEPALIVE_IDLE_SECONDS = float(os.getenv("OLLAMA_KEEPALIVE_IDLE_SECONDS", "1800"))
+OLLAMA_KEEPALIVE_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_KEEPALIVE_TIMEOUT_SECONDS", "120"))
+
+# --- Micro-batching de embeddings -------------------------------------------------
+# Embeds que chegam dentro da janela viram um único lote; textos idênticos em voo
+# compartilham o mesmo resultado (single-flight). 0 desativa a janela.
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_BATCH_MAX = max(1, int(os.getenv("EMBED_BATCH_MAX", "32")))
+# Endpoint de embeddings do Ollama: "embed" (/api/embed, aceita lote, vetores normalizados),
+# "embeddings" (/api/embeddings legado, um texto por chamada) ou "auto" (embed em stores novos;
+# stores já populados pelo endpoint legado continuam nele para não misturar normalizações)
+OLLAMA_EMBED_API = os.getenv("OLLAMA_EMBED_API", "auto").strip().lower()
+
+# --- Cache de embeddings ----------------------------------------------------
+# Cache persistente texto -> vetor (evita reenviar a mesma query ao embedder)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").strip().lower() not in {"0", "false", "no"}
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", str(BASE_DIR / "embedding_cache.db"))
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "2048"))
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "200000"))
+
+# --- Cache de extração do LLM --------------------------------------------------
+# Respostas do LLM (extração de fatos e decisões de update) persistidas em SQLite, chaveadas por
+# provedor, modelo, versão do prompt e hash do texto normalizado: reenvios do mesmo texto
+# (retries, resumos de sessão repetidos) não voltam ao modelo.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").strip().lower() not in {"0", "false", "no"}
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", str(BASE_DIR / "llm_cache.db"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "50000"))
+# Incrementar quando a forma de montar as chaves/respostas mudar (invalida o cache inteiro)
+LLM_CACHE_PROMPT_VERSION = 1
+
+# --- Métricas ---------------------------------------------------------------------
+# Histogramas de latência por tool e por fase (embedding, vector store, LLM, serialização,
+# consulta a caches, espera no pool) expostos em GET /metrics no formato do Prometheus
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").strip().lower() not in {"0", "false", "no"}
+METRICS_BUCKETS_SECONDS = tuple(sorted(
+    float(b) for b in os.getenv(
+        "METRICS_BUCKETS_SECONDS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,120"
+    ).split(",") if b.strip()
+))
+
+# --- Tracing ----------------------------------------------------------------------
+# Opt-in: registra spans (fase, operação, início, duração, thread) de cada sub-operação do mem0
+# em toda chamada de tool; as chamadas acima de TRACE_SLOW_MS vão para um log JSONL rotacionado
+# (argumentos só como hash) consultado pelo tool get_slow_calls.
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").strip().lower() in {"1", "true", "yes"}
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "5000"))
+TRACE_SLOW_LOG_PATH = os.getenv("TRACE_SLOW_LOG_PATH", str(BASE_DIR / "slow_calls.jsonl"))
+TRACE_SLOW_LOG_MAX_BYTES = int(os.getenv("TRACE_SLOW_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+TRACE_SLOW_LOG_BACKUPS = int(os.getenv("TRACE_SLOW_LOG_BACKUPS", "3"))
+# Limite de spans guardados por chamada (ingestões em lote geram um span por embed)
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "500"))
+
+# --- Índices de memórias ------------------------------------------------------
+# Cada tag vira uma chave booleana no metadata (tag:<nome>), filtrável direto no Chroma;
+# a tabela memory_tags (STATE_DB_PATH) resolve prefixos hierárquicos (python.django.*)
+# e memory_index mantém (user_id, created_at, id) para paginar list_memories.
+TAG_KEY_PREFIX = "tag:"
+MEMORY_INDEX_VERSION = 1
+
 # --- Cache de consultas ------------------------------------------------------
-# Cache em memória para otimizar buscas frequentes
-search_cache = {}
-CACHE_TTL = timedelta(minutes=15)
+# Cache em memória (LRU + TTL) para otimizar buscas frequentes
+CACHE_TTL = timedelta(seconds=int(os.getenv("SEARCH_CACHE_TTL_SECONDS", "900")))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000"))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Intervalo mínimo entre varreduras de entradas expiradas
+SEARCH_CACHE_SWEEP_SECONDS = float(os.getenv("SEARCH_CACHE_SWEEP_SECONDS", "60"))
 
 # --- Schema de Regras de Programação -----------------------------------------
 VALID_SEVERITIES = ["MUST", "SHOULD", "MAY", "DEPRECATED"]
 VALID_CATEGORIES = ["security", "performance", "style", "architecture", "testing", "documentation", "general"]
 VALID_CONTEXTS = ["dev", "production", "testing", "staging", "all"]
+# Similaridade de cosseno a partir da qual uma regra é considerada duplicada
+RULE_DUPLICATE_THRESHOLD = float(os.getenv("RULE_DUPLICATE_THRESHOLD", "0.95"))
+# Jaccard estimado (MinHash de trigramas de palavras) a partir do qual uma regra é quase-duplicata (0 desliga).
+# Calibrado em 40 regras reais: a 0.7 pega 100% das variações de plural e pontuação e 97% dos typos
+# (as perdas são typos na própria negação), sem nenhum par de regras distintas acima do limite
+RULE_NEAR_DUPLICATE_THRESHOLD = float(os.getenv("RULE_NEAR_DUPLICATE_THRESHOLD", "0.7"))
 PLAN_STATUSES = {"active", "paused", "done"}
+# Ordem de prioridade para ordenação (prioridades desconhecidas vão para o fim)
+PLAN_PRIORITY_ORDER = ["urgent", "high", "normal", "low"]
+PLAN_SORT_FIELDS = {"created_at", "updated_at", "due_date", "priority"}
+PLAN_STORE_VERSION = 2
 ITEM_STATUSES = {"todo", "doing", "done"}
 
 # --- Helper Functions (precisam estar antes dos tools) -----------------------
@@ -131,6 +314,50 @@ def _flatten_metadata(meta: dict | None) -> dict | None:
     return flat
 
 
+def _merge_tags_into_metadata(tags: list[str] | str | None, metadata: dict | None) -> dict:
+    """Achata o metadata e grava as tags como CSV (formato aceito pelo Chroma)."""
+    normalized_tags: list[str] | None = None
+    if isinstance(tags, str):
+        normalized_tags = [tags]
+    elif isinstance(tags, list):
+        normalized_tags = tags
+
+    meta = _flatten_metadata(metadata) or {}
+    if normalized_tags:
+        meta["tags"] = ",".join(normalized_tags)
+    return meta
+
+
+def _split_tags(raw: Any) -> list[str]:
+    """Converte tags (CSV ou lista) em lista sem duplicatas."""
+    if not raw:
+        return []
+    items = raw.split(",") if isinstance(raw, str) else raw
+    return list(dict.fromkeys(str(t).strip() for t in items if str(t).strip()))
+
+
+def _with_tag_keys(meta: dict | None) -> dict:
+    """Adiciona ao metadata uma chave booleana por tag (tag:<nome>) para filtro indexado."""
+    meta = dict(meta or {})
+    for tag in _split_tags(meta.get("tags")):
+        meta[f"{TAG_KEY_PREFIX}{tag}"] = True
+    return meta
+
+
+def _strip_tag_keys(items: Any) -> Any:
+    """Remove as chaves internas tag:<nome> do metadata devolvido aos clientes."""
+    if isinstance(items, list):
+        return [_strip_tag_keys(item) for item in items]
+    if isinstance(items, dict) and isinstance(items.get("results"), list):
+        return {**items, "results": _strip_tag_keys(items["results"])}
+    if isinstance(items, dict) and isinstance(items.get("metadata"), dict):
+        metadata = items["metadata"]
+        if any(k.startswith(TAG_KEY_PREFIX) for k in metadata):
+            items = dict(items)
+            items["metadata"] = {k: v for k, v in metadata.items() if not k.startswith(TAG_KEY_PREFIX)}
+    return items
+
+
 def _expand_hierarchical_tags(tags: list[str]) -> list[str]:
     """
     Expande tags hierárquicas para incluir todos os níveis.
@@ -182,29 +409,196 @@ def _validate_rule_schema(metadata: dict) -> tuple[bool, str]:
     return True, ""
 
 
-def _get_from_cache(cache_key: str) -> dict | None:
-    """Recupera resultado do cache se ainda válido"""
-    if cache_key in search_cache:
-        entry = search_cache[cache_key]
-        if datetime.now() - entry['timestamp'] < CACHE_TTL:
-            return entry['results']
-        else:
-            # Remove entrada expirada
-            del search_cache[cache_key]
-    return None
+class SearchCache:
+    """
+    Cache de resultados de busca com limite de entradas/bytes, despejo LRU e TTL.
+    Cada entrada guarda o user_id (e o rule_type, quando a busca é restrita a um tipo)
+    para que uma escrita invalide apenas as buscas que ela pode ter afetado.
+    """
 
+    def __init__(self, max_entries: int, max_bytes: int, ttl: timedelta, sweep_interval: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl.total_seconds()
+        self.sweep_interval = sweep_interval
+        # key -> (results, expires_at, size, user_id, rule_type)
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._keys_by_user: dict[str | None, set[str]] = {}
+        self._bytes = 0
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+        # contadores de invalidação (global e por usuário): um resultado calculado antes de uma
+        # escrita concorrente não entra no cache depois dela
+        self._generation = 0
+        self._user_generations: dict[str | None, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> dict | None:
+        """Recupera resultado do cache se ainda válido (e marca como recente)."""
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_sweep(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] <= now:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def generation(self, user_id: str | None = None) -> tuple[int, int]:
+        """Marca a ser capturada antes da busca e repassada ao put."""
+        with self._lock:
+            return self._generation, self._user_generations.get(user_id, 0)
+
+    def put(
+        self,
+        key: str,
+        results: dict,
+        user_id: str | None = None,
+        rule_type: str | None = None,
+        generation: tuple[int, int] | None = None,
+    ):
+        """Armazena resultado no cache, despejando as entradas menos usadas se preciso."""
+        size = len(json.dumps(results, default=str))
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if generation is not None and generation != (self._generation, self._user_generations.get(user_id, 0)):
+                # houve escrita do usuário durante a busca: o resultado pode estar desatualizado
+                self.stale_puts += 1
+                return
+            self._maybe_sweep(now)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (results, now + self.ttl_seconds, size, user_id, rule_type)
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, user_id: str | None = None, rule_type: str | None = None) -> int:
+        """
+        Remove as buscas afetadas por uma escrita (chamar após adicionar/deletar memórias).
+        Sem user_id limpa tudo; com rule_type preserva buscas restritas a outros tipos.
+        """
+        with self._lock:
+            if user_id is None:
+                self._generation += 1
+                removed = len(self._entries)
+                self._entries.clear()
+                self._keys_by_user.clear()
+                self._bytes = 0
+            else:
+                self._user_generations[user_id] = self._user_generations.get(user_id, 0) + 1
+                keys = [
+                    key for key in self._keys_by_user.get(user_id, ())
+                    if rule_type is None or self._entries[key][4] in (None, rule_type)
+                ]
+                for key in keys:
+                    self._remove(key)
+                removed = len(keys)
+            self.invalidations += removed
+            return removed
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_puts": self.stale_puts,
+            }
 
-def _put_in_cache(cache_key: str, results: dict):
-    """Armazena resultado no cache"""
-    search_cache[cache_key] = {
-        'results': results,
-        'timestamp': datetime.now()
-    }
+    def _remove(self, key: str):
+        _, _, size, user_id, _ = self._entries.pop(key)
+        self._bytes -= size
+        user_keys = self._keys_by_user.get(user_id)
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._keys_by_user[user_id]
 
+    def _maybe_sweep(self, now: float):
+        """Remove entradas expiradas no máximo uma vez por sweep_interval."""
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        expired = [key for key, entry in self._entries.items() if entry[1] <= now]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+
+
+search_cache = SearchCache(
+    max_entries=SEARCH_CACHE_MAX_ENTRIES,
+    max_bytes=SEARCH_CACHE_MAX_BYTES,
+    ttl=CACHE_TTL,
+    sweep_interval=SEARCH_CACHE_SWEEP_SECONDS,
+)
+
+
+_JSON_SCALARS = frozenset({str, int, float, bool, type(None)})
+
+
+def _jsonable(value: Any) -> Any:
+    """
+    Normaliza a resposta dos tools para tipos nativos de JSON sem o round-trip
+    json.loads(json.dumps(..., default=str)): só valores não nativos (datetime, UUID, numpy...) viram str.
+    """
+    with _phase("serialization"):
+        return _jsonable_value(value)
 
-def _clear_cache():
-    """Limpa todo o cache (chamar após adicionar/deletar memórias)"""
-    search_cache.clear()
+
+def _jsonable_value(value: Any) -> Any:
+    kind = type(value)
+    if kind in _JSON_SCALARS:
+        return value
+    if kind is dict or isinstance(value, dict):
+        return {
+            (k if type(k) is str else json.dumps(k) if k is None or type(k) is bool else str(k)):
+                (v if type(v) in _JSON_SCALARS else _jsonable_value(v))
+            for k, v in value.items()
+        }
+    if kind is list or isinstance(value, (list, tuple)):
+        return [v if type(v) in _JSON_SCALARS else _jsonable_value(v) for v in value]
+    # subclasses (enums str/int, np.float64...) viram o escalar base, como o json.dumps emitiria;
+    # str.__str__ porque str() de um enum (str, Enum) devolve "Classe.MEMBRO"
+    if isinstance(value, str):
+        return str.__str__(value)
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    return str(value)
 
 
 def _make_cache_key(query: str, filters: dict, limit: int) -> str:
@@ -229,6 +623,15 @@ def _extract_id_from_mem0(clean: dict) -> str | None:
     return None
 
 
+def _added_memory_id(clean: dict) -> str | None:
+    """ID da primeira memória criada (evento ADD) num resultado do mem0.add; UPDATE/DELETE não contam."""
+    results = clean.get("results") if isinstance(clean, dict) else None
+    for item in results if isinstance(results, list) else []:
+        if isinstance(item, dict) and item.get("event") == "ADD" and item.get("id"):
+            return item["id"]
+    return None
+
+
 def _parse_checklist(raw: Any) -> list[dict]:
     """Converte metadata.checklist (string JSON ou lista) em lista de itens."""
     if not raw:
@@ -251,79 +654,2181 @@ def _coerce_int(value: Any, default: int = 0) -> int:
         return default
 
 
-def _plan_memories_for_user(user_id: str) -> list[dict]:
-    """Retorna apenas memórias do tipo plano para o user_id informado."""
-    all_memories = mem0.get_all(user_id=user_id)
-    memories_list = all_memories.get("results", all_memories) if isinstance(all_memories, dict) else all_memories
-    return [m for m in (memories_list or []) if (m.get("metadata") or {}).get("rule_type") == "plan"]
+# --- Plan store (SQLite) -------------------------------------------------------
+# Planos e itens vivem nas tabelas plans/plan_items (STATE_DB_PATH); o vector store guarda
+# apenas o título (para busca semântica) e é re-embedado só quando o título muda.
+
+_plan_store_is_ready = False
+_plan_store_lock = threading.Lock()
+
+
+def _ensure_plan_store():
+    """Importa uma única vez os planos antigos (checklist no metadata do Chroma) para o SQLite."""
+    global _plan_store_is_ready
+    if _plan_store_is_ready:
+        return
+    with _plan_store_lock:
+        conn = _state_db()
+        row = conn.execute("SELECT value FROM state_meta WHERE key='plan_store_version'").fetchone()
+        if row and _coerce_int(row["value"]) >= PLAN_STORE_VERSION:
+            _plan_store_is_ready = True
+            return
+        collection = mem0.vector_store.collection
+        offset = 0
+        while True:
+            page = collection.get(where={"rule_type": {"$eq": "plan"}}, include=["metadatas"], limit=500, offset=offset)
+            ids = page.get("ids") or []
+            if not ids:
+                break
+            with conn:
+                for memory_id, meta in zip(ids, page.get("metadatas") or []):
+                    meta = meta or {}
+                    if not meta.get("plan_id"):
+                        continue
+                    _insert_plan(conn, {
+                        "plan_id": meta["plan_id"],
+                        "user_id": meta.get("user_id") or DEFAULT_USER_ID,
+                        "memory_id": memory_id,
+                        "title": meta.get("title") or meta.get("data") or meta["plan_id"],
+                        "status": meta.get("status", "active"),
+                        "priority": meta.get("priority", "normal"),
+                        "due_date": meta.get("due_date"),
+                        "tags": meta.get("tags"),
+                        "created_at": meta.get("created_at") or datetime.now().isoformat(),
+                        "updated_at": meta.get("updated_at") or meta.get("created_at") or datetime.now().isoformat(),
+                    }, _parse_checklist(meta.get("checklist")))
+            offset += len(ids)
+        with conn:
+            # Índice de tags dos planos (plan_tags) para os planos gravados antes dele
+            for plan in conn.execute("SELECT plan_id, user_id, tags FROM plans").fetchall():
+                _set_plan_tags(conn, plan["plan_id"], plan["user_id"], plan["tags"])
+            conn.execute(
+                "INSERT OR REPLACE INTO state_meta (key, value) VALUES ('plan_store_version', ?)",
+                (str(PLAN_STORE_VERSION),),
+            )
+        _plan_store_is_ready = True
+
+
+def _set_plan_tags(conn: sqlite3.Connection, plan_id: str, user_id: str, tags: str | None):
+    conn.execute("DELETE FROM plan_tags WHERE plan_id=?", (plan_id,))
+    conn.executemany(
+        "INSERT OR IGNORE INTO plan_tags (plan_id, user_id, tag) VALUES (?, ?, ?)",
+        [(plan_id, user_id, tag) for tag in _split_tags(tags)],
+    )
 
 
-def _find_plan_by_id(plan_id: str, user_id: str) -> dict | None:
-    """Localiza o plano pelo plan_id no conjunto do usuário."""
-    for plan in _plan_memories_for_user(user_id):
-        meta = plan.get("metadata") or {}
-        if meta.get("plan_id") == plan_id:
-            return plan
-    return None
+def _insert_plan(conn: sqlite3.Connection, plan: dict, checklist: list[dict]):
+    """Grava plano + itens (INSERT OR IGNORE: nunca sobrescreve um plano existente)."""
+    cur = conn.execute(
+        "INSERT OR IGNORE INTO plans (plan_id, user_id, memory_id, title, status, priority, due_date, tags, "
+        "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (plan["plan_id"], plan["user_id"], plan.get("memory_id"), plan["title"], plan["status"], plan["priority"],
+         plan.get("due_date"), plan.get("tags"), plan["created_at"], plan["updated_at"]),
+    )
+    if not cur.rowcount:
+        return
+    _set_plan_tags(conn, plan["plan_id"], plan["user_id"], plan.get("tags"))
+    conn.executemany(
+        "INSERT OR IGNORE INTO plan_items (item_id, plan_id, position, title, status, note, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (item.get("id") or str(uuid4()), plan["plan_id"], position, item.get("title") or "",
+             item.get("status") or "todo", item.get("note"), item.get("created_at") or plan["created_at"],
+             item.get("updated_at") or plan["updated_at"])
+            for position, item in enumerate(checklist)
+        ],
+    )
+    _refresh_plan_counts(conn, plan["plan_id"])
 
 
-def _normalize_plan_memory(memory_item: dict) -> dict:
-    """Normaliza estrutura de plano para retorno dos tools."""
-    metadata = (memory_item or {}).get("metadata") or {}
-    checklist = _parse_checklist(metadata.get("checklist"))
-    open_items = metadata.get("open_items")
-    open_items = _coerce_int(open_items, sum(1 for item in checklist if item.get("status") != "done"))
-    total_items = metadata.get("total_items")
-    total_items = _coerce_int(total_items, len(checklist))
+def _refresh_plan_counts(conn: sqlite3.Connection, plan_id: str):
+    conn.execute(
+        "UPDATE plans SET "
+        "open_items = (SELECT COUNT(*) FROM plan_items WHERE plan_id=? AND status != 'done'), "
+        "total_items = (SELECT COUNT(*) FROM plan_items WHERE plan_id=?) "
+        "WHERE plan_id=?",
+        (plan_id, plan_id, plan_id),
+    )
+
+
+def _find_plan_row(plan_id: str, user_id: str) -> sqlite3.Row | None:
+    """Localiza o plano pelo plan_id (chave primária) no conjunto do usuário."""
+    _ensure_plan_store()
+    return _state_db().execute("SELECT * FROM plans WHERE plan_id=? AND user_id=?", (plan_id, user_id)).fetchone()
+
 
+def _plan_items(plan_ids: list[str]) -> dict[str, list[dict]]:
+    """Checklists dos planos informados, na ordem de inserção dos itens."""
+    items: dict[str, list[dict]] = {plan_id: [] for plan_id in plan_ids}
+    if not plan_ids:
+        return items
+    placeholders = ",".join("?" for _ in plan_ids)
+    rows = _state_db().execute(
+        f"SELECT * FROM plan_items WHERE plan_id IN ({placeholders}) ORDER BY plan_id, position",
+        plan_ids,
+    )
+    for r in rows:
+        items[r["plan_id"]].append({
+            "id": r["item_id"],
+            "title": r["title"],
+            "status": r["status"],
+            "note": r["note"],
+            "created_at": r["created_at"],
+            "updated_at": r["updated_at"],
+        })
+    return items
+
+
+def _normalize_plan_row(row: sqlite3.Row, checklist: list[dict]) -> dict:
+    """Normaliza estrutura de plano para retorno dos tools."""
+    metadata = {
+        "rule_type": "plan",
+        "plan_id": row["plan_id"],
+        "title": row["title"],
+        "status": row["status"],
+        "priority": row["priority"],
+        "due_date": row["due_date"],
+        "open_items": row["open_items"],
+        "total_items": row["total_items"],
+        "tags": row["tags"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
     return {
-        "id": memory_item.get("id"),
-        "plan_id": metadata.get("plan_id"),
-        "title": memory_item.get("memory") or metadata.get("title"),
-        "status": metadata.get("status", "active"),
-        "priority": metadata.get("priority", "normal"),
-        "due_date": metadata.get("due_date"),
-        "open_items": open_items,
-        "total_items": total_items,
+        "id": row["memory_id"],
+        "plan_id": row["plan_id"],
+        "title": row["title"],
+        "status": row["status"],
+        "priority": row["priority"],
+        "due_date": row["due_date"],
+        "open_items": row["open_items"],
+        "total_items": row["total_items"],
         "checklist": checklist,
-        "tags": metadata.get("tags"),
-        "metadata": metadata,
+        "tags": row["tags"],
+        "metadata": {k: v for k, v in metadata.items() if v is not None},
+    }
+
+
+def _load_plan(plan_id: str) -> dict:
+    row = _state_db().execute("SELECT * FROM plans WHERE plan_id=?", (plan_id,)).fetchone()
+    return _normalize_plan_row(row, _plan_items([plan_id])[plan_id])
+
+
+def _plan_vector_metadata(plan: dict) -> dict:
+    """Metadata do registro vetorial do plano (sem checklist; valores None não são aceitos pelo Chroma)."""
+    metadata = {
+        "rule_type": "plan",
+        "plan_id": plan["plan_id"],
+        "title": plan["title"],
+        "status": plan["status"],
+        "priority": plan["priority"],
+        "due_date": plan.get("due_date"),
+        "tags": plan.get("tags"),
+    }
+    return {k: v for k, v in metadata.items() if v is not None}
+
+
+def _update_plan_vector(row: sqlite3.Row, plan: dict) -> str | None:
+    """
+    Atualiza o registro vetorial do plano: re-embeda apenas se o título mudou; caso contrário
+    só o metadata é regravado. Retorna um aviso se o registro não pôde ser atualizado.
+    """
+    memory_id = row["memory_id"]
+    if not memory_id:
+        return None
+    metadata = _plan_vector_metadata(plan)
+    try:
+        existing = mem0.vector_store.get(vector_id=memory_id).payload or {}
+        # O Chroma mescla o metadata no update: chaves obsoletas (checklist legado, tags antigas) vão como None
+        payload = {
+            k: None for k in existing
+            if k in ("checklist", "open_items", "total_items", "due_date", "tags") or k.startswith(TAG_KEY_PREFIX)
+        }
+        payload.update(_with_tag_keys(metadata))
+        vector = None
+        if plan["title"] != row["title"]:
+            vector = mem0.embedding_model.embed(plan["title"], "update")
+            payload["data"] = plan["title"]
+            payload["hash"] = hashlib.md5(plan["title"].encode()).hexdigest()
+        payload["updated_at"] = datetime.now().astimezone().isoformat()
+        mem0.vector_store.update(vector_id=memory_id, vector=vector, payload=payload)
+        if vector is not None:
+            _add_history_batch([{
+                "memory_id": memory_id,
+                "old_memory": row["title"],
+                "new_memory": plan["title"],
+                "event": "UPDATE",
+                "created_at": existing.get("created_at"),
+                "updated_at": payload["updated_at"],
+                "role": existing.get("role"),
+            }])
+        _index_memories([(memory_id, row["user_id"], metadata, None, _memory_size(plan["title"], metadata))])
+    except Exception as e:
+        return f"Plano atualizado, mas falhou ao atualizar o registro vetorial: {e}"
+    return None
+
+
+def _build_memory_payload(text: str, user_id: str, metadata: dict | None) -> dict:
+    """Monta o payload no mesmo formato que o mem0 grava em Memory._create_memory."""
+    payload = _with_tag_keys(metadata)
+    payload["user_id"] = user_id
+    payload["role"] = "user"
+    payload["data"] = text
+    payload["hash"] = hashlib.md5(text.encode()).hexdigest()
+    payload["created_at"] = datetime.now().astimezone().isoformat()
+    return payload
+
+
+def _embed_texts(embedder, texts: list[str], memory_action: str = "add") -> list[list[float]]:
+    """Gera embeddings para um lote de textos."""
+    batch_fn = getattr(embedder, "embed_batch", None)
+    if callable(batch_fn):
+        return batch_fn(texts, memory_action)
+    # Sem embed_batch nativo (ex.: Ollama no endpoint legado /api/embeddings): paraleliza as
+    # chamadas unitárias
+    if len(texts) <= 1 or BULK_EMBED_CONCURRENCY <= 1:
+        return [embedder.embed(t, memory_action) for t in texts]
+    with ThreadPoolExecutor(max_workers=min(BULK_EMBED_CONCURRENCY, len(texts))) as pool:
+        return list(pool.map(lambda t: embedder.embed(t, memory_action), texts))
+
+
+def _insert_memory_batch(texts: list[str], vectors: list[list[float]], payloads: list[dict]) -> list[str]:
+    """Grava um lote já embedado com um único insert no vector store + histórico."""
+    ids = [str(uuid4()) for _ in texts]
+    mem0.vector_store.insert(vectors=vectors, payloads=payloads, ids=ids)
+    _add_history_batch([
+        {
+            "memory_id": memory_id,
+            "old_memory": None,
+            "new_memory": text,
+            "event": "ADD",
+            "created_at": payload.get("created_at"),
+            "actor_id": payload.get("actor_id"),
+            "role": payload.get("role"),
+        }
+        for memory_id, text, payload in zip(ids, texts, payloads)
+    ])
+    _index_memories([
+        (memory_id, payload.get("user_id"), payload, _created_us(payload.get("created_at")), _memory_size(text, payload))
+        for memory_id, text, payload in zip(ids, texts, payloads)
+    ])
+    return ids
+
+
+def _add_history_batch(records: list[dict]):
+    """Grava o histórico do mem0 em uma única transação (add_history faz um COMMIT por linha)."""
+    db = mem0.db
+    if callable(getattr(db, "batch_add_history", None)):
+        db.batch_add_history(records)
+        return
+    if len(records) > 1 and hasattr(db, "connection") and hasattr(db, "_lock"):
+        # Versões do mem0 sem batch_add_history: mesmo INSERT do SQLiteManager, numa transação só
+        with _phase("history", "batch_add_history"), db._lock:
+            with db.connection:
+                db.connection.executemany(
+                    "INSERT INTO history (id, memory_id, old_memory, new_memory, event, "
+                    "created_at, updated_at, is_deleted, actor_id, role) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (str(uuid4()), r["memory_id"], r.get("old_memory"), r.get("new_memory"), r["event"],
+                         r.get("created_at"), r.get("updated_at"), r.get("is_deleted", 0), r.get("actor_id"), r.get("role"))
+                        for r in records
+                    ],
+                )
+        return
+    for r in records:
+        db.add_history(
+            r["memory_id"],
+            r.get("old_memory"),
+            r.get("new_memory"),
+            r["event"],
+            created_at=r.get("created_at"),
+            actor_id=r.get("actor_id"),
+            role=r.get("role"),
+        )
+
+
+def _add_raw_memory(text: str, user_id: str, metadata: dict | None, vector: list[float] | None = None) -> dict:
+    """Grava a memória sem inferência de LLM, gerando o embedding uma única vez (ou reusando `vector`)."""
+    # mem0.add(infer=False) embeda o texto duas vezes; aqui o vetor vai direto ao vector store
+    if vector is None:
+        vector = mem0.embedding_model.embed(text, "add")
+    memory_id = _insert_memory_batch([text], [vector], [_build_memory_payload(text, user_id, metadata)])[0]
+    return {"results": [{"id": memory_id, "memory": text, "event": "ADD"}]}
+
+
+# Linhas que já chegam estruturadas: itens de lista, "[TAG] ..." ou "chave: valor"
+_STRUCTURED_LINE = re.compile(r"^\s*(?:[-*•]\s|\d+[.)]\s|\[[^\]\n]+\]|[\w .#/-]{1,40}:\s)")
+_SENTENCE_END = re.compile(r"[.!?](?:\s|$)")
+
+
+def _looks_structured(text: str) -> bool:
+    """True para uma única frase/linha ou quando todas as linhas são itens de lista/chave-valor."""
+    lines = [line for line in text.strip().splitlines() if line.strip()]
+    if len(lines) <= 1:
+        return len(_SENTENCE_END.findall(text.strip())) <= 1
+    return all(_STRUCTURED_LINE.match(line) for line in lines)
+
+
+def _resolve_add_mode(mode: str, text: str, structured: bool = False) -> str:
+    """
+    Resolve o modo efetivo de gravação ("raw", "infer" ou "infer_async") de um modo já validado.
+    "auto" pula a extração do LLM para entradas curtas e já estruturadas (regras, títulos de
+    plano, notas de uma frase); com MEM0_INFER=false tudo é gravado bruto.
+    """
+    if not MEM0_INFER:
+        return "raw"
+    if mode != "auto":
+        return mode
+    if len(text) <= ADD_AUTO_RAW_MAX_CHARS and (structured or _looks_structured(text)):
+        return "raw"
+    return "infer"
+
+
+def _add_memory_record(text: str, user_id: str, metadata: dict | None, infer: bool) -> dict:
+    """mem0.add com as chaves de tag indexadas e o índice memory_tags atualizado."""
+    result = mem0.add(text, user_id=user_id, metadata=_with_tag_keys(metadata), infer=infer)
+    clean = _jsonable(result)
+    _index_add_results(clean, user_id, metadata)
+    return clean
+
+
+class InferFallbackStats:
+    """Contadores do fallback do infer: gravações em que o LLM não extraiu nada e o custo disso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.infer_writes = 0
+        self.fallbacks = 0
+        self.reused_vectors = 0
+        self.wasted_infer_ms = 0.0
+        self.fallback_ms = 0.0
+
+    def record(self, fell_back: bool, infer_ms: float = 0.0, fallback_ms: float = 0.0, reused: bool = False):
+        with self._lock:
+            self.infer_writes += 1
+            if fell_back:
+                self.fallbacks += 1
+                self.wasted_infer_ms += infer_ms
+                self.fallback_ms += fallback_ms
+                self.reused_vectors += int(reused)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "infer_writes": self.infer_writes,
+                "fallbacks": self.fallbacks,
+                "fallback_ratio": round(self.fallbacks / self.infer_writes, 4) if self.infer_writes else None,
+                "reused_vectors": self.reused_vectors,
+                "wasted_infer_ms_total": round(self.wasted_infer_ms, 2),
+                "fallback_ms_total": round(self.fallback_ms, 2),
+                "avg_fallback_ms": round(self.fallback_ms / self.fallbacks, 2) if self.fallbacks else 0.0,
+            }
+
+
+infer_fallback_stats = InferFallbackStats()
+
+
+_raw_embed_executor: ThreadPoolExecutor | None = None
+_raw_embed_executor_lock = threading.Lock()
+
+
+def _embed_raw_in_background(text: str) -> Future:
+    """
+    Embeda o texto bruto em paralelo à extração do LLM, para o fallback não pagar um embed
+    depois da chamada ao LLM. Quando o LLM devolve o próprio texto como fato, o embed do mem0
+    acerta o cache de embeddings e o vetor também não é calculado duas vezes.
+    """
+    global _raw_embed_executor
+    with _raw_embed_executor_lock:
+        if _raw_embed_executor is None:
+            _raw_embed_executor = _ContextThreadPoolExecutor(
+                max_workers=max(1, BULK_EMBED_CONCURRENCY), thread_name_prefix="mem0-raw-embed"
+            )
+    return _raw_embed_executor.submit(mem0.embedding_model.embed, text, "add")
+
+
+def _add_inferred_memory(text: str, user_id: str, metadata: dict | None, vector: list[float] | None = None) -> dict:
+    """
+    Grava com extração do LLM. Se o LLM não extrair nada, grava o texto bruto pelo caminho
+    embed-once, reaproveitando o vetor que o chamador já tem ou o embed do texto bruto feito
+    em paralelo à extração.
+    """
+    started = time.perf_counter()
+    pending_vector = _embed_raw_in_background(text) if vector is None else None
+    clean = _add_memory_record(text, user_id, metadata, infer=True)
+    if not (isinstance(clean.get("results"), list) and not clean["results"]):
+        infer_fallback_stats.record(False)
+        return clean
+
+    # mem0.add(infer=False) embedaria o texto duas vezes; o vetor vai direto ao vector store
+    fallback_started = time.perf_counter()
+    if pending_vector is not None:
+        try:
+            vector = pending_vector.result()
+        except Exception:
+            vector = None  # _add_raw_memory tenta de novo
+    reused = vector is not None
+    clean = _add_raw_memory(text, user_id, metadata, vector=vector)
+    infer_fallback_stats.record(
+        True,
+        infer_ms=(fallback_started - started) * 1000,
+        fallback_ms=(time.perf_counter() - fallback_started) * 1000,
+        reused=reused,
+    )
+    return clean
+
+
+# --- Estado auxiliar (SQLite) ------------------------------------------------
+
+_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memory_jobs (
+    job_id TEXT PRIMARY KEY,
+    memory_id TEXT,
+    user_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    metadata TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT,
+    result TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_memory_jobs_status ON memory_jobs(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_memory_jobs_user ON memory_jobs(user_id, created_at);
+
+CREATE TABLE IF NOT EXISTS state_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE IF NOT EXISTS memory_index (
+    memory_id TEXT PRIMARY KEY,
+    user_id TEXT,
+    created_us INTEGER NOT NULL,
+    kind TEXT NOT NULL DEFAULT 'memory',
+    size_bytes INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_memory_index_user_created ON memory_index(user_id, created_us, memory_id);
+
+-- Estatísticas por usuário mantidas pelos triggers de memory_index (mesma transação da escrita)
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id TEXT PRIMARY KEY,
+    memory_count INTEGER NOT NULL DEFAULT 0,
+    plan_count INTEGER NOT NULL DEFAULT 0,
+    rule_count INTEGER NOT NULL DEFAULT 0,
+    storage_bytes INTEGER NOT NULL DEFAULT 0,
+    last_write_at TEXT
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_memory_index_insert AFTER INSERT ON memory_index BEGIN
+    INSERT INTO user_stats (user_id) VALUES (COALESCE(NEW.user_id, 'unknown')) ON CONFLICT(user_id) DO NOTHING;
+    UPDATE user_stats SET
+        memory_count = memory_count + 1,
+        plan_count = plan_count + (NEW.kind = 'plan'),
+        rule_count = rule_count + (NEW.kind = 'programming_rule'),
+        storage_bytes = storage_bytes + NEW.size_bytes,
+        last_write_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+    WHERE user_id = COALESCE(NEW.user_id, 'unknown');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_memory_index_delete AFTER DELETE ON memory_index BEGIN
+    UPDATE user_stats SET
+        memory_count = memory_count - 1,
+        plan_count = plan_count - (OLD.kind = 'plan'),
+        rule_count = rule_count - (OLD.kind = 'programming_rule'),
+        storage_bytes = storage_bytes - OLD.size_bytes,
+        last_write_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+    WHERE user_id = COALESCE(OLD.user_id, 'unknown');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_memory_index_update AFTER UPDATE ON memory_index BEGIN
+    UPDATE user_stats SET
+        memory_count = memory_count - 1,
+        plan_count = plan_count - (OLD.kind = 'plan'),
+        rule_count = rule_count - (OLD.kind = 'programming_rule'),
+        storage_bytes = storage_bytes - OLD.size_bytes
+    WHERE user_id = COALESCE(OLD.user_id, 'unknown');
+    INSERT INTO user_stats (user_id) VALUES (COALESCE(NEW.user_id, 'unknown')) ON CONFLICT(user_id) DO NOTHING;
+    UPDATE user_stats SET
+        memory_count = memory_count + 1,
+        plan_count = plan_count + (NEW.kind = 'plan'),
+        rule_count = rule_count + (NEW.kind = 'programming_rule'),
+        storage_bytes = storage_bytes + NEW.size_bytes,
+        last_write_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+    WHERE user_id = COALESCE(NEW.user_id, 'unknown');
+END;
+
+CREATE TABLE IF NOT EXISTS plans (
+    plan_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    memory_id TEXT,
+    title TEXT NOT NULL,
+    status TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    due_date TEXT,
+    tags TEXT,
+    open_items INTEGER NOT NULL DEFAULT 0,
+    total_items INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_plans_user_status ON plans(user_id, status, created_at);
+CREATE INDEX IF NOT EXISTS idx_plans_user_due ON plans(user_id, due_date);
+CREATE INDEX IF NOT EXISTS idx_plans_user_priority ON plans(user_id, priority);
+
+CREATE TABLE IF NOT EXISTS plan_tags (
+    plan_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (plan_id, tag)
+);
+CREATE INDEX IF NOT EXISTS idx_plan_tags_user_tag ON plan_tags(user_id, tag);
+
+CREATE TABLE IF NOT EXISTS plan_items (
+    item_id TEXT PRIMARY KEY,
+    plan_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    status TEXT NOT NULL,
+    note TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_plan_items_plan ON plan_items(plan_id, position);
+CREATE INDEX IF NOT EXISTS idx_plan_items_status ON plan_items(plan_id, status);
+
+-- Assinaturas do pré-filtro de duplicatas de regras (hash normalizado + MinHash, indexado por bandas LSH)
+CREATE TABLE IF NOT EXISTS rule_signatures (
+    memory_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    language TEXT,
+    category TEXT,
+    text_hash TEXT NOT NULL,
+    minhash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rule_signatures_hash ON rule_signatures(user_id, language, category, text_hash);
+
+CREATE TABLE IF NOT EXISTS rule_signature_bands (
+    memory_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    band INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (memory_id, band)
+);
+CREATE INDEX IF NOT EXISTS idx_rule_signature_bands_value ON rule_signature_bands(user_id, band, value);
+
+CREATE TABLE IF NOT EXISTS memory_tags (
+    memory_id TEXT NOT NULL,
+    user_id TEXT,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (memory_id, tag)
+);
+CREATE INDEX IF NOT EXISTS idx_memory_tags_user_tag ON memory_tags(user_id, tag);
+"""
+
+_state_local = threading.local()
+
+
+def _state_db() -> sqlite3.Connection:
+    """Conexão SQLite (uma por thread) com o estado auxiliar do servidor."""
+    conn = getattr(_state_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(STATE_DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        columns = {r["name"] for r in conn.execute("PRAGMA table_info(memory_index)")}
+        if columns and "kind" not in columns:
+            # memory_index anterior às estatísticas por usuário: recria (o índice é reconstruído na migração)
+            conn.executescript("DROP TABLE memory_index; DELETE FROM state_meta WHERE key='memory_index_version';")
+        rule_columns = {r["name"] for r in conn.execute("PRAGMA table_info(rule_signatures)")}
+        if rule_columns and "minhash" not in rule_columns:
+            # Assinaturas SimHash antigas: recria (a migração recalcula a partir do texto das regras)
+            conn.executescript("DROP TABLE rule_signatures; DELETE FROM state_meta WHERE key='memory_index_version';")
+        job_columns = {r["name"] for r in conn.execute("PRAGMA table_info(memory_jobs)")}
+        if job_columns and "next_attempt_at" not in job_columns:
+            conn.execute("ALTER TABLE memory_jobs ADD COLUMN next_attempt_at TEXT")
+        conn.executescript(_STATE_SCHEMA)
+        _state_local.conn = conn
+    return conn
+
+
+# --- Índices de memórias (listagem + tags) ---------------------------------------
+
+_memory_index_is_ready = False
+
+
+def _created_us(value: Any) -> int:
+    """Converte o created_at (ISO) do payload em microssegundos UTC para ordenar a listagem."""
+    try:
+        return int(datetime.fromisoformat(str(value)).timestamp() * 1_000_000)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _memory_kind(meta: dict | None) -> str:
+    rule_type = (meta or {}).get("rule_type")
+    return rule_type if rule_type in ("plan", "programming_rule") else "memory"
+
+
+def _memory_size(text: str | None, meta: dict | None) -> int:
+    """
+    Tamanho aproximado de uma memória armazenada: texto + metadata do usuário + vetor float32.
+    Aceita o payload completo do vector store (texto em "data"): as chaves do mem0 e as tag:<nome>
+    ficam de fora, então escrita, re-embed e rebuild_memory_index chegam ao mesmo valor.
+    """
+    meta = meta or {}
+    if text is None:
+        text = meta.get("data")
+    extra = {k: v for k, v in meta.items() if k not in _MEMORY_CORE_KEYS and not k.startswith(TAG_KEY_PREFIX)}
+    return len((text or "").encode()) + len(json.dumps(extra, default=str)) + 4 * EMBEDDING_DIMS
+
+
+def _index_memories(entries: list[tuple[str, str | None, dict | None, int | None, int]]):
+    """
+    Grava (memory_id, user_id, metadata, created_us, size_bytes) no índice de listagem e no índice
+    invertido de tags; os triggers de memory_index mantêm user_stats na mesma transação.
+    Reindexar um id existente substitui as tags e preserva a posição na listagem.
+    """
+    if not entries:
+        return
+    now_us = int(time.time() * 1_000_000)
+    conn = _state_db()
+    with conn:
+        conn.executemany(
+            "INSERT INTO memory_index (memory_id, user_id, created_us, kind, size_bytes) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(memory_id) DO UPDATE SET user_id=excluded.user_id, kind=excluded.kind, size_bytes=excluded.size_bytes",
+            [
+                (mid, uid, created if created is not None else now_us, _memory_kind(meta), size)
+                for mid, uid, meta, created, size in entries
+            ],
+        )
+        conn.executemany("DELETE FROM memory_tags WHERE memory_id=?", [(entry[0],) for entry in entries])
+        conn.executemany(
+            "INSERT OR IGNORE INTO memory_tags (memory_id, user_id, tag) VALUES (?, ?, ?)",
+            [(mid, uid, tag) for mid, uid, meta, _, _ in entries for tag in _split_tags((meta or {}).get("tags"))],
+        )
+        rules = [
+            (mid, uid, meta) for mid, uid, meta, _, _ in entries
+            if meta and meta.get("rule_type") == "programming_rule" and meta.get("text_hash") and meta.get("minhash")
+        ]
+        conn.executemany(
+            "INSERT OR REPLACE INTO rule_signatures (memory_id, user_id, language, category, text_hash, minhash) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(mid, uid, meta.get("language"), meta.get("category"), meta["text_hash"], meta["minhash"]) for mid, uid, meta in rules],
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO rule_signature_bands (memory_id, user_id, band, value) VALUES (?, ?, ?, ?)",
+            [
+                (mid, uid, band, value)
+                for mid, uid, meta in rules
+                for band, value in enumerate(_minhash_bands(meta["minhash"]))
+            ],
+        )
+
+
+def _unindex_memories(memory_ids: list[str]):
+    ids = [(mid,) for mid in memory_ids if mid]
+    if not ids:
+        return
+    conn = _state_db()
+    with conn:
+        conn.executemany("DELETE FROM memory_index WHERE memory_id=?", ids)
+        conn.executemany("DELETE FROM memory_tags WHERE memory_id=?", ids)
+        conn.executemany("DELETE FROM rule_signatures WHERE memory_id=?", ids)
+        conn.executemany("DELETE FROM rule_signature_bands WHERE memory_id=?", ids)
+
+
+def _index_add_results(clean: dict, user_id: str, meta: dict | None):
+    """Atualiza os índices a partir dos eventos ADD/UPDATE/DELETE devolvidos pelo mem0.add."""
+    results = clean.get("results") if isinstance(clean, dict) else None
+    if not isinstance(results, list):
+        return
+    _unindex_memories([r.get("id") for r in results if isinstance(r, dict) and r.get("event") == "DELETE"])
+    _index_memories([
+        (r["id"], user_id, meta, None, _memory_size(r.get("memory"), meta))
+        for r in results
+        if isinstance(r, dict) and r.get("id") and r.get("event") in ("ADD", "UPDATE")
+    ])
+
+
+def _memory_index_ready() -> bool:
+    """True depois que a migração das memórias antigas para os índices terminou."""
+    global _memory_index_is_ready
+    if not _memory_index_is_ready:
+        row = _state_db().execute("SELECT value FROM state_meta WHERE key='memory_index_version'").fetchone()
+        _memory_index_is_ready = bool(row and _coerce_int(row["value"]) >= MEMORY_INDEX_VERSION)
+    return _memory_index_is_ready
+
+
+def _expand_tag_patterns(tags: list[str], user_id: str) -> list[str]:
+    """Resolve padrões hierárquicos ('python.django.*') para as tags existentes via índice."""
+    resolved = []
+    conn = _state_db()
+    for tag in _split_tags(tags):
+        if not tag.endswith(".*"):
+            resolved.append(tag)
+            continue
+        prefix = tag[:-2]
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        rows = conn.execute(
+            "SELECT DISTINCT tag FROM memory_tags WHERE user_id=? AND (tag=? OR tag LIKE ? ESCAPE '\\')",
+            (user_id, prefix, f"{escaped}.%"),
+        )
+        resolved.extend(r["tag"] for r in rows)
+    return list(dict.fromkeys(resolved))
+
+
+def _tags_or_filter(tags: list[str], user_id: str) -> dict | None:
+    """
+    Filtro de metadata que casa memórias com QUALQUER uma das tags (OR) numa única busca.
+    Retorna None quando nenhum padrão de tag existe (nenhuma memória pode casar).
+    """
+    resolved = _expand_tag_patterns(tags, user_id)
+    if not resolved:
+        return None
+    conditions: list[dict] = [{f"{TAG_KEY_PREFIX}{tag}": True} for tag in resolved]
+    if not _memory_index_ready():
+        # Memórias anteriores à migração só têm o CSV "tags" (casa quando é a única tag)
+        conditions += [{"tags": tag} for tag in resolved]
+    if len(conditions) == 1:
+        return conditions[0]
+    # "$or" vai direto ao ChromaDB (o "OR" do mem0 vaza a chave crua para o where e é rejeitado)
+    return {"$or": conditions}
+
+
+def _memory_ids_with_tags(tags: list[str], user_id: str) -> set[str]:
+    """Ids das memórias do usuário que possuem alguma das tags (aceita padrões 'a.b.*')."""
+    resolved = _expand_tag_patterns(tags, user_id)
+    if not resolved:
+        return set()
+    placeholders = ",".join("?" for _ in resolved)
+    rows = _state_db().execute(
+        f"SELECT DISTINCT memory_id FROM memory_tags WHERE user_id=? AND tag IN ({placeholders})",
+        (user_id, *resolved),
+    )
+    return {r["memory_id"] for r in rows}
+
+
+def _migrate_memory_index(batch_size: int = 500) -> dict:
+    """Reconstrói os índices de listagem/tags e grava as chaves tag:<nome> nas memórias existentes."""
+    global _memory_index_is_ready
+    started = time.perf_counter()
+    collection = _ensure_mem0().vector_store.collection
+    conn = _state_db()
+    _memory_index_is_ready = False
+    with conn:
+        conn.execute("DELETE FROM state_meta WHERE key='memory_index_version'")
+        conn.execute("DELETE FROM memory_index")
+        conn.execute("DELETE FROM memory_tags")
+        conn.execute("DELETE FROM user_stats")
+
+    scanned = updated = 0
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        entries = []
+        update_ids, update_metadatas = [], []
+        for memory_id, meta in zip(ids, page.get("metadatas") or []):
+            meta = meta or {}
+            tags = _split_tags(meta.get("tags"))
+            if meta.get("rule_type") == "programming_rule" and not meta.get("minhash"):
+                # Regras anteriores ao MinHash: assinatura calculada do texto gravado
+                meta = dict(meta)
+                meta["text_hash"], meta["minhash"] = _rule_signature(meta.get("data", ""))
+            entries.append((
+                memory_id, meta.get("user_id"), meta, _created_us(meta.get("created_at")), _memory_size(None, meta)
+            ))
+            missing = {f"{TAG_KEY_PREFIX}{t}": True for t in tags if meta.get(f"{TAG_KEY_PREFIX}{t}") is not True}
+            if missing:
+                update_ids.append(memory_id)
+                update_metadatas.append({**meta, **missing})
+        if update_ids:
+            collection.update(ids=update_ids, metadatas=update_metadatas)
+        _index_memories(entries)
+        scanned += len(ids)
+        updated += len(update_ids)
+        offset += len(ids)
+
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO state_meta (key, value) VALUES ('memory_index_version', ?)",
+            (str(MEMORY_INDEX_VERSION),),
+        )
+    _rebuild_user_stats()
+    _memory_index_is_ready = True
+    return {
+        "scanned": scanned,
+        "updated": updated,
+        "indexed_memories": conn.execute("SELECT COUNT(*) FROM memory_index").fetchone()[0],
+        "indexed_tags": conn.execute("SELECT COUNT(*) FROM memory_tags").fetchone()[0],
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def _rebuild_user_stats():
+    """Recalcula user_stats a partir de memory_index (corrige qualquer divergência dos contadores)."""
+    conn = _state_db()
+    with conn:
+        conn.execute("DELETE FROM user_stats")
+        conn.execute(
+            "INSERT INTO user_stats (user_id, memory_count, plan_count, rule_count, storage_bytes, last_write_at) "
+            "SELECT COALESCE(user_id, 'unknown'), COUNT(*), SUM(kind = 'plan'), SUM(kind = 'programming_rule'), "
+            "SUM(size_bytes), strftime('%Y-%m-%dT%H:%M:%fZ', MAX(created_us) / 1000000.0, 'unixepoch') "
+            "FROM memory_index GROUP BY COALESCE(user_id, 'unknown')"
+        )
+
+
+def _migrate_memory_index_in_background():
+    if _memory_index_ready():
+        return
+
+    def run():
+        try:
+            stats = _migrate_memory_index()
+            print(f"[INFO] Índices de memórias migrados: {stats}", file=sys.stderr)
+        except Exception as e:
+            print(f"[WARN] Migração dos índices de memórias falhou: {e}", file=sys.stderr)
+
+    threading.Thread(target=run, name="mem0-memory-index-migration", daemon=True).start()
+
+
+# --- Deduplicação de regras ------------------------------------------------------
+# Pré-filtro barato antes do embedder: hash do texto normalizado (duplicata exata) e MinHash
+# (quase idênticas). As features são trigramas de caracteres de cada palavra, com plurais
+# reduzidos: um typo ou um plural muda poucos trigramas, então o Jaccard continua alto. As
+# 64 posições do MinHash formam 16 bandas LSH indexadas no SQLite; regras com Jaccard acima
+# de ~0.6 compartilham ao menos uma banda com probabilidade > 90%.
+
+_RULE_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Palavras que invertem a regra: "Always use X" e "Never use X" nunca são quase-duplicatas
+_RULE_NEGATIONS = frozenset({"never", "not", "no", "avoid", "don", "dont", "nunca", "nao", "não", "evite", "evitar", "jamais"})
+_MINHASH_SIZE = 64
+_MINHASH_BAND_ROWS = 4
+_MINHASH_PRIME = 4294967311  # primo > 2**32: (a*h + b) % p sem overflow em uint64
+_minhash_rng = np.random.default_rng(20240611)
+_MINHASH_A = _minhash_rng.integers(1, 1 << 32, size=_MINHASH_SIZE, dtype=np.uint64)
+_MINHASH_B = _minhash_rng.integers(0, 1 << 32, size=_MINHASH_SIZE, dtype=np.uint64)
+
+
+def _normalize_rule_text(text: str) -> str:
+    return " ".join(_RULE_WORD_RE.findall((text or "").lower()))
+
+
+def _singular(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("sses", "shes", "ches", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def _rule_features(normalized: str) -> set[str]:
+    """Trigramas de caracteres de cada palavra (com bordas), após reduzir plurais."""
+    features = set()
+    for word in normalized.split():
+        padded = f" {_singular(word)} "
+        features.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return features
+
+
+def _rule_signature(text: str) -> tuple[str, str]:
+    """
+    Retorna (hash do texto normalizado, assinatura MinHash). A assinatura é "n:" ou "p:"
+    (regra com ou sem negação) seguido dos 64 mínimos de 32 bits em hex.
+    """
+    normalized = _normalize_rule_text(text)
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(f.encode(), digest_size=4).digest(), "big") for f in _rule_features(normalized)),
+        dtype=np.uint64,
+    )
+    if not hashes.size:
+        hashes = np.zeros(1, dtype=np.uint64)
+    minimums = ((np.outer(_MINHASH_A, hashes) + _MINHASH_B[:, None]) % _MINHASH_PRIME).min(axis=1)
+    polarity = "n" if _RULE_NEGATIONS.intersection(_singular(w) for w in normalized.split()) else "p"
+    signature = f"{polarity}:" + (minimums & 0xFFFFFFFF).astype(">u4").tobytes().hex()
+    return hashlib.sha1(normalized.encode()).hexdigest(), signature
+
+
+def _minhash_bands(signature: str) -> list[int]:
+    """Uma chave inteira (63 bits, cabe no INTEGER do SQLite) por banda; a polaridade entra na chave."""
+    raw = signature.encode()
+    width = 8 * _MINHASH_BAND_ROWS
+    return [
+        int.from_bytes(hashlib.blake2b(raw[:2] + raw[2 + i:2 + i + width], digest_size=8).digest(), "big") >> 1
+        for i in range(0, 8 * _MINHASH_SIZE, width)
+    ]
+
+
+def _minhash_similarity(a: str, b: str) -> float:
+    """Jaccard estimado entre duas assinaturas (0 quando a polaridade difere)."""
+    if a[:2] != b[:2]:
+        return 0.0
+    values_a = np.frombuffer(bytes.fromhex(a[2:]), dtype=">u4")
+    values_b = np.frombuffer(bytes.fromhex(b[2:]), dtype=">u4")
+    return float(np.mean(values_a == values_b))
+
+
+def _find_rule_by_signature(
+    user_id: str, language: str, category: str, text_hash: str, minhash: str
+) -> tuple[str, float, str] | None:
+    """Procura uma regra exata ou quase idêntica pelo índice de assinaturas: (memory_id, similaridade, match)."""
+    conn = _state_db()
+    row = conn.execute(
+        "SELECT memory_id FROM rule_signatures WHERE user_id=? AND language=? AND category=? AND text_hash=? LIMIT 1",
+        (user_id, language, category, text_hash),
+    ).fetchone()
+    if row:
+        return row["memory_id"], 1.0, "exact"
+    if RULE_NEAR_DUPLICATE_THRESHOLD <= 0:
+        return None
+    bands = _minhash_bands(minhash)
+    rows = conn.execute(
+        "SELECT DISTINCT s.memory_id, s.minhash FROM rule_signature_bands b "
+        "JOIN rule_signatures s ON s.memory_id = b.memory_id "
+        "WHERE b.user_id=? AND s.language=? AND s.category=? AND ("
+        + " OR ".join("(b.band=? AND b.value=?)" for _ in bands) + ")",
+        (user_id, language, category, *(x for pair in enumerate(bands) for x in pair)),
+    ).fetchall()
+    best = max(((r["memory_id"], _minhash_similarity(minhash, r["minhash"])) for r in rows), key=lambda x: x[1], default=None)
+    if best and best[1] >= RULE_NEAR_DUPLICATE_THRESHOLD:
+        return best[0], best[1], "minhash"
+    return None
+
+
+def _cosine_similarity(a, b) -> float:
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    denom = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(np.dot(a, b) / denom) if denom else 0.0
+
+
+def _rule_where(user_id: str, language: str | None = None, category: str | None = None) -> dict:
+    conditions = [{"user_id": {"$eq": user_id}}, {"rule_type": {"$eq": "programming_rule"}}]
+    if language:
+        conditions.append({"language": {"$eq": language}})
+    if category:
+        conditions.append({"category": {"$eq": category}})
+    return {"$and": conditions}
+
+
+# --- Jobs de inferência em background ----------------------------------------
+
+_job_queue: "queue.Queue[str]" = queue.Queue()
+_job_cond = threading.Condition()
+_job_pending = 0
+_job_workers: list[threading.Thread] = []
+
+
+def _reserve_job_slot() -> bool:
+    """Reserva uma vaga na fila de inferência respeitando ASYNC_INFER_QUEUE_MAX."""
+    global _job_pending
+    deadline = time.monotonic() + max(ASYNC_INFER_QUEUE_TIMEOUT, 0)
+    with _job_cond:
+        while _job_pending >= ASYNC_INFER_QUEUE_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _job_cond.wait(remaining)
+        _job_pending += 1
+        return True
+
+
+def _release_job_slot():
+    global _job_pending
+    with _job_cond:
+        _job_pending = max(_job_pending - 1, 0)
+        _job_cond.notify()
+
+
+def _start_job_workers():
+    """Sobe (ou completa) o pool de workers de inferência."""
+    with _job_cond:
+        _job_workers[:] = [t for t in _job_workers if t.is_alive()]
+        while len(_job_workers) < max(ASYNC_INFER_WORKERS, 1):
+            worker = threading.Thread(
+                target=_job_worker_loop,
+                name=f"mem0-infer-{len(_job_workers) + 1}",
+                daemon=True,
+            )
+            worker.start()
+            _job_workers.append(worker)
+
+
+def _job_worker_loop():
+    while True:
+        job_id = _job_queue.get()
+        retry_in = None
+        try:
+            # Jobs entram nas métricas como tool "memory_job" (é onde o tempo de LLM vai em infer_async)
+            with _track_tool("memory_job") as outcome:
+                retry_in = _run_memory_job(job_id)
+                if outcome is not None:
+                    outcome["status"] = "retry" if retry_in is not None else "ok"
+        except Exception as e:
+            print(f"[WARN] Job de inferência {job_id} falhou: {e}", file=sys.stderr)
+        finally:
+            if retry_in is not None:
+                _schedule_job(job_id, retry_in)
+            else:
+                _release_job_slot()
+            _job_queue.task_done()
+
+
+def _schedule_job(job_id: str, delay: float):
+    """Devolve o job à fila depois de `delay` segundos (o worker fica livre para os demais jobs)."""
+    if delay <= 0:
+        _job_queue.put(job_id)
+        return
+    timer = threading.Timer(delay, _job_queue.put, (job_id,))
+    timer.daemon = True
+    timer.start()
+
+
+def _retry_delay(attempts: int) -> float:
+    """Backoff exponencial com jitter a partir da tentativa que acabou de falhar."""
+    delay = min(ASYNC_INFER_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1), ASYNC_INFER_RETRY_MAX_BACKOFF_SECONDS)
+    return delay * random.uniform(0.8, 1.0)
+
+
+def _update_job(job_id: str, **fields):
+    fields["updated_at"] = datetime.now().isoformat()
+    assignments = ", ".join(f"{k}=?" for k in fields)
+    conn = _state_db()
+    with conn:
+        conn.execute(f"UPDATE memory_jobs SET {assignments} WHERE job_id=?", (*fields.values(), job_id))
+
+
+def _reconcile_raw_memory(raw_id: str | None, clean: dict, keep_raw: bool = False) -> str:
+    """Concilia o registro bruto com o resultado da extração do LLM."""
+    results = clean.get("results") if isinstance(clean, dict) else None
+    if not results:
+        # LLM não extraiu fatos novos: o registro bruto permanece como memória final
+        return "kept_raw"
+    touched = {item.get("id") for item in results if isinstance(item, dict)}
+    if not raw_id or raw_id in touched:
+        # O próprio registro bruto foi atualizado/removido pelo LLM
+        return "merged"
+    if keep_raw:
+        # Registro âncora (ex.: plano referenciado por plans.memory_id): os fatos só se somam a ele
+        return "extended"
+    if not mem0.vector_store.collection.get(ids=[raw_id], include=[]).get("ids"):
+        # Já removido por uma execução anterior do job (crash antes de marcá-lo como concluído)
+        return "replaced"
+    mem0.delete(memory_id=raw_id)
+    _unindex_memories([raw_id])
+    return "replaced"
+
+
+def _run_memory_job(job_id: str) -> float | None:
+    """
+    Executa a extração do LLM de um job. Retorna em quantos segundos o job deve voltar
+    para a fila (falha com tentativas restantes) ou None quando terminou.
+    O resultado da gravação fica no job antes da conciliação: um job retomado depois de
+    gravar só concilia, sem repetir a extração (que duplicaria as memórias).
+    """
+    row = _state_db().execute("SELECT * FROM memory_jobs WHERE job_id=?", (job_id,)).fetchone()
+    if not row or row["status"] not in ("pending", "running"):
+        return None
+    if row["next_attempt_at"]:
+        # Retomado antes da hora (restart durante o backoff): respeita o agendamento
+        wait = (datetime.fromisoformat(row["next_attempt_at"]) - datetime.now()).total_seconds()
+        if wait > 0:
+            return wait
+
+    attempts = row["attempts"] + 1
+    _update_job(job_id, status="running", attempts=attempts, next_attempt_at=None)
+    try:
+        metadata = json.loads(row["metadata"]) if row["metadata"] else None
+        with _mem0_access(row["user_id"]):
+            if row["result"]:
+                clean = json.loads(row["result"])
+            else:
+                clean = _add_memory_record(row["text"], row["user_id"], metadata, infer=True)
+                _update_job(job_id, result=json.dumps({"results": clean.get("results", [])}))
+            reconciliation = _reconcile_raw_memory(
+                row["memory_id"], clean, keep_raw=bool((metadata or {}).get("plan_id"))
+            )
+    except Exception as e:
+        if attempts >= ASYNC_INFER_MAX_ATTEMPTS:
+            _update_job(job_id, status="failed", error=str(e))
+            print(f"[WARN] Job de inferência {job_id} falhou após {attempts} tentativa(s): {e}", file=sys.stderr)
+            return None
+        delay = _retry_delay(attempts)
+        next_attempt_at = (datetime.now() + timedelta(seconds=delay)).isoformat()
+        _update_job(job_id, status="pending", error=str(e), next_attempt_at=next_attempt_at)
+        return delay
+
+    _update_job(
+        job_id,
+        status="done",
+        error=None,
+        result=json.dumps({"reconciliation": reconciliation, "results": clean.get("results", [])}),
+    )
+    search_cache.invalidate(row["user_id"], (metadata or {}).get("rule_type"))
+    return None
+
+
+def _enqueue_memory_job(text: str, user_id: str, meta: dict) -> dict:
+    """Persiste o registro bruto (só embedding) e agenda a extração do LLM."""
+    if not _reserve_job_slot():
+        return {
+            "status": "queue_full",
+            "message": "Inference queue is full; retry later or use mode='infer'",
+            "queue": _job_queue_stats(),
+        }
+
+    job_id = str(uuid4())
+    try:
+        raw = _add_raw_memory(text, user_id, {**meta, "job_id": job_id})
+        raw_id = _extract_id_from_mem0(raw)
+        now = datetime.now().isoformat()
+        conn = _state_db()
+        with conn:
+            conn.execute(
+                "INSERT INTO memory_jobs (job_id, memory_id, user_id, text, metadata, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'pending', ?, ?)",
+                (job_id, raw_id, user_id, text, json.dumps(meta) if meta else None, now, now),
+            )
+    except Exception:
+        _release_job_slot()
+        raise
+
+    _start_job_workers()
+    _job_queue.put(job_id)
+    search_cache.invalidate(user_id, meta.get("rule_type"))
+
+    return {"status": "queued", "id": raw_id, "job_id": job_id, "results": raw["results"]}
+
+
+def _resume_memory_jobs() -> int:
+    """Reenfileira jobs pendentes/interrompidos gravados no SQLite (retomada após crash)."""
+    global _job_pending
+    conn = _state_db()
+    with conn:
+        conn.execute(
+            "UPDATE memory_jobs SET status='pending', updated_at=? WHERE status='running'",
+            (datetime.now().isoformat(),),
+        )
+    job_ids = [r["job_id"] for r in conn.execute(
+        "SELECT job_id FROM memory_jobs WHERE status='pending' ORDER BY created_at"
+    )]
+    if not job_ids:
+        return 0
+
+    # Jobs retomados já estão persistidos: ocupam vagas mesmo acima do limite
+    with _job_cond:
+        _job_pending += len(job_ids)
+    _start_job_workers()
+    for job_id in job_ids:
+        _job_queue.put(job_id)
+    print(f"[INFO] {len(job_ids)} job(s) de inferência retomados.", file=sys.stderr)
+    return len(job_ids)
+
+
+def _job_queue_stats() -> dict:
+    return {
+        "pending": _job_pending,
+        "capacity": ASYNC_INFER_QUEUE_MAX,
+        "workers": sum(1 for t in _job_workers if t.is_alive()),
+        "max_workers": ASYNC_INFER_WORKERS,
     }
 
 
-def _save_plan_memory(plan_memory: dict, metadata: dict, user_id: str) -> tuple[dict, str | None]:
-    """Persiste mudanças de plano recriando a memória (mem0 não expõe update)."""
-    title = plan_memory.get("memory") or metadata.get("title") or metadata.get("plan_id") or "Plano"
-    add_result = mem0.add(title, user_id=user_id, metadata=metadata, infer=MEM0_INFER)
-    clean = json.loads(json.dumps(add_result, default=str))
+# --- Cache de embeddings -------------------------------------------------------
+
+class EmbeddingCache:
+    """
+    Cache texto -> vetor em dois níveis: LRU em memória e SQLite em disco.
+    As chaves incluem provedor, modelo e EMBEDDING_DIMS, então trocar o modelo
+    nunca devolve vetores incompatíveis.
+    """
+
+    def __init__(self, path: str, max_memory_entries: int, max_rows: int):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_rows = max_rows
+        self._memory: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(namespace: str, text: str) -> str:
+        return hashlib.sha256(f"{namespace}\0{text}".encode()).hexdigest()
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_created ON embeddings(created_at)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> list[float] | None:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+        row = self._db().execute("SELECT vector FROM embeddings WHERE key=?", (key,)).fetchone()
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        vector = array("f", row[0]).tolist()
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, vector)
+        return vector
+
+    def peek(self, key: str) -> list[float] | None:
+        """Consulta só a LRU em memória, sem contar hit/miss."""
+        with self._lock:
+            return self._memory.get(key)
+
+    def put(self, key: str, namespace: str, vector: list[float]):
+        with self._lock:
+            self._remember(key, list(vector))
+            self._writes += 1
+            prune = self.max_rows > 0 and self._writes % 1000 == 0
+        conn = self._db()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, namespace, vector, created_at) VALUES (?, ?, ?, ?)",
+                (key, namespace, array("f", vector).tobytes(), time.time()),
+            )
+            if prune:
+                # Mantém no máximo max_rows linhas, descartando as mais antigas
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_rows,),
+                )
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "max_memory_entries": self.max_memory_entries,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else None,
+                "path": self.path,
+            }
+
+    def _remember(self, key: str, vector: list[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+
+class CachedEmbedder:
+    """Envolve o embedder do mem0 consultando o EmbeddingCache antes de chamar o provedor."""
+
+    def __init__(self, inner, cache: EmbeddingCache, namespace: str):
+        self.inner = inner
+        self.cache = cache
+        self.namespace = namespace
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def embed(self, text, memory_action=None):
+        key = self.cache.make_key(self.namespace, text)
+        with _phase("cache_lookup", "embedding_cache"):
+            vector = self.cache.get(key)
+        if vector is None:
+            vector = self.inner.embed(text, memory_action)
+            self.cache.put(key, self.namespace, vector)
+        return vector
+
+    def embed_batch(self, texts, memory_action="add"):
+        keys = [self.cache.make_key(self.namespace, t) for t in texts]
+        with _phase("cache_lookup", "embedding_cache"):
+            vectors = [self.cache.get(k) for k in keys]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            computed = _embed_texts(self.inner, [texts[i] for i in missing], memory_action)
+            for i, vector in zip(missing, computed):
+                self.cache.put(keys[i], self.namespace, vector)
+                vectors[i] = vector
+        return vectors
+
+
+class OllamaBatchEmbedder:
+    """
+    Embedder do Ollama pelo /api/embed: embed() e embed_batch() usam o mesmo endpoint (um
+    texto ou uma lista em `input`), então o vetor de um texto não depende de ele ter chegado
+    sozinho ou num lote. O embedder do mem0 só fala com o /api/embeddings legado, que não
+    aceita lote e devolve vetores sem normalizar.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
 
-    # Se infer=True retornou results vazio, tenta novamente com infer=False
-    if MEM0_INFER and isinstance(clean.get("results"), list) and not clean["results"]:
-        add_result = mem0.add(title, user_id=user_id, metadata=metadata, infer=False)
-        clean = json.loads(json.dumps(add_result, default=str))
+    def embed(self, text, memory_action=None):
+        return self.embed_batch([text], memory_action)[0]
 
-    new_id = _extract_id_from_mem0(clean)
-    warning = None
+    def embed_batch(self, texts, memory_action="add"):
+        response = self.inner.client.embed(model=self.inner.config.model, input=list(texts))
+        return [list(vector) for vector in response["embeddings"]]
 
-    # Remove a memória antiga para evitar duplicação do plan_id
-    if plan_memory.get("id"):
+
+class BatchingEmbedder:
+    """
+    Agrupa embeds concorrentes: o primeiro pedido de uma janela (havendo outros embeds em
+    andamento) espera window_ms e despacha
+    todos os pedidos acumulados num único lote; um lote cheio (max_batch) sai na hora.
+    Pedidos idênticos (texto + memory_action) em voo aguardam o mesmo Future.
+    Com embed_batch nativo (ex.: OllamaBatchEmbedder) o lote vira uma chamada só; sem ele, o
+    lote é distribuído em até `concurrency` chamadas unitárias no pool keep-alive, e cada
+    pedido é liberado assim que o seu vetor chega.
+    """
+
+    def __init__(self, inner, window_ms: float, max_batch: int, concurrency: int = 4):
+        self.inner = inner
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="mem0-embed")
+        self._lock = threading.Lock()
+        self._pending: list[tuple] = []
+        self._inflight: dict[tuple, Future] = {}
+        self._callers = 0
+        self.requests = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.batch_calls = 0
+        self.batched_texts = 0
+        self.largest_batch = 0
+        self.single_calls = 0
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def embed(self, text, memory_action=None):
+        if self.window <= 0:
+            with self._lock:
+                self.requests += 1
+            return self.inner.embed(text, memory_action)
+        key = (memory_action, text)
+        leader = False
+        concurrent_callers = False
+        batch = None
+        with self._lock:
+            self.requests += 1
+            self._callers += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+            else:
+                future = Future()
+                self._inflight[key] = future
+                self._pending.append(key)
+                if len(self._pending) >= self.max_batch:
+                    batch = self._take()
+                elif len(self._pending) == 1:
+                    leader = True
+                    concurrent_callers = self._callers > 1
         try:
-            mem0.delete(memory_id=plan_memory["id"])
+            if leader:
+                # sozinho não há o que agrupar: a janela só vale com outros embeds em andamento
+                if concurrent_callers:
+                    time.sleep(self.window)
+                with self._lock:
+                    batch = self._take()
+            if batch:
+                self._run(batch)
+            return future.result()
+        finally:
+            with self._lock:
+                self._callers -= 1
+
+    def embed_batch(self, texts, memory_action="add"):
+        # ingestão em lote já chega agrupada: vai direto ao provedor
+        return _embed_texts(self.inner, texts, memory_action)
+
+    def _take(self) -> list[tuple]:
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        return batch
+
+    def _run(self, batch: list[tuple]):
+        with self._lock:
+            self.flushes += 1
+            futures = [self._inflight[key] for key in batch]
+        by_action: dict = {}
+        for key, future in zip(batch, futures):
+            by_action.setdefault(key[0], []).append((key, future))
+        batch_fn = getattr(self.inner, "embed_batch", None)
+        for action, items in by_action.items():
+            if callable(batch_fn):
+                with self._lock:
+                    self.batch_calls += 1
+                    self.batched_texts += len(items)
+                    self.largest_batch = max(self.largest_batch, len(items))
+                try:
+                    vectors = batch_fn([key[1] for key, _ in items], action)
+                except Exception as e:
+                    for key, future in items:
+                        self._finish(key, future, error=e)
+                    continue
+                for (key, future), vector in zip(items, vectors):
+                    self._finish(key, future, vector)
+            else:
+                with self._lock:
+                    self.single_calls += len(items)
+                for key, future in items:
+                    self._executor.submit(self._embed_one, key, future)
+
+    def _embed_one(self, key: tuple, future: Future):
+        try:
+            vector = self.inner.embed(key[1], key[0])
         except Exception as e:
-            warning = f"Plano atualizado, mas falhou ao remover versão anterior: {e}"
+            self._finish(key, future, error=e)
+        else:
+            self._finish(key, future, vector)
+
+    def _finish(self, key: tuple, future: Future, vector=None, error: Exception | None = None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(vector)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+                "requests": self.requests,
+                "coalesced": self.coalesced,
+                "flushes": self.flushes,
+                "batch_calls": self.batch_calls,
+                "avg_batch_size": round(self.batched_texts / self.batch_calls, 2) if self.batch_calls else 0.0,
+                "largest_batch": self.largest_batch,
+                "single_calls": self.single_calls,
+            }
+
+
+def _embedding_batcher() -> BatchingEmbedder | None:
+    """Localiza o BatchingEmbedder na cadeia de wrappers do embedder atual."""
+    component = mem0.embedding_model if mem0 is not None else None
+    while component is not None and not isinstance(component, BatchingEmbedder):
+        component = vars(component).get("inner")
+    return component
+
+
+# Instância única: sobrevive às reconstruções do Memory em change_llm_config
+embedding_cache = EmbeddingCache(
+    EMBEDDING_CACHE_PATH,
+    max_memory_entries=EMBEDDING_CACHE_MEMORY_ENTRIES,
+    max_rows=EMBEDDING_CACHE_MAX_ROWS,
+)
+
+
+# --- Cache de extração do LLM -------------------------------------------------
+
+class LLMCache:
+    """
+    Cache persistente (SQLite) de respostas do LLM por tipo de chamada ("facts" = extração de
+    fatos, "update" = decisões ADD/UPDATE/DELETE). Entradas expiram após `ttl` segundos e a
+    tabela é podada para no máximo `max_rows` linhas. Guarda a latência original de cada resposta
+    para reportar o tempo de modelo economizado pelos hits.
+    """
+
+    def __init__(self, path: str, ttl: float, max_rows: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self._counters: dict[str, dict[str, float]] = {}
+
+    @staticmethod
+    def make_key(namespace: str, kind: str, text: str) -> str:
+        return hashlib.sha256(f"{namespace}\0{kind}\0{text}".encode()).hexdigest()
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_responses ("
+                "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, kind TEXT NOT NULL, response TEXT NOT NULL, "
+                "elapsed_ms REAL NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_created ON llm_responses(created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_namespace ON llm_responses(namespace)")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, kind: str, field: str, amount: float = 1):
+        with self._lock:
+            counters = self._counters.setdefault(kind, {"hits": 0, "misses": 0, "expired": 0, "writes": 0, "saved_ms": 0.0})
+            counters[field] += amount
+
+    def get(self, key: str, kind: str) -> str | None:
+        conn = self._db()
+        row = conn.execute("SELECT response, elapsed_ms, created_at FROM llm_responses WHERE key=?", (key,)).fetchone()
+        if row is None:
+            self._count(kind, "misses")
+            return None
+        if self.ttl > 0 and time.time() - row[2] > self.ttl:
+            with conn:
+                conn.execute("DELETE FROM llm_responses WHERE key=?", (key,))
+            self._count(kind, "expired")
+            self._count(kind, "misses")
+            return None
+        self._count(kind, "hits")
+        self._count(kind, "saved_ms", row[1])
+        return row[0]
+
+    def put(self, key: str, namespace: str, kind: str, response: str, elapsed_ms: float):
+        with self._lock:
+            self._writes += 1
+            prune = self.max_rows > 0 and self._writes % 100 == 0
+        self._count(kind, "writes")
+        conn = self._db()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, namespace, kind, response, elapsed_ms, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, namespace, kind, response, elapsed_ms, time.time()),
+            )
+            if prune:
+                if self.ttl > 0:
+                    conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (time.time() - self.ttl,))
+                conn.execute(
+                    "DELETE FROM llm_responses WHERE key IN "
+                    "(SELECT key FROM llm_responses ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_rows,),
+                )
+
+    def invalidate(self, namespace: str) -> int:
+        """Remove as respostas de um provedor/modelo (ex.: o LLM substituído por change_llm_config)."""
+        conn = self._db()
+        with conn:
+            return conn.execute("DELETE FROM llm_responses WHERE namespace=?", (namespace,)).rowcount
+
+    def stats(self) -> dict:
+        rows = self._db().execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+        with self._lock:
+            kinds = {}
+            for kind, c in self._counters.items():
+                lookups = c["hits"] + c["misses"]
+                kinds[kind] = {
+                    "hits": int(c["hits"]),
+                    "misses": int(c["misses"]),
+                    "expired": int(c["expired"]),
+                    "writes": int(c["writes"]),
+                    "hit_ratio": round(c["hits"] / lookups, 4) if lookups else None,
+                    "saved_ms": round(c["saved_ms"], 2),
+                }
+            hits = sum(k["hits"] for k in kinds.values())
+            lookups = hits + sum(k["misses"] for k in kinds.values())
+            return {
+                "rows": rows,
+                "max_rows": self.max_rows,
+                "ttl_seconds": self.ttl,
+                "hit_ratio": round(hits / lookups, 4) if lookups else None,
+                "saved_ms": round(sum(k["saved_ms"] for k in kinds.values()), 2),
+                "kinds": kinds,
+                "path": self.path,
+            }
+
+
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def _normalize_llm_text(text: str) -> str:
+    """Normalização da entrada para a chave do cache: NFKC e espaços colapsados."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def _llm_cache_request(messages, kwargs: dict) -> tuple[str, str] | None:
+    """
+    Classifica uma chamada do mem0 ao LLM e monta o texto que entra na chave, ou None se a
+    chamada não é cacheável (tools/function calling).
+    Extração de fatos (system + "Input:"): versão do prompt = hash do prompt de sistema sem a
+    data do dia, mais o texto normalizado. Demais chamadas (decisões de update): o prompt inteiro,
+    que já inclui as memórias recuperadas.
+    """
+    if kwargs.get("tools") or not isinstance(messages, list):
+        return None
+    response_format = json.dumps(kwargs.get("response_format"), sort_keys=True, default=str)
+    if (
+        len(messages) == 2
+        and messages[0].get("role") == "system"
+        and str(messages[1].get("content", "")).startswith("Input:")
+    ):
+        prompt_version = hashlib.sha256(_DATE_RE.sub("", str(messages[0]["content"])).encode()).hexdigest()[:16]
+        text = _normalize_llm_text(str(messages[1]["content"]))
+        return "facts", f"{LLM_CACHE_PROMPT_VERSION}\0{prompt_version}\0{response_format}\0{text}"
+    text = "\0".join(f"{m.get('role')}:{_normalize_llm_text(str(m.get('content', '')))}" for m in messages)
+    return "update", f"{LLM_CACHE_PROMPT_VERSION}\0{response_format}\0{text}"
+
+
+class CachedLLM:
+    """Envolve o LLM do mem0 consultando o LLMCache antes de chamar o modelo."""
+
+    def __init__(self, inner, cache: LLMCache, namespace: str):
+        self.inner = inner
+        self.cache = cache
+        self.namespace = namespace
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def generate_response(self, messages, *args, **kwargs):
+        request = None if args else _llm_cache_request(messages, kwargs)
+        if request is None:
+            return self.inner.generate_response(messages, *args, **kwargs)
+        kind, text = request
+        key = self.cache.make_key(self.namespace, kind, text)
+        with _phase("cache_lookup", "llm_cache"):
+            cached = self.cache.get(key, kind)
+        if cached is not None:
+            return cached
+        started = time.perf_counter()
+        response = self.inner.generate_response(messages, *args, **kwargs)
+        # Só respostas de texto não vazias: vazio costuma ser falha transitória do modelo
+        if isinstance(response, str) and response.strip():
+            self.cache.put(key, self.namespace, kind, response, (time.perf_counter() - started) * 1000)
+        return response
+
+
+def _llm_namespace(provider: str, model: str) -> str:
+    return f"{provider}:{model}"
+
+
+def _with_llm_cache(llm, provider: str, model: str):
+    """Aplica o cache de extração ao LLM recém-criado (LLM_CACHE_ENABLED)."""
+    if not LLM_CACHE_ENABLED:
+        return llm
+    return CachedLLM(llm, llm_cache, _llm_namespace(provider, model))
+
+
+llm_cache = LLMCache(LLM_CACHE_PATH, ttl=LLM_CACHE_TTL_SECONDS, max_rows=LLM_CACHE_MAX_ROWS)
+
+
+# --- Coordenação de acesso ao mem0 --------------------------------------------
+# Toda chamada ao mem0 (tools, rotas /_test, jobs) segura a instância em modo compartilhado;
+# escritas também seguram o lock do usuário, então escritas de um mesmo usuário são
+# serializadas e buscas seguem em paralelo. A troca da instância (change_llm_config)
+# pede o modo exclusivo: espera as chamadas em andamento e bloqueia novas até concluir.
+
+class LockWaitStats:
+    """Contadores de espera por lock: aquisições, disputas e tempo de espera (total/máximo)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+
+    def record(self, wait_ms: float, contended: bool):
+        with self._lock:
+            self.acquisitions += 1
+            if contended:
+                self.contended += 1
+                self.wait_ms_total += wait_ms
+                self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "acquisitions": self.acquisitions,
+                "contended": self.contended,
+                "wait_ms_total": round(self.wait_ms_total, 2),
+                "wait_ms_max": round(self.wait_ms_max, 2),
+                "avg_contended_wait_ms": round(self.wait_ms_total / self.contended, 2) if self.contended else 0.0,
+            }
+
+
+class ReadWriteLock:
+    """
+    Lock leitores/escritor com preferência ao escritor (novos leitores esperam um escritor
+    pendente, então a troca não sofre starvation). O modo compartilhado é reentrante por thread.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+        self._local = threading.local()
+        self.shared_waits = LockWaitStats()
+        self.exclusive_waits = LockWaitStats()
+
+    @contextmanager
+    def shared(self):
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            started = time.perf_counter()
+            with self._cond:
+                contended = self._writer or self._writers_waiting > 0
+                while self._writer or self._writers_waiting:
+                    self._cond.wait()
+                self._readers += 1
+            self.shared_waits.record((time.perf_counter() - started) * 1000, contended)
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                with self._cond:
+                    self._readers -= 1
+                    if self._readers == 0:
+                        self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        started = time.perf_counter()
+        with self._cond:
+            contended = self._writer or self._readers > 0
+            self._writers_waiting += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+        self.exclusive_waits.record((time.perf_counter() - started) * 1000, contended)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            state = {"readers": self._readers, "writer": self._writer, "writers_waiting": self._writers_waiting}
+        return {**state, "shared": self.shared_waits.stats(), "exclusive": self.exclusive_waits.stats()}
+
+
+class KeyedLocks:
+    """Um RLock por chave (user_id), criado sob demanda, com métricas de espera agregadas."""
+
+    def __init__(self):
+        self._locks: dict[str, threading.RLock] = {}
+        self._guard = threading.Lock()
+        self.waits = LockWaitStats()
+
+    @contextmanager
+    def hold(self, key: str):
+        with self._guard:
+            lock = self._locks.setdefault(key, threading.RLock())
+        started = time.perf_counter()
+        contended = not lock.acquire(blocking=False)
+        if contended:
+            lock.acquire()
+        self.waits.record((time.perf_counter() - started) * 1000, contended)
+        try:
+            yield
+        finally:
+            lock.release()
+
+    @contextmanager
+    def hold_many(self, keys):
+        """Segura várias chaves sempre na mesma ordem (lotes que se cruzam não entram em deadlock)."""
+        with ExitStack() as stack:
+            for key in sorted(set(keys)):
+                stack.enter_context(self.hold(key))
+            yield
+
+    def stats(self) -> dict:
+        with self._guard:
+            keys = len(self._locks)
+        return {"keys": keys, **self.waits.stats()}
+
+
+mem0_gate = ReadWriteLock()
+user_write_locks = KeyedLocks()
+
+
+@contextmanager
+def _mem0_access(write_user: str | list[str] | None = None):
+    """Segura a instância do mem0 (compartilhado) e, para escritas, o lock do(s) usuário(s)."""
+    _ensure_mem0()
+    ollama_keepalive.touch()
+    with mem0_gate.shared():
+        if write_user is None:
+            yield
+        elif isinstance(write_user, str):
+            with user_write_locks.hold(write_user):
+                yield
+        else:
+            with user_write_locks.hold_many(write_user):
+                yield
+
+
+def _call_guarded(write_user: str | list[str] | None, fn, *args, **kwargs):
+    with _mem0_access(write_user):
+        return fn(*args, **kwargs)
+
+
+# --- Ollama: pool HTTP compartilhado ----------------------------------------------
+
+class OllamaTransport(httpx.BaseTransport):
+    """
+    Transporte httpx sobre um único pool de conexões keep-alive: distribui as requisições
+    entre as instâncias em round-robin e repete, na próxima instância e com backoff
+    exponencial com jitter, as que falham por conexão ou por 502/503/504. Uma instância
+    que falhou fica fora do rodízio por down_seconds (enquanto houver outra disponível).
+    """
+
+    RETRY_STATUS = {502, 503, 504}
+    RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError, httpx.PoolTimeout)
+
+    def __init__(
+        self,
+        base_urls: list[str],
+        limits: httpx.Limits,
+        retries: int = 2,
+        backoff: float = 0.2,
+        down_seconds: float = 10.0,
+        transport: httpx.BaseTransport | None = None,
+    ):
+        self.instances = [httpx.URL(url) for url in base_urls]
+        self.retries = retries
+        self.backoff = backoff
+        self.down_seconds = down_seconds
+        self._down_until: dict[httpx.URL, float] = {}
+        self._transport = transport or httpx.HTTPTransport(limits=limits)
+        self._lock = threading.Lock()
+        self._next = 0
+        self.requests = {str(url): 0 for url in self.instances}
+        self.retried = 0
+        self.failed = 0
+
+    def _pick(self) -> httpx.URL:
+        now = time.monotonic()
+        with self._lock:
+            for _ in range(len(self.instances)):
+                instance = self.instances[self._next % len(self.instances)]
+                self._next += 1
+                if self._down_until.get(instance, 0) <= now:
+                    break
+            self.requests[str(instance)] += 1
+        return instance
+
+    def _mark_down(self, instance: httpx.URL):
+        if len(self.instances) > 1:
+            with self._lock:
+                self._down_until[instance] = time.monotonic() + self.down_seconds
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            instance = self._pick()
+            request.url = request.url.copy_with(scheme=instance.scheme, host=instance.host, port=instance.port)
+            try:
+                response = self._transport.handle_request(request)
+                if response.status_code not in self.RETRY_STATUS or attempt >= self.retries:
+                    return response
+                response.close()
+                self._mark_down(instance)
+            except self.RETRY_ERRORS:
+                self._mark_down(instance)
+                if attempt >= self.retries:
+                    with self._lock:
+                        self.failed += 1
+                    raise
+            attempt += 1
+            with self._lock:
+                self.retried += 1
+            # full jitter: espera aleatória em [0, backoff * 2^tentativa]
+            time.sleep(random.uniform(0, self.backoff * (2 ** (attempt - 1))))
+
+    def close(self):
+        self._transport.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "requests": dict(self.requests),
+                "down": [str(url) for url, until in self._down_until.items() if until > now],
+                "retried": self.retried,
+                "failed": self.failed,
+            }
+
+
+_ollama_http: httpx.Client | None = None
+_ollama_http_lock = threading.Lock()
+
+
+def _ollama_http_client() -> httpx.Client:
+    """Cliente httpx compartilhado (criado no primeiro uso) para todas as chamadas ao Ollama."""
+    global _ollama_http
+    with _ollama_http_lock:
+        if _ollama_http is None:
+            transport = OllamaTransport(
+                OLLAMA_BASE_URLS,
+                httpx.Limits(
+                    max_connections=OLLAMA_POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=OLLAMA_POOL_MAX_KEEPALIVE,
+                ),
+                retries=OLLAMA_RETRIES,
+                backoff=OLLAMA_RETRY_BACKOFF_SECONDS,
+                down_seconds=OLLAMA_INSTANCE_DOWN_SECONDS,
+            )
+            _ollama_http = httpx.Client(
+                base_url=OLLAMA_BASE_URL,
+                transport=transport,
+                timeout=httpx.Timeout(OLLAMA_READ_TIMEOUT_SECONDS, connect=OLLAMA_CONNECT_TIMEOUT_SECONDS),
+                headers={"Content-Type": "application/json", "Accept": "application/json"},
+                follow_redirects=True,
+            )
+        return _ollama_http
+
+
+def _ollama_pool_stats() -> dict:
+    if _ollama_http is None:
+        return {"initialized": False, "instances": OLLAMA_BASE_URLS}
+    return {
+        "initialized": True,
+        "max_connections": OLLAMA_POOL_MAX_CONNECTIONS,
+        "max_keepalive": OLLAMA_POOL_MAX_KEEPALIVE,
+        **_ollama_http._transport.stats(),
+    }
+
+
+def _use_ollama_pool(component):
+    """
+    Troca o httpx.Client privado do ollama.Client de um embedder/LLM do mem0 pelo pool
+    compartilhado (os provedores criam um cliente próprio cada). Outros provedores: sem efeito.
+    """
+    client = getattr(component, "client", None)
+    if client is None or type(client).__module__.split(".")[0] != "ollama":
+        return
+    own = getattr(client, "_client", None)
+    client._client = _ollama_http_client()
+    if own is not None and own is not client._client:
+        own.close()
+
+
+# --- Ollama: warm-up e keep-alive -------------------------------------------------
 
-    _clear_cache()
+class OllamaKeepAlive:
+    """
+    Pré-carrega os modelos do Ollama e renova o keep_alive deles em background.
+    O primeiro ping de cada modelo mede a carga a frio (cold_ms); os seguintes, com o
+    modelo já residente, medem a latência a quente. Pings só acontecem enquanto houver
+    tráfego recente (touch), para não prender os modelos na memória sem uso.
+    Com várias instâncias, cada uma recebe o ping (o round-robin espalha as chamadas entre elas).
+    """
+
+    def __init__(
+        self,
+        base_url: str | list[str],
+        models,
+        keep_alive: str = "30m",
+        interval: float = 240.0,
+        idle_window: float = 1800.0,
+        timeout: float = 120.0,
+    ):
+        self.base_urls = [url.rstrip("/") for url in ([base_url] if isinstance(base_url, str) else base_url)]
+        self.models = models  # callable -> [(kind, model)], kind "embedding" ou "llm"
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self.idle_window = idle_window
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._last_traffic = time.monotonic()
+        self._models: dict[str, dict] = {}
+        self._client: httpx.Client | None = None
+        self.skipped_idle = 0
+
+    def touch(self):
+        """Marca tráfego (chamada de tool): mantém os pings ativos pela janela idle_window."""
+        self._last_traffic = time.monotonic()
+
+    def ping(self, kind: str, model: str, base_url: str | None = None) -> float:
+        """Carrega/renova um modelo e devolve a latência em ms."""
+        if self._client is None:
+            self._client = httpx.Client(timeout=self.timeout)
+        if kind == "embedding":
+            path, payload = "/api/embed", {"model": model, "input": "keep-alive", "keep_alive": self.keep_alive}
+        else:
+            # /api/generate sem prompt só carrega o modelo, sem gerar tokens
+            path, payload = "/api/generate", {"model": model, "keep_alive": self.keep_alive}
+        started = time.perf_counter()
+        response = self._client.post(f"{base_url or self.base_urls[0]}{path}", json=payload)
+        response.raise_for_status()
+        return (time.perf_counter() - started) * 1000
+
+    def ping_all(self) -> dict:
+        targets = [(base_url, kind, model) for base_url in self.base_urls for kind, model in self.models()]
+        for base_url, kind, model in targets:
+            key = f"{base_url}|{kind}:{model}"
+            with self._lock:
+                entry = self._models.setdefault(key, {
+                    "instance": base_url, "kind": kind, "model": model, "cold_ms": None, "last_ms": None,
+                    "warm_ms_total": 0.0, "warm_pings": 0, "failures": 0, "last_error": None, "last_ping_at": None,
+                })
+            try:
+                elapsed = self.ping(kind, model, base_url)
+            except Exception as e:
+                with self._lock:
+                    entry["failures"] += 1
+                    entry["last_error"] = str(e)
+                continue
+            with self._lock:
+                if entry["cold_ms"] is None:
+                    entry["cold_ms"] = elapsed
+                else:
+                    entry["warm_ms_total"] += elapsed
+                    entry["warm_pings"] += 1
+                entry["last_ms"] = elapsed
+                entry["last_error"] = None
+                entry["last_ping_at"] = datetime.now().isoformat()
+        return self.stats()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="mem0-ollama-keepalive", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        self.ping_all()  # warm-up: carga a frio antes da primeira requisição
+        while not self._stop.wait(self.interval):
+            if time.monotonic() - self._last_traffic > self.idle_window:
+                self.skipped_idle += 1
+                continue
+            self.ping_all()
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = [
+                {
+                    "instance": e["instance"],
+                    "kind": e["kind"],
+                    "model": e["model"],
+                    "cold_ms": round(e["cold_ms"], 2) if e["cold_ms"] is not None else None,
+                    "warm_avg_ms": round(e["warm_ms_total"] / e["warm_pings"], 2) if e["warm_pings"] else None,
+                    "last_ms": round(e["last_ms"], 2) if e["last_ms"] is not None else None,
+                    "warm_pings": e["warm_pings"],
+                    "failures": e["failures"],
+                    "last_error": e["last_error"],
+                    "last_ping_at": e["last_ping_at"],
+                }
+                for e in self._models.values()
+            ]
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "instances": self.base_urls,
+            "keep_alive": self.keep_alive,
+            "interval_seconds": self.interval,
+            "idle": time.monotonic() - self._last_traffic > self.idle_window,
+            "skipped_idle": self.skipped_idle,
+            "models": models,
+        }
+
+
+def _ollama_models() -> list[tuple[str, str]]:
+    """Modelos servidos pelo Ollama na configuração atual (acompanha change_llm_config)."""
+    models = []
+    if EMBEDDING_PROVIDER == "ollama":
+        models.append(("embedding", EMBEDDING_MODEL))
+    if LLM_PROVIDER == "ollama":
+        models.append(("llm", LLM_MODEL))
+    return models
 
-    normalized = _normalize_plan_memory({"id": new_id, "memory": title, "metadata": metadata})
-    return normalized, warning
+
+ollama_keepalive = OllamaKeepAlive(
+    OLLAMA_BASE_URLS,
+    _ollama_models,
+    keep_alive=OLLAMA_KEEP_ALIVE,
+    interval=OLLAMA_KEEPALIVE_INTERVAL_SECONDS,
+    idle_window=OLLAMA_KEEPALIVE_IDLE_SECONDS,
+    timeout=OLLAMA_KEEPALIVE_TIMEOUT_SECONDS,
+)
 
 
 # --- Mem0 Constructor --------------------------------------------------------
 
-def build_mem0() -> Memory:
+def _llm_config(provider: str, model: str) -> dict:
+    """Config do LLM no formato do mem0 (compartilhada por build_mem0 e pela troca a quente)."""
+    llm_config = {
+        "model": model,
+    }
+    if provider == "ollama":
+        llm_config["ollama_base_url"] = OLLAMA_BASE_URL
+    return llm_config
+
+
+def _resolve_ollama_embed_api(memory) -> str:
+    """
+    Escolhe o endpoint de embeddings do Ollama (OLLAMA_EMBED_API). No modo auto, o endpoint
+    fica gravado no state_meta na primeira construção: store vazio usa o /api/embed; store já
+    populado sem registro (criado pelo /api/embeddings legado) continua no legado, já que
+    comparar vetores normalizados com não normalizados distorce as distâncias.
+    """
+    if OLLAMA_EMBED_API in ("embed", "embeddings"):
+        return OLLAMA_EMBED_API
+    conn = _state_db()
+    row = conn.execute("SELECT value FROM state_meta WHERE key='ollama_embed_api'").fetchone()
+    if row is not None:
+        return row["value"]
+    api = "embed" if memory.vector_store.collection.count() == 0 else "embeddings"
+    if api == "embeddings":
+        print(
+            "[WARN] Chroma já tem vetores do /api/embeddings legado: embeddings seguem sem lote. "
+            "Para usar o /api/embed, reindexe o store e defina OLLAMA_EMBED_API=embed.",
+            file=sys.stderr,
+        )
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO state_meta (key, value) VALUES ('ollama_embed_api', ?)", (api,))
+    return api
+
+
+def build_mem0() -> "Memory":
     """
     Monta o cliente Mem0 com SQLite + Chroma (vetor store local) + embeddings via Ollama.
     """
+    # Mem0 (pacote correto)
+    from mem0.memory.main import Memory
+
     if VECTOR_STORE_PROVIDER != "chroma":
         raise RuntimeError("Este servidor está configurado para usar apenas Chroma no momento.")
 
@@ -333,14 +2838,7 @@ def build_mem0() -> Memory:
         "embedding_dims": EMBEDDING_DIMS,
     }
     if EMBEDDING_PROVIDER == "ollama":
-        embedder_config["ollama_base_url"] = "http://127.0.0.1:11434"
-
-    # Build LLM config
-    llm_config = {
-        "model": LLM_MODEL,
-    }
-    if LLM_PROVIDER == "ollama":
-        llm_config["ollama_base_url"] = "http://127.0.0.1:11434"
+        embedder_config["ollama_base_url"] = OLLAMA_BASE_URL
 
     config = {
         "history_db_path": HISTORY_DB_PATH,
@@ -361,23 +2859,647 @@ def build_mem0() -> Memory:
         },
         "llm": {
             "provider": LLM_PROVIDER,
-            "config": llm_config
+            "config": _llm_config(LLM_PROVIDER, LLM_MODEL)
         },
     }
-    return Memory.from_config(config)
+    memory = Memory.from_config(config)
+    _use_ollama_pool(memory.embedding_model)
+    _use_ollama_pool(memory.llm)
+    embed_api = _resolve_ollama_embed_api(memory) if EMBEDDING_PROVIDER == "ollama" else None
+    if embed_api == "embed":
+        memory.embedding_model = OllamaBatchEmbedder(memory.embedding_model)
+    memory.llm = _with_llm_cache(PhaseTimed(memory.llm, "llm", ("generate_response",)), LLM_PROVIDER, LLM_MODEL)
+    memory.embedding_model = PhaseTimed(
+        BatchingEmbedder(
+            memory.embedding_model, EMBED_BATCH_WINDOW_MS, EMBED_BATCH_MAX, concurrency=BULK_EMBED_CONCURRENCY
+        ),
+        "embedding",
+        ("embed", "embed_batch"),
+    )
+    # Chroma: cronometra a coleção (cobre o vector store do mem0 e as consultas diretas do servidor)
+    vector_methods = ("add", "upsert", "query", "get", "update", "delete", "count")
+    if getattr(memory.vector_store, "collection", None) is not None:
+        memory.vector_store.collection = PhaseTimed(memory.vector_store.collection, "vector_query", vector_methods)
+    else:
+        memory.vector_store = PhaseTimed(
+            memory.vector_store, "vector_query", ("search", "insert", "get", "list", "update", "delete")
+        )
+    memory.db = PhaseTimed(memory.db, "history", ("add_history", "batch_add_history"))
+    if EMBEDDING_CACHE_ENABLED:
+        namespace = f"{EMBEDDING_PROVIDER}:{EMBEDDING_MODEL}:{EMBEDDING_DIMS}"
+        if embed_api == "embed":
+            # vetores normalizados do /api/embed não se misturam com os do endpoint legado
+            namespace += ":embed"
+        memory.embedding_model = CachedEmbedder(memory.embedding_model, embedding_cache, namespace)
+    return memory
+
+
+def _swap_llm(provider: str, model: str) -> float:
+    """
+    Troca só o LLM da instância atual: vector store (cliente Chroma), embedder e histórico
+    seguem os mesmos. O novo LLM é criado fora do lock; a atribuição espera as chamadas em
+    andamento (uma extração nunca mistura dois LLMs). Retorna a espera pelo lock em ms.
+    """
+    from mem0.llms.configs import LlmConfig
+    from mem0.utils.factory import LlmFactory
+
+    mem0_instance = _ensure_mem0()
+    config = _llm_config(provider, model)
+    new_llm = LlmFactory.create(provider, dict(config))
+    _use_ollama_pool(new_llm)
+    new_llm = _with_llm_cache(PhaseTimed(new_llm, "llm", ("generate_response",)), provider, model)
+    started = time.perf_counter()
+    with mem0_gate.exclusive():
+        mem0_instance.llm = new_llm
+        mem0_instance.config.llm = LlmConfig(provider=provider, config=config)
+    return (time.perf_counter() - started) * 1000
+
+
+# Gravações do .env fora do caminho da requisição, em ordem (a última troca prevalece)
+_env_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mem0-env")
+
+
+def _write_env_values(values: dict[str, str]):
+    """Substitui as chaves já presentes no .env de forma atômica (arquivo temporário + os.replace)."""
+    env_path = BASE_DIR / ".env"
+    if not env_path.exists():
+        return
+    lines = env_path.read_text(encoding="utf-8").splitlines(keepends=True)
+    for i, line in enumerate(lines):
+        key = line.split("=", 1)[0]
+        if "=" in line and key in values:
+            lines[i] = f"{key}={values[key]}\n"
+    tmp_path = env_path.with_name(f".env.{os.getpid()}.tmp")
+    tmp_path.write_text("".join(lines), encoding="utf-8")
+    os.replace(tmp_path, env_path)
+
+
+def _persist_env_values(values: dict[str, str]):
+    def run():
+        try:
+            _write_env_values(values)
+        except Exception as e:
+            print(f"[WARN] Falha ao gravar o .env: {e}", file=sys.stderr)
+
+    _env_writer.submit(run)
+
+
+# Instância criada sob demanda no primeiro uso (ou pelo warm-up em background, MEM0_WARMUP)
+mem0: "Memory | None" = None
+_mem0_init_lock = threading.Lock()
+
+
+def _ensure_mem0() -> "Memory":
+    """Retorna a instância do mem0, construindo-a na primeira chamada (thread-safe)."""
+    global mem0
+    if mem0 is not None:
+        return mem0
+    with _mem0_init_lock:
+        if mem0 is None:
+            started = time.perf_counter()
+            # import medido separadamente da construção
+            _propagate_context(importlib.import_module("mem0.memory.main"))
+            imported = time.perf_counter()
+            instance = build_mem0()
+            _mark_startup_phase("mem0: import", (imported - started) * 1000)
+            _mark_startup_phase("mem0: build (Chroma, embedder, LLM)", (time.perf_counter() - imported) * 1000)
+            mem0 = instance
+    return mem0
+
+
+def _warm_up_in_background():
+    """Constrói o mem0 fora do caminho da primeira requisição."""
+    def run():
+        try:
+            _ensure_mem0()
+        except Exception as e:
+            print(f"[WARN] Warm-up do mem0 falhou: {e}", file=sys.stderr)
+
+    threading.Thread(target=run, name="mem0-warmup", daemon=True).start()
+
+
+# --- Métricas -------------------------------------------------------------------
+# Cada chamada de tool carrega um PhaseTimes num contextvar; os componentes do mem0
+# (envolvidos por PhaseTimed) e os caches somam nele o tempo de cada fase. Ao final, a
+# latência total e a de cada fase alimentam os histogramas expostos em GET /metrics.
+# Com TRACING_ENABLED o mesmo PhaseTimes guarda os spans, e as chamadas lentas vão
+# para o slow-call log (get_slow_calls).
+
+class PhaseTimes:
+    """
+    Tempo acumulado por fase de uma chamada (somado pelas threads do pool e do mem0).
+    Com tracing, guarda também um span por trecho medido (até TRACE_MAX_SPANS).
+    """
+
+    def __init__(self, trace: bool = False):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.seconds: dict[str, float] = {}
+        self.spans: list[dict] | None = [] if trace else None
+        self.dropped_spans = 0
+
+    def add(self, phase: str, seconds: float, started: float | None = None, op: str | None = None):
+        with self._lock:
+            self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+            if self.spans is None:
+                return
+            if len(self.spans) >= TRACE_MAX_SPANS:
+                self.dropped_spans += 1
+                return
+            self.spans.append({
+                "phase": phase,
+                "op": op,
+                "start_ms": round(((started or self.started) - self.started) * 1000, 2),
+                "ms": round(seconds * 1000, 2),
+                "thread": threading.current_thread().name,
+            })
+
+
+_call_phases: contextvars.ContextVar[PhaseTimes | None] = contextvars.ContextVar("call_phases", default=None)
+_active_phase: contextvars.ContextVar[str | None] = contextvars.ContextVar("active_phase", default=None)
+
+
+@contextmanager
+def _phase(name: str, op: str | None = None):
+    """
+    Soma o tempo do trecho na fase `name` da chamada atual (e, com tracing, registra o span
+    da operação `op`). Fora de uma chamada de tool ou dentro de outra fase (ex.: consulta ao
+    Chroma feita pelo vector store) não mede nada: o tempo fica com a fase mais externa.
+    """
+    phases = _call_phases.get()
+    if phases is None or _active_phase.get() is not None:
+        yield
+        return
+    token = _active_phase.set(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases.add(name, time.perf_counter() - started, started, op)
+        _active_phase.reset(token)
+
+
+class PhaseTimed:
+    """Proxy que cronometra os métodos indicados do componente na fase `phase`."""
+
+    def __init__(self, inner, phase: str, methods: tuple[str, ...]):
+        self.inner = inner
+        self.phase = phase
+        self.methods = frozenset(methods)
+
+    def __getattr__(self, name):
+        attr = getattr(self.inner, name)
+        if name not in self.methods or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def timed(*args, **kwargs):
+            with _phase(self.phase, name):
+                return attr(*args, **kwargs)
+
+        return timed
+
+
+class _ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor que executa cada tarefa no contexto (contextvars) de quem a submeteu."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def _propagate_context(module) -> bool:
+    """
+    Memory.add/search/get_all rodam o trabalho num ThreadPoolExecutor próprio do mem0: troca o
+    executor visto pelo módulo por um que propaga os contextvars, para que as fases medidas
+    nessas threads sejam atribuídas ao tool que as disparou. Cobre `import concurrent.futures`
+    e `from concurrent.futures import ThreadPoolExecutor`; se o mem0 mudar a forma de criar o
+    executor, avisa no stderr (as fases dessas threads passam a cair em "other") e retorna False.
+    Validado contra a versão do mem0 fixada em requirements.txt.
+    """
+    patched = False
+    if getattr(module, "concurrent", None) is concurrent:
+        futures = types.ModuleType(concurrent.futures.__name__)
+        futures.__dict__.update(vars(concurrent.futures))
+        futures.ThreadPoolExecutor = _ContextThreadPoolExecutor
+        module.concurrent = types.SimpleNamespace(futures=futures)
+        patched = True
+    if getattr(module, "ThreadPoolExecutor", None) is concurrent.futures.ThreadPoolExecutor:
+        module.ThreadPoolExecutor = _ContextThreadPoolExecutor
+        patched = True
+    if not patched and not _context_propagated(module):
+        print(
+            f"[WARN] {module.__name__} não usa concurrent.futures.ThreadPoolExecutor como esperado: "
+            "o tempo das threads internas do mem0 não será atribuído às fases dos tools.",
+            file=sys.stderr,
+        )
+    return patched or _context_propagated(module)
+
+
+def _context_propagated(module) -> bool:
+    """True quando o executor visto pelo módulo já propaga os contextvars."""
+    executor = getattr(getattr(getattr(module, "concurrent", None), "futures", None), "ThreadPoolExecutor", None)
+    return executor is _ContextThreadPoolExecutor or getattr(module, "ThreadPoolExecutor", None) is _ContextThreadPoolExecutor
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels) + "}"
+
+
+class Histogram:
+    """Histograma no formato de exposição do Prometheus (buckets cumulativos, _sum e _count)."""
+
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...]):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, labels: tuple[tuple[str, str], ...], value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        for labels, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels((*labels, ('le', le)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Counter:
+    """Contador monotônico por conjunto de labels (formato do Prometheus)."""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, labels: tuple[tuple[str, str], ...], amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_format_labels(labels)} {value}" for labels, value in values)
+        return lines
+
+
+tool_latency = Histogram(
+    "mem0_tool_duration_seconds", "Latency of MCP tool calls (queue wait included).", METRICS_BUCKETS_SECONDS
+)
+tool_phase_latency = Histogram(
+    "mem0_tool_phase_duration_seconds",
+    "Time spent per phase inside MCP tool calls (other = not attributed to a phase).",
+    METRICS_BUCKETS_SECONDS,
+)
+tool_calls = Counter("mem0_tool_calls_total", "MCP tool calls by outcome.")
+
+
+@contextmanager
+def _track_tool(name: str, arguments: dict | None = None):
+    """
+    Mede uma chamada de tool: latência total, tempo por fase e resultado (ok/error) para as
+    métricas e, com tracing, grava no slow-call log as chamadas acima de TRACE_SLOW_MS.
+    """
+    if not (METRICS_ENABLED or TRACING_ENABLED):
+        yield None
+        return
+    phases = PhaseTimes(trace=TRACING_ENABLED)
+    token = _call_phases.set(phases)
+    outcome = {"status": "error"}
+    started = time.perf_counter()
+    try:
+        yield outcome
+    finally:
+        elapsed = time.perf_counter() - started
+        _call_phases.reset(token)
+        with phases._lock:
+            spent = dict(phases.seconds)
+            spans = list(phases.spans) if phases.spans is not None else None
+        spent["other"] = max(0.0, elapsed - sum(spent.values()))
+        if METRICS_ENABLED:
+            labels = (("tool", name),)
+            tool_latency.observe(labels, elapsed)
+            tool_calls.inc((("tool", name), ("status", outcome["status"])))
+            for phase, seconds in spent.items():
+                tool_phase_latency.observe((("tool", name), ("phase", phase)), seconds)
+        if TRACING_ENABLED and elapsed * 1000 >= TRACE_SLOW_MS:
+            slow_call_log.record({
+                "ts": datetime.now().astimezone().isoformat(),
+                "tool": name,
+                "duration_ms": round(elapsed * 1000, 2),
+                "status": outcome["status"],
+                "args": _hash_arguments(arguments or {}),
+                "phases_ms": {phase: round(seconds * 1000, 2) for phase, seconds in spent.items()},
+                "spans": spans,
+                "dropped_spans": phases.dropped_spans,
+            })
+
+
+def _hash_arguments(arguments: dict) -> dict:
+    """Resumo não reversível dos argumentos (hash curto + tamanho): o conteúdo nunca vai para o log."""
+    hashed = {}
+    for key, value in arguments.items():
+        if value is None:
+            hashed[key] = None
+            continue
+        raw = json.dumps(value, sort_keys=True, default=str, ensure_ascii=False)
+        entry = {"sha256": hashlib.sha256(raw.encode()).hexdigest()[:16]}
+        if isinstance(value, (str, list, tuple, dict)):
+            entry["size"] = len(value)
+        hashed[key] = entry
+    return hashed
+
+
+class SlowCallLog:
+    """
+    Log JSONL das chamadas lentas (uma linha por chamada, com fases e spans), rotacionado por
+    tamanho em `backups` arquivos (.1 = o mais recente). A escrita roda num executor de uma
+    thread, fora do caminho da requisição.
+    """
+
+    def __init__(self, path: str, max_bytes: int, backups: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mem0-trace")
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.write_errors = 0
+
+    def record(self, entry: dict):
+        with self._lock:
+            self.recorded += 1
+        self._writer.submit(self._write, entry)
+
+    def flush(self):
+        """Espera as gravações pendentes (get_slow_calls lê o arquivo logo em seguida)."""
+        self._writer.submit(lambda: None).result()
+
+    def _write(self, entry: dict):
+        line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+        try:
+            if self.max_bytes > 0 and self.path.exists() and self.path.stat().st_size + len(line) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            with self._lock:
+                self.write_errors += 1
+            print(f"[WARN] Falha ao gravar o slow-call log: {e}", file=sys.stderr)
+
+    def _backup(self, index: int) -> Path:
+        return self.path.with_name(f"{self.path.name}.{index}")
+
+    def _rotate(self):
+        if self.backups <= 0:
+            self.path.unlink(missing_ok=True)
+            return
+        self._backup(self.backups).unlink(missing_ok=True)
+        for index in range(self.backups - 1, 0, -1):
+            if self._backup(index).exists():
+                os.replace(self._backup(index), self._backup(index + 1))
+        os.replace(self.path, self._backup(1))
+
+    def read(self) -> list[dict]:
+        """Entradas do log atual e dos backups, da mais antiga para a mais recente."""
+        entries = []
+        for file in [self._backup(i) for i in range(self.backups, 0, -1)] + [self.path]:
+            if not file.exists():
+                continue
+            with open(file, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+        return entries
+
+
+slow_call_log = SlowCallLog(TRACE_SLOW_LOG_PATH, max_bytes=TRACE_SLOW_LOG_MAX_BYTES, backups=TRACE_SLOW_LOG_BACKUPS)
+
+
+def _gauge(name: str, help_text: str, samples: list[tuple[tuple[tuple[str, str], ...], Any]], kind: str = "gauge") -> list[str]:
+    """Renderiza uma métrica calculada na hora da coleta (valores None são omitidos)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{_format_labels(labels)} {float(value)}" for labels, value in samples if value is not None)
+    return lines
+
+
+def render_metrics() -> str:
+    """Texto de exposição do Prometheus: histogramas dos tools e contadores dos caches/filas."""
+    lines = tool_latency.render() + tool_phase_latency.render() + tool_calls.render()
+
+    search = search_cache.stats()
+    lines += _gauge("mem0_search_cache_hits_total", "Search cache hits.", [((), search["hits"])], "counter")
+    lines += _gauge("mem0_search_cache_misses_total", "Search cache misses.", [((), search["misses"])], "counter")
+    lines += _gauge("mem0_search_cache_hit_ratio", "Search cache hit ratio.", [((), search["hit_ratio"])])
+    lines += _gauge("mem0_search_cache_entries", "Search cache entries.", [((), search["entries"])])
+    if EMBEDDING_CACHE_ENABLED:
+        emb = embedding_cache.stats()
+        lines += _gauge("mem0_embedding_cache_hits_total", "Embedding cache hits.", [
+            ((("tier", "memory"),), emb["memory_hits"]), ((("tier", "disk"),), emb["disk_hits"]),
+        ], "counter")
+        lines += _gauge("mem0_embedding_cache_misses_total", "Embedding cache misses.", [((), emb["misses"])], "counter")
+        lines += _gauge("mem0_embedding_cache_hit_ratio", "Embedding cache hit ratio.", [((), emb["hit_ratio"])])
+    if LLM_CACHE_ENABLED:
+        llm = llm_cache.stats()
+        kinds = llm["kinds"]
+        lines += _gauge("mem0_llm_cache_hits_total", "LLM extraction cache hits.", [
+            ((("kind", k),), c["hits"]) for k, c in kinds.items()
+        ], "counter")
+        lines += _gauge("mem0_llm_cache_misses_total", "LLM extraction cache misses.", [
+            ((("kind", k),), c["misses"]) for k, c in kinds.items()
+        ], "counter")
+        lines += _gauge("mem0_llm_cache_hit_ratio", "LLM extraction cache hit ratio.", [((), llm["hit_ratio"])])
+        lines += _gauge("mem0_llm_cache_saved_seconds_total", "Model time saved by LLM cache hits.", [
+            ((), llm["saved_ms"] / 1000)
+        ], "counter")
+    batcher = _embedding_batcher()
+    if batcher is not None:
+        batching = batcher.stats()
+        lines += _gauge("mem0_embedding_requests_total", "Embedding requests seen by the batcher.", [
+            ((), batching["requests"])
+        ], "counter")
+        lines += _gauge("mem0_embedding_coalesced_total", "Embedding requests served by an in-flight call.", [
+            ((), batching["coalesced"])
+        ], "counter")
+        lines += _gauge("mem0_embedding_batch_calls_total", "Batched embedding calls sent to the provider.", [
+            ((), batching["batch_calls"])
+        ], "counter")
+        lines += _gauge("mem0_embedding_single_calls_total", "Unbatched embedding calls (provider without batch API).", [
+            ((), batching["single_calls"])
+        ], "counter")
+
+    fallback = infer_fallback_stats.stats()
+    lines += _gauge("mem0_infer_writes_total", "Writes with LLM extraction.", [((), fallback["infer_writes"])], "counter")
+    lines += _gauge("mem0_infer_fallbacks_total", "Writes where the LLM extracted nothing (raw fallback).", [
+        ((), fallback["fallbacks"])
+    ], "counter")
+    lines += _gauge("mem0_infer_fallback_ratio", "Share of LLM writes that fell back to raw.", [
+        ((), fallback["fallback_ratio"])
+    ])
+
+    pools = {name: pool.stats() for name, pool in tool_pools.items()}
+    lines += _gauge("mem0_tool_pool_queued", "Tool calls waiting for a worker.", [
+        ((("pool", name),), p["queued"]) for name, p in pools.items()
+    ])
+    lines += _gauge("mem0_tool_pool_active", "Tool calls running.", [
+        ((("pool", name),), p["active"]) for name, p in pools.items()
+    ])
+    jobs = _job_queue_stats()
+    lines += _gauge("mem0_inference_queue_pending", "Background LLM extraction jobs pending.", [((), jobs["pending"])])
+    lines += _gauge("mem0_inference_queue_capacity", "Background LLM extraction queue capacity.", [((), jobs["capacity"])])
+    return "\n".join(lines) + "\n"
+
+
+# --- MCP Server & Tools ------------------------------------------------------
+
+mcp = FastMCP("mem0-lite")
+
+
+class ToolPool:
+    """
+    ThreadPoolExecutor com limite de concorrência e métricas de fila:
+    enfileirados, em execução, concluídos, falhas e tempo de espera/execução.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"mem0-{name}")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_ms_total = 0.0
+        self.run_ms_total = 0.0
+
+    async def run(self, fn, *args, **kwargs):
+        """Executa fn no pool sem bloquear o event loop (preserva contextvars)."""
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        ctx = contextvars.copy_context()
+
+        def call():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+                self.wait_ms_total += (started - submitted) * 1000
+            phases = ctx.get(_call_phases)
+            if phases is not None:
+                phases.add("queue_wait", started - submitted, submitted)
+            ok = False
+            try:
+                result = ctx.run(fn, *args, **kwargs)
+                ok = True
+                return result
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.run_ms_total += (time.perf_counter() - started) * 1000
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "max_workers": self.max_workers,
+                "active": self.active,
+                "queued": self.queued,
+                "max_queued": self.max_queued,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": round(self.wait_ms_total / finished, 2) if finished else 0.0,
+                "avg_run_ms": round(self.run_ms_total / finished, 2) if finished else 0.0,
+            }
+
 
-mem0 = build_mem0()
+tool_pools = {
+    "write": ToolPool("write", TOOL_WRITE_WORKERS),
+    "read": ToolPool("read", TOOL_READ_WORKERS),
+}
 
-# --- MCP Server & Tools ------------------------------------------------------
 
-mcp = FastMCP("mem0-lite")
+def _tool(pool: str, guard: bool = True, write_users=None):
+    """
+    Registra a função como tool MCP executada no pool indicado ("read" ou "write").
+    O MCP recebe um wrapper async; a função síncrona original é devolvida para
+    chamadas internas (rotas /_test, benchmarks, scripts).
+    Com guard, a chamada segura o mem0 em modo compartilhado e, nos tools de escrita
+    com user_id, o lock de escrita do usuário. Sem guard, roda fora dos pools
+    (asyncio.to_thread): não entra na fila atrás das chamadas que reporta ou
+    coordena. `write_users(*args, **kwargs)` informa os usuários a travar quando
+    a escrita não se limita ao user_id (ex.: lotes).
+    """
+    executor = tool_pools[pool]
+
+    def decorator(fn):
+        params = list(inspect.signature(fn).parameters)
+        per_user = pool == "write" and "user_id" in params
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            arguments = {**dict(zip(params, args)), **kwargs} if TRACING_ENABLED else None
+            with _track_tool(fn.__name__, arguments) as outcome:
+                if not guard:
+                    result = await asyncio.to_thread(fn, *args, **kwargs)
+                else:
+                    if write_users is not None:
+                        write_user = write_users(*args, **kwargs)
+                    else:
+                        write_user = _resolve_user_id(kwargs.get("user_id")) if per_user else None
+                    result = await executor.run(_call_guarded, write_user, fn, *args, **kwargs)
+                if outcome is not None:
+                    outcome["status"] = "error" if isinstance(result, dict) and result.get("status") == "error" else "ok"
+                return result
+
+        mcp.tool()(wrapper)
+        return fn
+
+    return decorator
+
 
-@mcp.tool()
+@_tool("write")
 def add_memory(
     text: str,
     user_id: str | None = None,
     tags: list[str] | None = None,
-    metadata: dict[str, Any] | None = None
+    metadata: dict[str, Any] | None = None,
+    mode: str | None = None
 ) -> dict:
     """
     Adds a new memory to the vector store.
@@ -385,46 +3507,36 @@ def add_memory(
     Args:
         text: The content to store
         user_id: User identifier for memory isolation (defaults to DEFAULT_USER_ID env or USERNAME)
-        tags: List of tags for categorization (stored as CSV in metadata)
+        tags: List of tags for categorization; each one is stored as a boolean "tag:<name>" metadata key
+            (filterable directly in the vector store) and in the memory_tags index (hierarchical prefixes)
         metadata: Additional metadata (lists are converted to CSV strings)
+        mode: "infer" (waits for LLM extraction), "infer_async" (stores the raw text
+            immediately and runs the LLM extraction in background), "raw" (embedding only,
+            no LLM) or "auto" (raw for short structured text, infer otherwise) - defaults to ADD_MEMORY_MODE env
 
     Returns:
-        Dictionary with memory details including id, hash, created_at
+        Dictionary with memory details including id, hash, created_at and the effective mode.
+        In "infer_async" mode also returns job_id (poll with get_memory_job_status).
     """
-    if mem0 is None:
-        raise RuntimeError("Mem0 not initialized")
+    _ensure_mem0()
 
     user_id = _resolve_user_id(user_id)
+    mode = (mode or ADD_MEMORY_MODE).strip().lower()
+    if mode not in ADD_MODES:
+        return {"status": "error", "message": f"Invalid mode '{mode}'. Must be one of: {', '.join(sorted(ADD_MODES))}"}
+    mode = _resolve_add_mode(mode, text)
 
     # Normalize tags to list if a string was provided by the client
-    normalized_tags: list[str] | None = None
-    if isinstance(tags, str):
-        normalized_tags = [tags]
-    elif isinstance(tags, list):
-        normalized_tags = tags
+    meta = _merge_tags_into_metadata(tags, metadata)
 
-    meta = _flatten_metadata(metadata) or {}
-    if normalized_tags:
-        meta["tags"] = ",".join(normalized_tags)
+    if mode == "infer_async":
+        return {**_enqueue_memory_job(text, user_id, meta), "mode": mode}
 
-    result = mem0.add(
-        text,
-        user_id=user_id,
-        metadata=meta if meta else None,
-        infer=MEM0_INFER
-    )
-    clean = json.loads(json.dumps(result, default=str))
-
-    # Se infer=True retornou results vazio, tenta novamente com infer=False
-    # Isso acontece quando o LLM decide que não há informação relevante
-    if MEM0_INFER and isinstance(clean.get("results"), list) and not clean["results"]:
-        result = mem0.add(
-            text,
-            user_id=user_id,
-            metadata=meta if meta else None,
-            infer=False
-        )
-        clean = json.loads(json.dumps(result, default=str))
+    # Se o LLM decidir que não há informação relevante, o texto é gravado bruto
+    if mode == "raw":
+        clean = _add_raw_memory(text, user_id, meta if meta else None)
+    else:
+        clean = _add_inferred_memory(text, user_id, meta if meta else None)
 
     # Normalize id for clients that expect a flat payload
     if isinstance(clean, dict) and "id" not in clean:
@@ -437,12 +3549,136 @@ def add_memory(
             clean["id"] = nested["id"]
 
     # Limpa cache após adicionar nova memória
-    _clear_cache()
+    search_cache.invalidate(user_id, meta.get("rule_type"))
 
+    clean["mode"] = mode
     return clean
 
 
-@mcp.tool()
+def _bulk_write_users(
+    items: list[dict[str, Any]] | None = None,
+    user_id: str | None = None,
+    batch_size: int | None = None
+) -> list[str]:
+    """Usuários escritos por um lote (user_id de cada item ou o padrão do lote), para o lock de escrita."""
+    default_user_id = _resolve_user_id(user_id)
+    return sorted({
+        _resolve_user_id(item.get("user_id") or default_user_id) if isinstance(item, dict) else default_user_id
+        for item in items or []
+    } or {default_user_id})
+
+
+@_tool("write", write_users=_bulk_write_users)
+def add_memories_bulk(
+    items: list[dict[str, Any]],
+    user_id: str | None = None,
+    batch_size: int | None = None
+) -> dict:
+    """
+    Adds many memories at once, embedding them in batches and writing one vector store insert per batch.
+    No LLM extraction is performed (raw ingestion, like MEM0_INFER=false).
+
+    Args:
+        items: List of {"text": str, "tags": list[str], "metadata": dict, "user_id": str (optional)}
+        user_id: Default user identifier for items without user_id (defaults to DEFAULT_USER_ID env or USERNAME)
+        batch_size: Items per embedding/insert batch (defaults to BULK_EMBED_BATCH_SIZE env)
+
+    Returns:
+        Dictionary with per-item status (by index), counts and throughput (items/s)
+    """
+    _ensure_mem0()
+
+    default_user_id = _resolve_user_id(user_id)
+    batch_size = max(int(batch_size or BULK_EMBED_BATCH_SIZE), 1)
+    started = time.perf_counter()
+
+    results: list[dict | None] = [None] * len(items or [])
+    prepared = []
+    for index, item in enumerate(items or []):
+        text = item.get("text") if isinstance(item, dict) else None
+        if not isinstance(text, str) or not text.strip():
+            results[index] = {"index": index, "status": "error", "message": "Missing 'text'"}
+            continue
+        item_user_id = _resolve_user_id(item.get("user_id") or default_user_id)
+        meta = _merge_tags_into_metadata(item.get("tags"), item.get("metadata"))
+        prepared.append((index, text, _build_memory_payload(text, item_user_id, meta)))
+
+    for start in range(0, len(prepared), batch_size):
+        batch = prepared[start:start + batch_size]
+        texts = [text for _, text, _ in batch]
+        try:
+            vectors = _embed_texts(mem0.embedding_model, texts)
+            ids = _insert_memory_batch(texts, vectors, [payload for _, _, payload in batch])
+        except Exception as e:
+            for index, _, _ in batch:
+                results[index] = {"index": index, "status": "error", "message": str(e)}
+            continue
+        for (index, _, payload), memory_id in zip(batch, ids):
+            results[index] = {"index": index, "status": "added", "id": memory_id, "user_id": payload["user_id"]}
+
+    # Uma única invalidação para o lote inteiro (por usuário afetado)
+    for affected_user in {payload["user_id"] for _, _, payload in prepared}:
+        search_cache.invalidate(affected_user)
+
+    elapsed = time.perf_counter() - started
+    added = sum(1 for r in results if r and r["status"] == "added")
+    return {
+        "status": "completed",
+        "added": added,
+        "failed": len(results) - added,
+        "results": results,
+        "batch_size": batch_size,
+        "elapsed_seconds": round(elapsed, 3),
+        "items_per_second": round(added / elapsed, 2) if elapsed > 0 else None,
+    }
+
+
+@_tool("read")
+def get_memory_job_status(
+    job_id: str | None = None,
+    user_id: str | None = None,
+    status: str | None = None,
+    limit: int = 20
+) -> dict:
+    """
+    Reports progress of background LLM extraction jobs created with mode="infer_async"
+    (add_memory, add_plan, add_programming_rule).
+
+    Args:
+        job_id: Specific job to inspect (if omitted, lists recent jobs of the user)
+        user_id: User identifier (defaults to DEFAULT_USER_ID env or USERNAME)
+        status: Optional filter (pending, running, done, failed)
+        limit: Maximum number of jobs to list
+
+    Returns:
+        Dictionary with the job(s) and the current queue state
+    """
+    conn = _state_db()
+    if job_id:
+        row = conn.execute("SELECT * FROM memory_jobs WHERE job_id=?", (job_id,)).fetchone()
+        if not row:
+            return {"status": "not_found", "job_id": job_id, "queue": _job_queue_stats()}
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job.pop("metadata", None)
+        return {"status": "ok", "job": job, "queue": _job_queue_stats()}
+
+    user_id = _resolve_user_id(user_id)
+    sql = (
+        "SELECT job_id, memory_id, status, attempts, next_attempt_at, error, created_at, updated_at "
+        "FROM memory_jobs WHERE user_id=?"
+    )
+    params: list[Any] = [user_id]
+    if status:
+        sql += " AND status=?"
+        params.append(status)
+    sql += " ORDER BY created_at DESC LIMIT ?"
+    params.append(limit)
+    jobs = [dict(r) for r in conn.execute(sql, params)]
+    return {"status": "ok", "jobs": jobs, "total": len(jobs), "queue": _job_queue_stats()}
+
+
+@_tool("read")
 def search_memory(
     query: str,
     user_id: str | None = None,
@@ -457,7 +3693,7 @@ def search_memory(
     Args:
         query: Search query text
         user_id: User identifier for memory isolation (defaults to DEFAULT_USER_ID env or USERNAME)
-        tags: List of tags for OR filtering (searches across all provided tags)
+        tags: List of tags for OR filtering (searches across all provided tags; "python.django.*" matches the whole subtree)
         filters: Additional metadata filters (e.g., {"priority": "should", "owner": "john"})
         limit: Maximum number of results to return
         offset: Number of results to skip (for pagination)
@@ -465,8 +3701,7 @@ def search_memory(
     Returns:
         Dictionary with "results" key containing matched memories with scores
     """
-    if mem0 is None:
-        raise RuntimeError("Mem0 not initialized")
+    _ensure_mem0()
 
     user_id = _resolve_user_id(user_id)
 
@@ -478,92 +3713,203 @@ def search_memory(
         if tags:
             cache_filters["_tags"] = ",".join(sorted(tags))
         cache_key = _make_cache_key(f"{query}:{user_id}", cache_filters, limit)
-        cached = _get_from_cache(cache_key)
+        with _phase("cache_lookup", "search_cache"):
+            cached = search_cache.get(cache_key)
         if cached:
             return cached
+    generation = search_cache.generation(user_id)
 
-    # Single tag or no tags: direct search
-    if not tags or len(tags) <= 1:
-        if tags and len(tags) == 1:
-            base_filters["tags"] = tags[0]
+    # No tags: direct search
+    if not tags:
         results = mem0.search(query, user_id=user_id, filters=base_filters if base_filters else None, limit=limit + offset)
         # Apply offset and limit after search
         items = results.get("results", results) if isinstance(results, dict) else results
         paginated = items[offset:offset + limit] if isinstance(items, list) else items
-        response = {"results": json.loads(json.dumps(paginated, default=str)), "total": len(items) if isinstance(items, list) else 0, "offset": offset, "limit": limit}
+        response = {"results": _strip_tag_keys(_jsonable(paginated)), "total": len(items) if isinstance(items, list) else 0, "offset": offset, "limit": limit}
 
         # Armazena no cache se offset == 0
         if offset == 0:
-            _put_in_cache(cache_key, response)
+            search_cache.put(
+                cache_key, response, user_id=user_id, rule_type=base_filters.get("rule_type"), generation=generation
+            )
 
         return response
 
-    # Multiple tags: OR logic via multiple searches
-    partials = []
-    for tag in tags:
-        filt = base_filters.copy()
-        filt["tags"] = tag
-        res = mem0.search(query, user_id=user_id, filters=filt, limit=limit + offset)
-        items = res.get("results", res) if isinstance(res, dict) else res
-        partials.append(items)
-
-    merged = _merge_results_or(partials, limit=limit + offset)
+    # Tags: OR lógico numa única busca vetorial sobre o índice tag:<nome> (aceita 'a.b.*')
+    tag_filter = _tags_or_filter(tags, user_id)
+    if tag_filter is None:
+        return {"results": [], "total": 0, "offset": offset, "limit": limit}
+    filt = base_filters.copy()
+    filt.update(tag_filter)
+    res = mem0.search(query, user_id=user_id, filters=filt, limit=limit + offset)
+    items = res.get("results", res) if isinstance(res, dict) else res
+    if not isinstance(items, list):
+        items = []
+
+    # Mantém a mesma ordenação/deduplicação da antiga união de N buscas
+    merged = _merge_results_or([items], limit=limit + offset) if len(tags) > 1 else items
     # Apply offset and limit after merge
     paginated = merged[offset:offset + limit]
-    response = {"results": json.loads(json.dumps(paginated, default=str)), "total": len(merged), "offset": offset, "limit": limit}
+    response = {"results": _strip_tag_keys(_jsonable(paginated)), "total": len(merged), "offset": offset, "limit": limit}
 
     # Armazena no cache se offset == 0
     if offset == 0:
-        _put_in_cache(cache_key, response)
+        search_cache.put(
+            cache_key, response, user_id=user_id, rule_type=base_filters.get("rule_type"), generation=generation
+        )
 
     return response
 
 
-@mcp.tool()
-def list_memories(user_id: str | None = None, limit: int = 100, offset: int = 0) -> dict:
+_MEMORY_PROMOTED_KEYS = ("user_id", "agent_id", "run_id", "actor_id", "role")
+_MEMORY_CORE_KEYS = {"data", "hash", "created_at", "updated_at", "id", *_MEMORY_PROMOTED_KEYS}
+
+
+def _format_memory_item(memory_id: str, payload: dict, fields: list[str] | None = None) -> dict:
+    """Formata um payload do vector store como o mem0.get_all, com projeção opcional de campos."""
+    payload = payload or {}
+    item = {
+        "id": memory_id,
+        "memory": payload.get("data", ""),
+        "hash": payload.get("hash"),
+        "created_at": payload.get("created_at"),
+        "updated_at": payload.get("updated_at"),
+    }
+    for key in _MEMORY_PROMOTED_KEYS:
+        if key in payload:
+            item[key] = payload[key]
+    metadata = {
+        k: v for k, v in payload.items()
+        if k not in _MEMORY_CORE_KEYS and not k.startswith(TAG_KEY_PREFIX)
+    }
+    if metadata:
+        item["metadata"] = metadata
+    if not fields:
+        return item
+    # Projeção: campos do item ou chaves do metadata (o id sempre acompanha)
+    projected = {"id": memory_id}
+    for field in fields:
+        if field in item:
+            projected[field] = item[field]
+        elif field in metadata:
+            projected[field] = metadata[field]
+    return projected
+
+
+def _encode_list_cursor(created_us: int, memory_id: str) -> str:
+    return f"{created_us}:{memory_id}"
+
+
+def _decode_list_cursor(cursor: str) -> tuple[int, str] | None:
+    created_us, sep, memory_id = (cursor or "").partition(":")
+    if not sep or not memory_id or not created_us.isdigit():
+        return None
+    return int(created_us), memory_id
+
+
+@_tool("read")
+def list_memories(
+    user_id: str | None = None,
+    limit: int = 100,
+    offset: int = 0,
+    cursor: str | None = None,
+    fields: list[str] | None = None
+) -> dict:
     """
-    Lists all memories for a specific user (defaults to DEFAULT_USER_ID env or USERNAME).
+    Lists memories for a specific user (defaults to DEFAULT_USER_ID env or USERNAME), oldest first.
 
     Args:
         user_id: User identifier (defaults to DEFAULT_USER_ID env or USERNAME)
         limit: Maximum number of memories to return
         offset: Number of memories to skip (for pagination)
+        cursor: Opaque token from a previous "next_cursor" (stable keyset pagination; ignores offset)
+        fields: Optional projection (e.g. ["memory", "created_at", "tags"]); item fields or metadata keys
 
     Returns:
-        Dictionary with "memories" key containing paginated memories for the user
+        Dictionary with "memories" key containing the page, "total" for the user and "next_cursor"
     """
-    if mem0 is None:
-        raise RuntimeError("Mem0 not initialized")
+    _ensure_mem0()
 
     user_id = _resolve_user_id(user_id)
+    limit = max(0, limit)
+    offset = max(0, offset)
+    collection = mem0.vector_store.collection
+
+    if not _memory_index_ready():
+        # Índice ainda em migração: pagina direto no Chroma (ordem de inserção, sem cursor)
+        if cursor:
+            return {"status": "error", "message": "Cursor pagination is unavailable until the memory index is built (rebuild_memory_index)"}
+        where = {"user_id": {"$eq": user_id}}
+        page = collection.get(where=where, limit=limit, offset=offset, include=["metadatas"])
+        memories = [
+            _format_memory_item(mid, meta, fields)
+            for mid, meta in zip(page.get("ids") or [], page.get("metadatas") or [])
+        ]
+        total = len(collection.get(where=where, include=[]).get("ids") or [])
+        return {
+            "memories": _jsonable(memories),
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "next_cursor": None
+        }
 
-    memories = mem0.get_all(user_id=user_id)
-    # Apply pagination
-    total = len(memories) if isinstance(memories, list) else 0
-    if isinstance(memories, list):
-        paginated = memories[offset:offset + limit]
+    conn = _state_db()
+    if cursor:
+        position = _decode_list_cursor(cursor)
+        if position is None:
+            return {"status": "error", "message": f"Invalid cursor '{cursor}'"}
+        rows = conn.execute(
+            "SELECT memory_id, created_us FROM memory_index WHERE user_id=? AND (created_us, memory_id) > (?, ?) "
+            "ORDER BY created_us, memory_id LIMIT ?",
+            (user_id, *position, limit),
+        ).fetchall()
     else:
-        paginated = memories
+        rows = conn.execute(
+            "SELECT memory_id, created_us FROM memory_index WHERE user_id=? "
+            "ORDER BY created_us, memory_id LIMIT ? OFFSET ?",
+            (user_id, limit, offset),
+        ).fetchall()
+    total = conn.execute("SELECT COUNT(*) FROM memory_index WHERE user_id=?", (user_id,)).fetchone()[0]
+
+    page_ids = [r["memory_id"] for r in rows]
+    payloads = {}
+    if page_ids:
+        page = collection.get(ids=page_ids, include=["metadatas"])
+        payloads = dict(zip(page.get("ids") or [], page.get("metadatas") or []))
+    memories = [_format_memory_item(mid, payloads[mid], fields) for mid in page_ids if mid in payloads]
+    next_cursor = _encode_list_cursor(rows[-1]["created_us"], rows[-1]["memory_id"]) if len(rows) == limit and limit else None
 
     return {
-        "memories": json.loads(json.dumps(paginated, default=str)),
+        "memories": _jsonable(memories),
         "total": total,
-        "offset": offset,
-        "limit": limit
+        "offset": None if cursor else offset,
+        "limit": limit,
+        "next_cursor": next_cursor
     }
 
 
-@mcp.tool()
+@_tool("read")
 def list_all_user_ids() -> dict:
     """
     Lists all distinct user_ids that have stored memories.
     Useful to discover which users have data in the system.
 
     Returns:
-        Dictionary with "user_ids" list and total count per user
+        Dictionary with "user_ids" list, total count per user and per-user stats
+        (memory/plan/rule counts, approximate storage bytes, last write time)
     """
-    if mem0 is None:
-        raise RuntimeError("Mem0 not initialized")
+    _ensure_mem0()
+
+    if _memory_index_ready():
+        # Tabela user_stats mantida incrementalmente: O(usuários), sem varrer o Chroma
+        rows = _state_db().execute("SELECT * FROM user_stats WHERE memory_count > 0 ORDER BY user_id").fetchall()
+        return {
+            "user_ids": [r["user_id"] for r in rows],
+            "counts": {r["user_id"]: r["memory_count"] for r in rows},
+            "stats": {r["user_id"]: {k: r[k] for k in r.keys() if k != "user_id"} for r in rows},
+            "total_users": len(rows)
+        }
 
     try:
         # Acessa o vector store interno do Mem0 ao invés de criar nova instância
@@ -586,7 +3932,7 @@ def list_all_user_ids() -> dict:
         return {"error": str(e), "user_ids": []}
 
 
-@mcp.tool()
+@_tool("write")
 def delete_memory(memory_id: str, user_id: str | None = None) -> dict:
     """
     Deletes a specific memory by ID.
@@ -598,20 +3944,20 @@ def delete_memory(memory_id: str, user_id: str | None = None) -> dict:
     Returns:
         Dictionary with deletion status
     """
-    if mem0 is None:
-        raise RuntimeError("Mem0 not initialized")
+    _ensure_mem0()
 
     user_id = _resolve_user_id(user_id)
 
     result = mem0.delete(memory_id=memory_id)
+    _unindex_memories([memory_id])
 
     # Limpa cache após deletar
-    _clear_cache()
+    search_cache.invalidate(user_id)
 
-    return {"status": "deleted", "memory_id": memory_id, "user_id": user_id, "result": json.loads(json.dumps(result, default=str))}
+    return {"status": "deleted", "memory_id": memory_id, "user_id": user_id, "result": _jsonable(result)}
 
 
-@mcp.tool()
+@_tool("write")
 def add_plan(
     title: str,
     items: list[str] | None = None,
@@ -619,18 +3965,23 @@ def add_plan(
     priority: str = "normal",
     due_date: str | None = None,
     status: str = "active",
-    user_id: str | None = None
+    user_id: str | None = None,
+    mode: str = "auto"
 ) -> dict:
     """
     Cria um novo plano com checklist.
+    mode: "auto" (padrão: títulos curtos são gravados só com embedding), "raw", "infer" ou "infer_async".
     """
-    if mem0 is None:
-        raise RuntimeError("Mem0 not initialized")
+    _ensure_mem0()
 
     user_id = _resolve_user_id(user_id)
 
     if status not in PLAN_STATUSES:
         return {"status": "error", "message": f"Invalid status '{status}'. Must be one of: {', '.join(sorted(PLAN_STATUSES))}"}
+    mode = (mode or "auto").strip().lower()
+    if mode not in ADD_MODES:
+        return {"status": "error", "message": f"Invalid mode '{mode}'. Must be one of: {', '.join(sorted(ADD_MODES))}"}
+    mode = _resolve_add_mode(mode, title, structured=True)
 
     plan_id = str(uuid4())
     now = datetime.now().isoformat()
@@ -649,107 +4000,213 @@ def add_plan(
     if "planning" not in base_tags:
         base_tags.append("planning")
     expanded_tags = _expand_hierarchical_tags(base_tags)
-    open_items = sum(1 for item in checklist if item.get("status") != "done")
 
-    metadata = {
-        "rule_type": "plan",
+    plan = {
         "plan_id": plan_id,
+        "user_id": user_id,
         "title": title,
         "status": status,
         "priority": priority,
         "due_date": due_date,
-        "open_items": open_items,
-        "total_items": len(checklist),
-        "checklist": json.dumps(checklist),
+        "tags": ",".join(expanded_tags) if expanded_tags else None,
         "created_at": now,
         "updated_at": now,
     }
-    if expanded_tags:
-        metadata["tags"] = ",".join(expanded_tags)
-
-    result = mem0.add(title, user_id=user_id, metadata=metadata, infer=MEM0_INFER)
-    clean = json.loads(json.dumps(result, default=str))
-
-    # Se infer=True retornou results vazio, tenta novamente com infer=False
-    if MEM0_INFER and isinstance(clean.get("results"), list) and not clean["results"]:
-        result = mem0.add(title, user_id=user_id, metadata=metadata, infer=False)
-        clean = json.loads(json.dumps(result, default=str))
-
-    new_id = _extract_id_from_mem0(clean)
-    normalized = _normalize_plan_memory({"id": new_id, "memory": title, "metadata": metadata})
-
-    _clear_cache()
-
-    response = {"status": "added", "plan_id": plan_id, "plan": normalized}
+    metadata = _plan_vector_metadata(plan)
+    _ensure_plan_store()
+
+    job_id = None
+    if mode == "infer_async":
+        # O registro bruto é a âncora do plano; a extração em background só acrescenta fatos
+        clean = _enqueue_memory_job(title, user_id, metadata)
+        if clean.get("status") == "queue_full":
+            return clean
+        job_id = clean["job_id"]
+    elif mode == "raw":
+        clean = _add_raw_memory(title, user_id, metadata)
+    else:
+        clean = _add_inferred_memory(title, user_id, metadata)
+        if _added_memory_id(clean) is None:
+            # O LLM só atualizou memórias já existentes: elas não pertencem ao plano (delete_plan
+            # as apagaria), então a âncora do plano é gravada bruta
+            clean = _add_raw_memory(title, user_id, metadata)
+
+    plan["memory_id"] = _extract_id_from_mem0(clean) if job_id else _added_memory_id(clean)
+    conn = _state_db()
+    with conn:
+        _insert_plan(conn, plan, checklist)
+
+    search_cache.invalidate(user_id, "plan")
+
+    response = {"status": "added", "plan_id": plan_id, "plan": _load_plan(plan_id), "mode": mode}
+    if job_id:
+        response["job_id"] = job_id
     if expanded_tags:
         response["tags"] = expanded_tags
     return response
 
 
-@mcp.tool()
+@_tool("read")
 def list_plans(
     user_id: str | None = None,
     status: str | None = None,
     tag: str | None = None,
     only_open: bool = False,
     limit: int = 20,
-    offset: int = 0
+    offset: int = 0,
+    plan_id: str | None = None,
+    priority: str | None = None,
+    due_from: str | None = None,
+    due_to: str | None = None,
+    sort_by: str = "created_at",
+    sort_order: str = "asc"
 ) -> dict:
     """
     Lista planos do usuário com filtros opcionais.
+
+    Filtros, ordenação e paginação são resolvidos no SQLite (tabelas plans/plan_tags indexadas).
+    tag aceita padrões hierárquicos ('proj.*'); due_from/due_to são datas ISO (YYYY-MM-DD, inclusivas);
+    sort_by: created_at, updated_at, due_date (sem prazo por último) ou priority (urgent > high > normal > low).
     """
-    if mem0 is None:
-        raise RuntimeError("Mem0 not initialized")
+    _ensure_mem0()
 
     user_id = _resolve_user_id(user_id)
-    plans = _plan_memories_for_user(user_id)
-
-    filtered = []
-    for plan in plans:
-        meta = plan.get("metadata") or {}
-        if status and meta.get("status") != status:
-            continue
-        if only_open:
-            open_items = _coerce_int(meta.get("open_items"), None)
-            if open_items is None:
-                checklist = _parse_checklist(meta.get("checklist"))
-                open_items = sum(1 for item in checklist if item.get("status") != "done")
-            if open_items <= 0:
-                continue
-        if tag:
-            tag_list = [t.strip() for t in (meta.get("tags") or "").split(",") if t.strip()]
-            if tag not in tag_list:
-                continue
-        filtered.append(_normalize_plan_memory(plan))
-
-    total = len(filtered)
-    paginated = filtered[offset:offset + limit]
+    if sort_by not in PLAN_SORT_FIELDS:
+        return {"status": "error", "message": f"Invalid sort_by '{sort_by}'. Must be one of: {', '.join(sorted(PLAN_SORT_FIELDS))}"}
+    direction = "DESC" if sort_order.lower() == "desc" else "ASC"
+    _ensure_plan_store()
+
+    where = ["user_id=?"]
+    params: list[Any] = [user_id]
+    if plan_id:
+        where.append("plan_id=?")
+        params.append(plan_id)
+    if status:
+        where.append("status=?")
+        params.append(status)
+    if priority:
+        where.append("priority=?")
+        params.append(priority)
+    if only_open:
+        where.append("open_items > 0")
+    if due_from:
+        where.append("due_date >= ?")
+        params.append(due_from)
+    if due_to:
+        where.append("due_date < date(?, '+1 day')")
+        params.append(due_to)
+    if tag:
+        if tag.endswith(".*"):
+            prefix = tag[:-2]
+            escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            where.append(
+                "plan_id IN (SELECT plan_id FROM plan_tags WHERE user_id=? AND (tag=? OR tag LIKE ? ESCAPE '\\'))"
+            )
+            params.extend([user_id, prefix, f"{escaped}.%"])
+        else:
+            where.append("plan_id IN (SELECT plan_id FROM plan_tags WHERE user_id=? AND tag=?)")
+            params.extend([user_id, tag])
+
+    if sort_by == "priority":
+        rank = " ".join(f"WHEN ? THEN {i}" for i in range(len(PLAN_PRIORITY_ORDER)))
+        order_by = f"CASE priority {rank} ELSE {len(PLAN_PRIORITY_ORDER)} END {direction}"
+        order_params = list(PLAN_PRIORITY_ORDER)
+    elif sort_by == "due_date":
+        order_by = f"due_date IS NULL, due_date {direction}"
+        order_params = []
+    else:
+        order_by = f"{sort_by} {direction}"
+        order_params = []
+
+    conn = _state_db()
+    sql_where = " AND ".join(where)
+    total = conn.execute(f"SELECT COUNT(*) FROM plans WHERE {sql_where}", params).fetchone()[0]
+    rows = conn.execute(
+        f"SELECT * FROM plans WHERE {sql_where} ORDER BY {order_by}, created_at, plan_id LIMIT ? OFFSET ?",
+        (*params, *order_params, limit, offset),
+    ).fetchall()
+    items = _plan_items([r["plan_id"] for r in rows])
+    paginated = [_normalize_plan_row(r, items[r["plan_id"]]) for r in rows]
 
     return {
-        "plans": json.loads(json.dumps(paginated, default=str)),
+        "plans": _jsonable(paginated),
         "total": total,
         "offset": offset,
         "limit": limit
     }
 
 
-@mcp.tool()
+@_tool("read")
 def get_plan(plan_id: str, user_id: str | None = None) -> dict:
     """
     Recupera um plano específico pelo plan_id.
     """
-    if mem0 is None:
-        raise RuntimeError("Mem0 not initialized")
+    _ensure_mem0()
+
+    user_id = _resolve_user_id(user_id)
+    if not _find_plan_row(plan_id, user_id):
+        return {"status": "not_found", "plan_id": plan_id}
+
+    return {"status": "ok", "plan": _jsonable(_load_plan(plan_id))}
+
+
+@_tool("write")
+def update_plan(
+    plan_id: str,
+    title: str | None = None,
+    status: str | None = None,
+    priority: str | None = None,
+    due_date: str | None = None,
+    tags: list[str] | None = None,
+    user_id: str | None = None
+) -> dict:
+    """
+    Atualiza título/status/prioridade/prazo/tags de um plano.
+    O título só é re-embedado quando muda; os demais campos atualizam apenas o metadata.
+    """
+    _ensure_mem0()
 
     user_id = _resolve_user_id(user_id)
-    plan = _find_plan_by_id(plan_id, user_id)
-    if not plan:
+    if status is not None and status not in PLAN_STATUSES:
+        return {"status": "error", "message": f"Invalid status '{status}'. Must be one of: {', '.join(sorted(PLAN_STATUSES))}"}
+
+    row = _find_plan_row(plan_id, user_id)
+    if not row:
         return {"status": "not_found", "plan_id": plan_id}
 
-    return {"status": "ok", "plan": json.loads(json.dumps(_normalize_plan_memory(plan), default=str))}
+    plan = dict(row)
+    if title is not None:
+        plan["title"] = title
+    if status is not None:
+        plan["status"] = status
+    if priority is not None:
+        plan["priority"] = priority
+    if due_date is not None:
+        plan["due_date"] = due_date or None
+    if tags is not None:
+        base_tags = list(tags)
+        if "planning" not in base_tags:
+            base_tags.append("planning")
+        plan["tags"] = ",".join(_expand_hierarchical_tags(base_tags))
+    plan["updated_at"] = datetime.now().isoformat()
+
+    conn = _state_db()
+    with conn:
+        conn.execute(
+            "UPDATE plans SET title=?, status=?, priority=?, due_date=?, tags=?, updated_at=? WHERE plan_id=?",
+            (plan["title"], plan["status"], plan["priority"], plan["due_date"], plan["tags"], plan["updated_at"], plan_id),
+        )
+        _set_plan_tags(conn, plan_id, user_id, plan["tags"])
+    warning = _update_plan_vector(row, plan)
+    search_cache.invalidate(user_id, "plan")
+
+    response = {"status": "updated", "plan": _jsonable(_load_plan(plan_id))}
+    if warning:
+        response["warning"] = warning
+    return response
 
 
-@mcp.tool()
+@_tool("write")
 def update_plan_item(
     plan_id: str,
     item_id: str,
@@ -760,51 +4217,34 @@ def update_plan_item(
     """
     Atualiza status/nota de um item do plano.
     """
-    if mem0 is None:
-        raise RuntimeError("Mem0 not initialized")
+    _ensure_mem0()
 
     user_id = _resolve_user_id(user_id)
     if status not in ITEM_STATUSES:
         return {"status": "error", "message": f"Invalid item status '{status}'. Must be one of: {', '.join(sorted(ITEM_STATUSES))}"}
 
-    plan = _find_plan_by_id(plan_id, user_id)
-    if not plan:
+    if not _find_plan_row(plan_id, user_id):
         return {"status": "not_found", "plan_id": plan_id}
 
-    metadata = (plan.get("metadata") or {}).copy()
-    checklist = _parse_checklist(metadata.get("checklist"))
-    found = False
     now = datetime.now().isoformat()
-    for item in checklist:
-        if item.get("id") == item_id:
-            item["status"] = status
-            if note is not None:
-                item["note"] = note
-            item["updated_at"] = now
-            found = True
-            break
+    conn = _state_db()
+    with conn:
+        # Atualização in-place do item + contadores do plano numa única transação
+        cur = conn.execute(
+            "UPDATE plan_items SET status=?, note=COALESCE(?, note), updated_at=? WHERE plan_id=? AND item_id=?",
+            (status, note, now, plan_id, item_id),
+        )
+        if cur.rowcount:
+            _refresh_plan_counts(conn, plan_id)
+            conn.execute("UPDATE plans SET updated_at=? WHERE plan_id=?", (now, plan_id))
 
-    if not found:
+    if not cur.rowcount:
         return {"status": "not_found", "plan_id": plan_id, "item_id": item_id}
 
-    metadata["checklist"] = json.dumps(checklist)
-    metadata["open_items"] = sum(1 for i in checklist if i.get("status") != "done")
-    metadata["total_items"] = len(checklist)
-    metadata["updated_at"] = now
-    # Preserva campos chave
-    metadata["rule_type"] = "plan"
-    metadata["plan_id"] = plan_id
-    if "title" not in metadata:
-        metadata["title"] = plan.get("memory")
-
-    normalized, warning = _save_plan_memory(plan, metadata, user_id)
-    response = {"status": "updated", "plan": json.loads(json.dumps(normalized, default=str))}
-    if warning:
-        response["warning"] = warning
-    return response
+    return {"status": "updated", "plan": _jsonable(_load_plan(plan_id))}
 
 
-@mcp.tool()
+@_tool("write")
 def add_plan_item(
     plan_id: str,
     title: str,
@@ -813,61 +4253,51 @@ def add_plan_item(
     """
     Adiciona um item ao checklist do plano.
     """
-    if mem0 is None:
-        raise RuntimeError("Mem0 not initialized")
+    _ensure_mem0()
 
     user_id = _resolve_user_id(user_id)
-    plan = _find_plan_by_id(plan_id, user_id)
-    if not plan:
+    if not _find_plan_row(plan_id, user_id):
         return {"status": "not_found", "plan_id": plan_id}
 
-    metadata = (plan.get("metadata") or {}).copy()
-    checklist = _parse_checklist(metadata.get("checklist"))
     now = datetime.now().isoformat()
-    checklist.append({
-        "id": str(uuid4()),
-        "title": title,
-        "status": "todo",
-        "note": None,
-        "created_at": now,
-        "updated_at": now
-    })
-
-    metadata["checklist"] = json.dumps(checklist)
-    metadata["open_items"] = sum(1 for i in checklist if i.get("status") != "done")
-    metadata["total_items"] = len(checklist)
-    metadata["updated_at"] = now
-    metadata["rule_type"] = "plan"
-    metadata["plan_id"] = plan_id
-    if "title" not in metadata:
-        metadata["title"] = plan.get("memory")
-
-    normalized, warning = _save_plan_memory(plan, metadata, user_id)
-    response = {"status": "updated", "plan": json.loads(json.dumps(normalized, default=str))}
-    if warning:
-        response["warning"] = warning
-    return response
+    conn = _state_db()
+    with conn:
+        conn.execute(
+            "INSERT INTO plan_items (item_id, plan_id, position, title, status, note, created_at, updated_at) "
+            "SELECT ?, ?, COALESCE(MAX(position) + 1, 0), ?, 'todo', NULL, ?, ? FROM plan_items WHERE plan_id=?",
+            (str(uuid4()), plan_id, title, now, now, plan_id),
+        )
+        _refresh_plan_counts(conn, plan_id)
+        conn.execute("UPDATE plans SET updated_at=? WHERE plan_id=?", (now, plan_id))
 
+    return {"status": "updated", "plan": _jsonable(_load_plan(plan_id))}
 
-@mcp.tool()
+
+@_tool("write")
 def delete_plan(plan_id: str, user_id: str | None = None) -> dict:
     """
     Remove um plano (toda a memória associada).
     """
-    if mem0 is None:
-        raise RuntimeError("Mem0 not initialized")
+    _ensure_mem0()
 
     user_id = _resolve_user_id(user_id)
-    plan = _find_plan_by_id(plan_id, user_id)
-    if not plan:
+    row = _find_plan_row(plan_id, user_id)
+    if not row:
         return {"status": "not_found", "plan_id": plan_id}
 
-    mem0.delete(memory_id=plan.get("id"))
-    _clear_cache()
-    return {"status": "deleted", "plan_id": plan_id, "memory_id": plan.get("id")}
+    if row["memory_id"]:
+        mem0.delete(memory_id=row["memory_id"])
+        _unindex_memories([row["memory_id"]])
+    conn = _state_db()
+    with conn:
+        conn.execute("DELETE FROM plan_items WHERE plan_id=?", (plan_id,))
+        conn.execute("DELETE FROM plan_tags WHERE plan_id=?", (plan_id,))
+        conn.execute("DELETE FROM plans WHERE plan_id=?", (plan_id,))
+    search_cache.invalidate(user_id, "plan")
+    return {"status": "deleted", "plan_id": plan_id, "memory_id": row["memory_id"]}
 
 
-@mcp.tool()
+@_tool("write")
 def add_programming_rule(
     rule_text: str,
     language: str,
@@ -882,7 +4312,8 @@ def add_programming_rule(
     replaces: str | None = None,
     user_id: str | None = None,
     additional_metadata: dict[str, Any] | None = None,
-    check_duplicates: bool = True
+    check_duplicates: bool = True,
+    mode: str = "auto"
 ) -> dict:
     """
     Adds a programming rule with structured metadata optimized for code guidelines.
@@ -902,9 +4333,11 @@ def add_programming_rule(
         user_id: User identifier (defaults to DEFAULT_USER_ID)
         additional_metadata: Any extra metadata fields
         check_duplicates: Check for similar rules before adding (defaults to True)
+        mode: "auto" (default: rules up to ADD_AUTO_RAW_MAX_CHARS are stored with the embedding only),
+            "raw", "infer" or "infer_async" (LLM extraction in background, poll with get_memory_job_status)
 
     Returns:
-        Dictionary with rule details including id, or duplicate status if similar rule exists
+        Dictionary with rule details including id and the effective mode, or duplicate status if similar rule exists
 
     Example:
         add_programming_rule(
@@ -916,8 +4349,7 @@ def add_programming_rule(
             examples={"correct": "User.objects.filter(id=user_id)", "incorrect": "cursor.execute(f'SELECT * FROM users WHERE id={user_id}')"}
         )
     """
-    if mem0 is None:
-        raise RuntimeError("Mem0 not initialized")
+    _ensure_mem0()
 
     user_id = _resolve_user_id(user_id)
 
@@ -931,28 +4363,21 @@ def add_programming_rule(
     if context not in VALID_CONTEXTS:
         return {"status": "error", "message": f"Invalid context '{context}'. Must be one of: {', '.join(VALID_CONTEXTS)}"}
 
-    # Verifica duplicatas se solicitado
+    mode = (mode or "auto").strip().lower()
+    if mode not in ADD_MODES:
+        return {"status": "error", "message": f"Invalid mode '{mode}'. Must be one of: {', '.join(sorted(ADD_MODES))}"}
+    mode = _resolve_add_mode(mode, rule_text, structured=True)
+
+    text_hash, minhash = _rule_signature(rule_text)
+    vector = None
+
+    # Verifica duplicatas se solicitado (apenas regras da mesma linguagem e categoria)
     if check_duplicates:
-        # Busca apenas em regras de programação da mesma linguagem e categoria
-        duplicate_filters = {
-            "rule_type": "programming_rule",
-            "language": language.lower(),
-            "category": category
-        }
-        similar = mem0.search(
-            rule_text,
-            user_id=user_id,
-            filters=duplicate_filters,
-            limit=1
-        )
-        items = similar.get("results", similar) if isinstance(similar, dict) else similar
-        if items and len(items) > 0 and float(items[0].get("score", 0)) > 0.95:
-            return {
-                "status": "duplicate",
-                "message": "Similar rule already exists",
-                "existing_rule": json.loads(json.dumps(items[0], default=str)),
-                "similarity_score": items[0].get("score")
-            }
+        duplicate = _find_duplicate_rule(rule_text, user_id, language.lower(), category, text_hash, minhash)
+        if duplicate.get("status") == "duplicate":
+            return duplicate
+        # Vetor gerado na checagem é reaproveitado na gravação
+        vector = duplicate.get("vector")
 
     # Constrói metadata estruturado
     metadata = {
@@ -962,7 +4387,9 @@ def add_programming_rule(
         "version": version,
         "context": context,
         "rule_type": "programming_rule",
-        "created_at": datetime.now().isoformat()
+        "created_at": datetime.now().isoformat(),
+        "text_hash": text_hash,
+        "minhash": minhash
     }
 
     if framework:
@@ -996,14 +4423,16 @@ def add_programming_rule(
     expanded_tags = _expand_hierarchical_tags(tags)
     metadata["tags"] = ",".join(expanded_tags)
 
-    # Adiciona a regra
-    result = mem0.add(rule_text, user_id=user_id, metadata=metadata, infer=MEM0_INFER)
-    clean = json.loads(json.dumps(result, default=str))
-
-    # Se infer=True retornou results vazio, tenta novamente com infer=False
-    if MEM0_INFER and isinstance(clean.get("results"), list) and not clean["results"]:
-        result = mem0.add(rule_text, user_id=user_id, metadata=metadata, infer=False)
-        clean = json.loads(json.dumps(result, default=str))
+    # Adiciona a regra (sem inferência, o vetor da checagem de duplicatas vai direto ao vector store)
+    if mode == "infer_async":
+        clean = _enqueue_memory_job(rule_text, user_id, metadata)
+        if clean.get("status") == "queue_full":
+            return clean
+    elif mode == "infer":
+        # Se o LLM não extrair nada, grava o texto bruto com o mesmo vetor
+        clean = _add_inferred_memory(rule_text, user_id, metadata, vector=vector)
+    else:
+        clean = _add_raw_memory(rule_text, user_id, metadata, vector=vector)
 
     # Normaliza id
     if isinstance(clean, dict) and "id" not in clean:
@@ -1016,17 +4445,177 @@ def add_programming_rule(
             clean["id"] = nested["id"]
 
     # Limpa cache após adicionar
-    _clear_cache()
+    search_cache.invalidate(user_id, "programming_rule")
 
     return {
         "status": "added",
         "rule": clean,
         "metadata": metadata,
-        "tags": expanded_tags
+        "tags": expanded_tags,
+        "mode": mode
+    }
+
+
+def _find_duplicate_rule(
+    rule_text: str,
+    user_id: str,
+    language: str,
+    category: str,
+    text_hash: str,
+    minhash: str
+) -> dict:
+    """
+    Checagem de duplicatas em três estágios: hash normalizado e MinHash (sem embedder), depois
+    similaridade de cosseno contra os vetores armazenados. Retorna {"status": "duplicate", ...}
+    ou {"status": "unique", "vector": ...} com o embedding para reuso na gravação.
+    """
+    collection = mem0.vector_store.collection
+    match = _find_rule_by_signature(user_id, language, category, text_hash, minhash)
+    if match:
+        memory_id, similarity, method = match
+        found = collection.get(ids=[memory_id], include=["metadatas"])
+        if found.get("ids"):
+            return {
+                "status": "duplicate",
+                "message": "Similar rule already exists",
+                "existing_rule": _jsonable(_format_memory_item(memory_id, found["metadatas"][0])),
+                "similarity_score": round(similarity, 4),
+                "match": method
+            }
+        _unindex_memories([memory_id])  # assinatura órfã (memória removida fora do servidor)
+
+    vector = mem0.embedding_model.embed(rule_text, "add")
+    nearest = collection.query(
+        query_embeddings=[vector],
+        n_results=3,
+        where=_rule_where(user_id, language, category),
+        include=["metadatas", "embeddings"],
+    )
+    candidates = zip(nearest["ids"][0], nearest["metadatas"][0], nearest["embeddings"][0])
+    best = max(
+        ((memory_id, meta, _cosine_similarity(vector, embedding)) for memory_id, meta, embedding in candidates),
+        key=lambda x: x[2],
+        default=None,
+    )
+    if best and best[2] >= RULE_DUPLICATE_THRESHOLD:
+        return {
+            "status": "duplicate",
+            "message": "Similar rule already exists",
+            "existing_rule": _jsonable(_format_memory_item(best[0], best[1])),
+            "similarity_score": round(best[2], 4),
+            "match": "embedding"
+        }
+    return {"status": "unique", "vector": vector}
+
+
+@_tool("read")
+def find_duplicate_rules(
+    user_id: str | None = None,
+    language: str | None = None,
+    category: str | None = None,
+    threshold: float | None = None,
+    use_embeddings: bool = True
+) -> dict:
+    """
+    Clusters existing programming rules that are duplicates of each other.
+    Uses the stored vectors (no re-embedding) plus normalized-text hash and MinHash signatures.
+
+    Args:
+        user_id: User identifier (defaults to DEFAULT_USER_ID)
+        language: Only rules of this language
+        category: Only rules of this category
+        threshold: Cosine similarity to link two rules (defaults to RULE_DUPLICATE_THRESHOLD)
+        use_embeddings: Also compare stored vectors (False = only exact/near-exact text matches)
+
+    Returns:
+        Dictionary with duplicate clusters (largest first), each listing its rules and how they matched
+    """
+    _ensure_mem0()
+
+    user_id = _resolve_user_id(user_id)
+    threshold = RULE_DUPLICATE_THRESHOLD if threshold is None else threshold
+    include = ["metadatas", "embeddings"] if use_embeddings else ["metadatas"]
+    rules = mem0.vector_store.collection.get(
+        where=_rule_where(user_id, language.lower() if language else None, category),
+        include=include,
+    )
+    ids = rules.get("ids") or []
+    metadatas = rules.get("metadatas") or []
+    signatures = [
+        (m.get("text_hash"), m.get("minhash")) if m.get("text_hash") and m.get("minhash") else _rule_signature(m.get("data", ""))
+        for m in metadatas
+    ]
+
+    # Union-find sobre pares ligados por hash, MinHash ou cosseno, dentro da mesma linguagem/categoria
+    parent = list(range(len(ids)))
+    links: dict[int, set[str]] = {}
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def link(i: int, j: int, method: str):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[root_j] = root_i
+        links.setdefault(i, set()).add(method)
+        links.setdefault(j, set()).add(method)
+
+    groups: dict[tuple, list[int]] = {}
+    for i, m in enumerate(metadatas):
+        groups.setdefault((m.get("language"), m.get("category")), []).append(i)
+
+    embeddings = rules.get("embeddings") if use_embeddings else None
+    for members in groups.values():
+        buckets: dict[tuple[int, int], list[int]] = {}
+        for i in members:
+            for band, value in enumerate(_minhash_bands(signatures[i][1])):
+                buckets.setdefault((band, value), []).append(i)
+        for bucket in buckets.values():
+            for a in range(len(bucket)):
+                for b in range(a + 1, len(bucket)):
+                    i, j = bucket[a], bucket[b]
+                    if signatures[i][0] == signatures[j][0]:
+                        link(i, j, "exact")
+                    elif RULE_NEAR_DUPLICATE_THRESHOLD > 0 and (
+                        _minhash_similarity(signatures[i][1], signatures[j][1]) >= RULE_NEAR_DUPLICATE_THRESHOLD
+                    ):
+                        link(i, j, "minhash")
+        if embeddings is not None and len(members) > 1:
+            matrix = np.asarray([embeddings[i] for i in members], dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms == 0, 1, norms)
+            similarity = matrix @ matrix.T
+            for a, b in zip(*np.nonzero(np.triu(similarity >= threshold, k=1))):
+                link(members[a], members[b], "embedding")
+
+    clusters: dict[int, list[int]] = {}
+    for i in links:
+        clusters.setdefault(find(i), []).append(i)
+    result = [
+        {
+            "size": len(members),
+            "rules": [
+                {**_format_memory_item(ids[i], metadatas[i], ["memory", "severity", "language", "category", "created_at"]),
+                 "matched_by": sorted(links[i])}
+                for i in sorted(members, key=lambda i: str(metadatas[i].get("created_at") or ""))
+            ],
+        }
+        for members in clusters.values()
+    ]
+    result.sort(key=lambda c: c["size"], reverse=True)
+
+    return {
+        "clusters": _jsonable(result),
+        "total_clusters": len(result),
+        "rules_scanned": len(ids),
+        "threshold": threshold
     }
 
 
-@mcp.tool()
+@_tool("read")
 def search_rules(
     query: str | None = None,
     language: str | None = None,
@@ -1036,7 +4625,8 @@ def search_rules(
     context: str | None = None,
     user_id: str | None = None,
     min_score: float = 0.6,
-    limit: int = 10
+    limit: int = 10,
+    offset: int = 0
 ) -> dict:
     """
     Searches programming rules with hybrid filtering (exact filters + semantic search).
@@ -1052,9 +4642,11 @@ def search_rules(
         user_id: User identifier (defaults to DEFAULT_USER_ID)
         min_score: Minimum similarity score (0.0-1.0) - defaults to 0.6
         limit: Maximum number of results to return
+        offset: Number of results to skip (for pagination)
 
     Returns:
-        Dictionary with filtered and scored results
+        Dictionary with filtered and scored results. Without query, rules are ordered by
+        severity (MUST, SHOULD, MAY, DEPRECATED) then created_at, and "total" counts all matches.
 
     Examples:
         # Search for Python security rules
@@ -1066,8 +4658,7 @@ def search_rules(
         # Semantic search across all Delphi rules
         search_rules(query="memory management", language="delphi", min_score=0.7)
     """
-    if mem0 is None:
-        raise RuntimeError("Mem0 not initialized")
+    _ensure_mem0()
 
     user_id = _resolve_user_id(user_id)
 
@@ -1083,12 +4674,18 @@ def search_rules(
     if context:
         filters["context"] = context
 
-    # Verifica cache (apenas para queries com texto)
-    if query:
+    # Sem query: consultas de metadata no Chroma, paginadas por severidade
+    if not query:
+        return _list_rules_by_filters(user_id, filters, severity, limit, offset, min_score)
+
+    # Verifica cache (apenas para queries com texto, ignora offset para simplificar)
+    if offset == 0:
         cache_key = _make_cache_key(f"{query}:{user_id}", filters, limit)
-        cached = _get_from_cache(cache_key)
+        with _phase("cache_lookup", "search_cache"):
+            cached = search_cache.get(cache_key)
         if cached:
             return cached
+    generation = search_cache.generation(user_id)
 
     # Se tem múltiplos severities, faz OR logic
     if severity and len(severity) > 1:
@@ -1096,61 +4693,197 @@ def search_rules(
         for sev in severity:
             filt = filters.copy()
             filt["severity"] = sev
-
-            if query:
-                res = mem0.search(query, user_id=user_id, filters=filt, limit=limit * 2)
-            else:
-                # Sem query, pega todas as memórias e filtra
-                all_memories = mem0.get_all(user_id=user_id)
-                # Trata caso get_all retorne dict ou list
-                memories_list = all_memories.get("results", all_memories) if isinstance(all_memories, dict) else all_memories
-                res = [m for m in memories_list if all(m.get("metadata", {}).get(k) == v for k, v in filt.items())]
-
+            res = mem0.search(query, user_id=user_id, filters=filt, limit=(limit + offset) * 2)
             items = res.get("results", res) if isinstance(res, dict) else res
             partials.append(items)
 
-        merged = _merge_results_or(partials, limit=limit * 2)
+        merged = _merge_results_or(partials, limit=(limit + offset) * 2)
         results = merged
     else:
         # Severity único ou nenhum
         if severity and len(severity) == 1:
             filters["severity"] = severity[0]
 
-        if query:
-            res = mem0.search(query, user_id=user_id, filters=filters, limit=limit * 2)
-            results = res.get("results", res) if isinstance(res, dict) else res
-        else:
-            # Sem query, pega todas as memórias e filtra
-            all_memories = mem0.get_all(user_id=user_id)
-            # Trata caso get_all retorne dict ou list
-            memories_list = all_memories.get("results", all_memories) if isinstance(all_memories, dict) else all_memories
-            results = [m for m in memories_list if all(m.get("metadata", {}).get(k) == v for k, v in filters.items())]
+        res = mem0.search(query, user_id=user_id, filters=filters, limit=(limit + offset) * 2)
+        results = res.get("results", res) if isinstance(res, dict) else res
 
     # Filtra por min_score
-    if query and results:
-        filtered = [r for r in results if float(r.get("score", 0)) >= min_score]
-    else:
-        filtered = results
+    filtered = [r for r in (results or []) if float(r.get("score", 0)) >= min_score]
 
     # Limita resultados
-    final_results = filtered[:limit] if filtered else []
+    final_results = filtered[offset:offset + limit]
 
     response = {
-        "results": json.loads(json.dumps(final_results, default=str)),
+        "results": _strip_tag_keys(_jsonable(final_results)),
         "total": len(final_results),
+        "offset": offset,
+        "limit": limit,
         "filters_applied": filters,
         "min_score": min_score,
         "query": query
     }
 
-    # Armazena no cache se tinha query
-    if query:
-        _put_in_cache(cache_key, response)
+    # Armazena no cache se offset == 0
+    if offset == 0:
+        search_cache.put(cache_key, response, user_id=user_id, rule_type="programming_rule", generation=generation)
 
     return response
 
 
-@mcp.tool()
+def _list_rules_by_filters(
+    user_id: str,
+    filters: dict,
+    severity: list[str] | None,
+    limit: int,
+    offset: int,
+    min_score: float
+) -> dict:
+    """
+    Caminho sem query do search_rules: uma única consulta de metadata no Chroma ($in nas
+    severidades), sem embeddings nem documentos. O Chroma não ordena o get, então a página é
+    recortada depois de ordenar os metadados encontrados por severidade (MUST > SHOULD > MAY >
+    DEPRECATED) e created_at: o custo acompanha as regras que casam com o filtro, não o total
+    de memórias do usuário.
+    """
+    conditions = [{"user_id": {"$eq": user_id}}] + [{k: {"$eq": v}} for k, v in filters.items()]
+    severities = list(dict.fromkeys(severity or []))
+    if len(severities) == 1:
+        filters["severity"] = severities[0]
+        conditions.append({"severity": {"$eq": severities[0]}})
+    elif severities:
+        filters["severity"] = severities
+        conditions.append({"severity": {"$in": severities}})
+    where = {"$and": conditions} if len(conditions) > 1 else conditions[0]
+
+    page = mem0.vector_store.collection.get(where=where, include=["metadatas"])
+    ranks = {sev: rank for rank, sev in enumerate(VALID_SEVERITIES)}
+    matches = sorted(
+        zip(page.get("ids") or [], page.get("metadatas") or []),
+        key=lambda entry: (
+            ranks.get((entry[1] or {}).get("severity"), len(ranks)),
+            _created_us((entry[1] or {}).get("created_at")),
+            entry[0],
+        ),
+    )
+    total = len(matches)
+    results = [_format_memory_item(memory_id, meta) for memory_id, meta in matches[offset:offset + limit]]
+
+    return {
+        "results": _jsonable(results),
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "filters_applied": filters,
+        "min_score": min_score,
+        "query": None
+    }
+
+
+# sem guard: roda fora dos pools de tools para reportá-los mesmo saturados
+@_tool("read", guard=False)
+def get_performance_stats() -> dict:
+    """
+    Reports runtime performance counters of the server (caches and background queues).
+
+    Returns:
+        Dictionary with search/embedding cache statistics (hits, misses, evictions, size), embedding micro-batching
+        (batched provider calls, coalesced requests), the infer fallback (writes where the LLM extracted nothing, time spent),
+        the LLM extraction cache (hit ratio per call kind, model time saved),
+        inference queue state,
+        the read/write tool pools (active, queued, wait/run times), lock contention (mem0 instance, per-user writes),
+        the Ollama keep-alive (cold vs warm model latency) and the shared Ollama HTTP pool (requests per instance, retries)
+    """
+    batcher = _embedding_batcher()
+    return {
+        "search_cache": search_cache.stats(),
+        "embedding_cache": embedding_cache.stats() if EMBEDDING_CACHE_ENABLED else {"enabled": False},
+        "embedding_batcher": batcher.stats() if batcher else {"initialized": False},
+        "infer_fallback": infer_fallback_stats.stats(),
+        "llm_cache": llm_cache.stats() if LLM_CACHE_ENABLED else {"enabled": False},
+        "inference_queue": _job_queue_stats(),
+        "tool_pools": {name: pool.stats() for name, pool in tool_pools.items()},
+        "locks": {"mem0_instance": mem0_gate.stats(), "user_writes": user_write_locks.stats()},
+        "ollama_keepalive": ollama_keepalive.stats() if OLLAMA_KEEPALIVE_ENABLED else {"enabled": False},
+        "ollama_http": _ollama_pool_stats(),
+    }
+
+
+@_tool("read", guard=False)
+def get_slow_calls(tool: str | None = None, limit: int = 10, since_minutes: float | None = None) -> dict:
+    """
+    Summarizes the slow tool calls recorded by the tracing layer (calls above TRACE_SLOW_MS).
+    Requires TRACING_ENABLED=true; arguments are only stored as hashes.
+
+    Args:
+        tool: Only consider calls of this tool
+        limit: Maximum number of offenders and slowest calls returned
+        since_minutes: Only consider calls from the last N minutes
+
+    Returns:
+        Dictionary with the top offending tools (count, avg/max duration, time per phase and the
+        bottleneck phase) and the slowest individual calls with their phase spans
+    """
+    limit = max(1, limit)
+    slow_call_log.flush()
+    entries = slow_call_log.read()
+    if tool:
+        entries = [e for e in entries if e.get("tool") == tool]
+    if since_minutes:
+        cutoff = datetime.now().astimezone() - timedelta(minutes=since_minutes)
+        entries = [e for e in entries if datetime.fromisoformat(e["ts"]) >= cutoff]
+
+    def bottleneck(phases_ms: dict) -> str | None:
+        return max(phases_ms, key=phases_ms.get) if phases_ms else None
+
+    by_tool: dict[str, dict] = {}
+    for entry in entries:
+        summary = by_tool.setdefault(entry["tool"], {"tool": entry["tool"], "calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "phases_ms": {}})
+        summary["calls"] += 1
+        summary["errors"] += entry.get("status") == "error"
+        summary["total_ms"] += entry["duration_ms"]
+        summary["max_ms"] = max(summary["max_ms"], entry["duration_ms"])
+        for phase, ms in (entry.get("phases_ms") or {}).items():
+            summary["phases_ms"][phase] = summary["phases_ms"].get(phase, 0.0) + ms
+    offenders = sorted(by_tool.values(), key=lambda s: s["total_ms"], reverse=True)[:limit]
+    for summary in offenders:
+        summary["avg_ms"] = round(summary["total_ms"] / summary["calls"], 2)
+        summary["total_ms"] = round(summary["total_ms"], 2)
+        summary["phases_ms"] = {phase: round(ms, 2) for phase, ms in summary["phases_ms"].items()}
+        summary["bottleneck"] = bottleneck(summary["phases_ms"])
+
+    slowest = sorted(entries, key=lambda e: e["duration_ms"], reverse=True)[:limit]
+    return {
+        "tracing_enabled": TRACING_ENABLED,
+        "threshold_ms": TRACE_SLOW_MS,
+        "log_path": str(slow_call_log.path),
+        "slow_calls": len(entries),
+        "top_offenders": offenders,
+        "slowest": [{**entry, "bottleneck": bottleneck(entry.get("phases_ms"))} for entry in slowest],
+    }
+
+
+@_tool("write")
+def rebuild_memory_index(batch_size: int = 500) -> dict:
+    """
+    Rebuilds the memory indexes: the tag index used by tag filters (search_memory, list_plans,
+    /_test/search), the listing index used by list_memories pagination and the per-user
+    stats used by list_all_user_ids.
+    Adds the indexed tag keys to memories created before the index existed.
+
+    Args:
+        batch_size: Number of memories read/updated per page
+
+    Returns:
+        Dictionary with scanned/updated memory counts, indexed rows and elapsed time
+    """
+    _ensure_mem0()
+
+    stats = _migrate_memory_index(batch_size=max(1, batch_size))
+    search_cache.clear()
+    return {"status": "ok", **stats}
+
+
+@_tool("read", guard=False)
 def list_llm_options() -> dict:
     """
     Lists all available LLM configurations with their characteristics.
@@ -1178,23 +4911,25 @@ def list_llm_options() -> dict:
     }
 
 
-@mcp.tool()
+# sem guard: a própria troca pede o modo exclusivo da instância
+@_tool("write", guard=False)
 def change_llm_config(provider: str, model: str) -> dict:
     """
     Changes the LLM provider and model dynamically without restarting the server.
+    Only the LLM is replaced; the vector store connection and the embedder are reused.
 
     Args:
         provider: LLM provider ('ollama' or 'openai')
         model: Model name (e.g., 'llama3.2:latest', 'gpt-4o-mini')
 
     Returns:
-        Dictionary with status and new configuration
+        Dictionary with status, new configuration and swap latency (swap_ms, swap_wait_ms)
 
     Examples:
         change_llm_config('openai', 'gpt-4o-mini')
         change_llm_config('ollama', 'llama3.2:latest')
     """
-    global mem0, LLM_PROVIDER, LLM_MODEL
+    global LLM_PROVIDER, LLM_MODEL
 
     # Validate provider
     if provider not in ['ollama', 'openai']:
@@ -1209,27 +4944,19 @@ def change_llm_config(provider: str, model: str) -> dict:
     old_model = LLM_MODEL
 
     try:
-        # Update global variables
+        started = time.perf_counter()
+        swap_wait_ms = _swap_llm(provider, model)
+        swap_ms = (time.perf_counter() - started) * 1000
         LLM_PROVIDER = provider
         LLM_MODEL = model
 
-        # Update .env file for persistence
-        env_path = os.path.join(os.path.dirname(__file__), '.env')
-        if os.path.exists(env_path):
-            with open(env_path, 'r') as f:
-                lines = f.readlines()
-
-            with open(env_path, 'w') as f:
-                for line in lines:
-                    if line.startswith('LLM_PROVIDER='):
-                        f.write(f'LLM_PROVIDER={provider}\n')
-                    elif line.startswith('LLM_MODEL='):
-                        f.write(f'LLM_MODEL={model}\n')
-                    else:
-                        f.write(line)
+        # Cached extractions of the replaced model are no longer valid
+        old_namespace = _llm_namespace(old_provider, old_model)
+        if LLM_CACHE_ENABLED and old_namespace != _llm_namespace(provider, model):
+            llm_cache.invalidate(old_namespace)
 
-        # Rebuild Mem0 with new config
-        mem0 = build_mem0()
+        # Persist in .env in the background (atomic replace, off the request path)
+        _persist_env_values({"LLM_PROVIDER": provider, "LLM_MODEL": model})
 
         return {
             "status": "success",
@@ -1242,14 +4969,13 @@ def change_llm_config(provider: str, model: str) -> dict:
                 "provider": LLM_PROVIDER,
                 "model": LLM_MODEL
             },
+            "swap_ms": round(swap_ms, 2),
+            "swap_wait_ms": round(swap_wait_ms, 2),
             "note": "Changes persist across server restarts"
         }
 
     except Exception as e:
-        # Rollback on error
-        LLM_PROVIDER = old_provider
-        LLM_MODEL = old_model
-
+        # Nothing was swapped: the current LLM stays in place
         return {
             "status": "error",
             "message": f"Failed to change LLM config: {str(e)}",
@@ -1262,38 +4988,44 @@ def change_llm_config(provider: str, model: str) -> dict:
 
 # --- Lifecycle ---------------------------------------------------------------
 
+def _startup_tasks():
+    """
+    Tarefas de inicialização: retoma jobs pendentes, migra os índices de memórias,
+    (MEM0_WARMUP) constrói o mem0 e (OLLAMA_KEEPALIVE_ENABLED) pré-carrega os modelos
+    do Ollama, tudo em background, sem atrasar o handshake do cliente.
+    """
+    _resume_memory_jobs()
+    _migrate_memory_index_in_background()
+    if MEM0_WARMUP:
+        _warm_up_in_background()
+    if OLLAMA_KEEPALIVE_ENABLED and _ollama_models():
+        ollama_keepalive.start()
+
+
 @asynccontextmanager
 async def lifespan(_):
+    _startup_tasks()
     yield
+    ollama_keepalive.stop(timeout=1)
 
 # --- app principal ------------------------------------------------------------
-
-main_app = FastAPI()
-main_app.router.lifespan_context = lifespan
+# As rotas são funções do módulo registradas em create_http_app(); FastAPI e uvicorn
+# só são importados quando o app HTTP é construído (server.app / modo SSE).
 
 # endpoints temporários de teste ----------------------------------------------
 
-@main_app.get("/_test/add")
 async def test_add(text: str, user_id: str = DEFAULT_USER_ID, tags: str | None = None):
-    if mem0 is None:
-        raise RuntimeError("Mem0 não foi inicializado")
-
     resolved_user_id = _resolve_user_id(user_id)
 
     meta = None
     if tags and tags.strip():
         meta = {"tags": tags}  # mantém como CSV string
 
-    item = mem0.add(
-        text,
-        user_id=resolved_user_id,
-        metadata=meta,
-        infer=MEM0_INFER
+    return await tool_pools["write"].run(
+        _call_guarded, resolved_user_id, _add_memory_record, text, resolved_user_id, meta, infer=MEM0_INFER
     )
-    return json.loads(json.dumps(item, default=str))
 
 
-@main_app.get("/_test/search")
 async def test_search(
     query: str,
     user_id: str = DEFAULT_USER_ID,
@@ -1306,11 +5038,8 @@ async def test_search(
 ):
     """
     Busca semântica com filtros por tags e metacampos (igualdade).
-    Se 'tags' tiver vírgula (ex.: DEV_RULE,delphi), aplica OR lógico no servidor.
+    Se 'tags' tiver vírgula (ex.: DEV_RULE,delphi), aplica OR lógico numa única busca.
     """
-    if mem0 is None:
-        raise RuntimeError("Mem0 não foi inicializado")
-
     resolved_user_id = _resolve_user_id(user_id)
     # filtros escalares (sempre igualdade)
     base_filters = {}
@@ -1323,27 +5052,34 @@ async def test_search(
     if version:
         base_filters["version"] = version
 
-    # caso 1: 0 ou 1 tag -> passa direto p/ mem0/chroma (igualdade simples)
-    if not tags or not tags.strip() or "," not in tags:
-        filt = base_filters.copy()
-        if tags:
-            filt["tags"] = tags  # uma única tag (str)
-        results = mem0.search(query, user_id=resolved_user_id, filters=(filt or None), limit=limit)
-        return {"results": json.loads(json.dumps(results, default=str))}
+    return await tool_pools["read"].run(
+        _call_guarded, None, _test_search_sync, query, resolved_user_id, base_filters, tags, limit
+    )
+
 
-    # caso 2: várias tags -> faz N buscas (OR lógico) e une do lado do servidor
-    tag_list = [t.strip() for t in tags.split(",") if t.strip()]
-    partials = []
-    for t in tag_list:
-        filt = base_filters.copy()
-        filt["tags"] = t  # UMA tag por busca
-        res = mem0.search(query, user_id=resolved_user_id, filters=filt, limit=limit)
-        # 'res' costuma ser um dict com 'results' ou lista direta (dependendo da versão do mem0ai)
-        items = res.get("results", res) if isinstance(res, dict) else res
-        partials.append(items)
+def _test_search_sync(query: str, resolved_user_id: str, base_filters: dict, tags: str | None, limit: int) -> dict:
+    """Corpo síncrono do /_test/search, executado no pool de leitura."""
+    # caso 1: sem tags -> passa direto p/ mem0/chroma (igualdade simples)
+    tag_list = _split_tags(tags)
+    if not tag_list:
+        results = mem0.search(query, user_id=resolved_user_id, filters=(base_filters or None), limit=limit)
+        clean = _jsonable(results)
+        if isinstance(clean, dict):
+            clean["results"] = _strip_tag_keys(clean.get("results", []))
+        return {"results": clean}
 
-    merged = _merge_results_or(partials, limit=limit)
-    return {"results": json.loads(json.dumps(merged, default=str))}
+    # caso 2: uma ou várias tags -> uma única busca com OR lógico sobre o índice tag:<nome>
+    tag_filter = _tags_or_filter(tag_list, resolved_user_id)
+    if tag_filter is None:
+        return {"results": []}
+    filt = base_filters.copy()
+    filt.update(tag_filter)
+    res = mem0.search(query, user_id=resolved_user_id, filters=filt, limit=limit)
+    # 'res' costuma ser um dict com 'results' ou lista direta (dependendo da versão do mem0ai)
+    items = res.get("results", res) if isinstance(res, dict) else res
+
+    merged = _merge_results_or([items], limit=limit)
+    return {"results": _strip_tag_keys(_jsonable(merged))}
 
 
 class AddPayload(BaseModel):
@@ -1352,30 +5088,40 @@ class AddPayload(BaseModel):
     tags: Optional[List[str]] = None
     metadata: Optional[Dict[str, Any]] = None
 
-@main_app.post("/_test/add_json")
 async def test_add_json(payload: AddPayload):
-    if mem0 is None:
-        raise RuntimeError("Mem0 não foi inicializado")
-
     resolved_user_id = _resolve_user_id(payload.user_id)
-    # Mescla tags no metadata
-    meta = _flatten_metadata(payload.metadata) or {}
-    if payload.tags:
-        meta["tags"] = ",".join(payload.tags)  # tags como CSV no metadata
-
-    item = mem0.add(
-        payload.text,
-        user_id=resolved_user_id,
-        metadata=meta if meta else None,
-        infer=MEM0_INFER
+    # Mescla tags no metadata (tags como CSV)
+    meta = _merge_tags_into_metadata(payload.tags, payload.metadata)
+
+    return await tool_pools["write"].run(
+        _call_guarded, resolved_user_id,
+        _add_memory_record, payload.text, resolved_user_id, meta if meta else None, infer=MEM0_INFER,
+    )
+
+
+class BulkAddPayload(BaseModel):
+    items: List[AddPayload]
+    batch_size: Optional[int] = None
+
+async def test_add_bulk(payload: BulkAddPayload):
+    items = [item.model_dump() for item in payload.items]
+    return await tool_pools["write"].run(
+        _call_guarded, _bulk_write_users(items), add_memories_bulk, items, batch_size=payload.batch_size
     )
-    return json.loads(json.dumps(item, default=str))
 
 
 
+# métricas ---------------------------------------------------------------------
+
+async def metrics_endpoint():
+    """Métricas no formato de exposição do Prometheus (text/plain 0.0.4)."""
+    from fastapi.responses import PlainTextResponse
+
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # endpoint de ajuda ------------------------------------------------------------
 
-@main_app.get("/")
 async def help_endpoint():
     """
     Documentation endpoint explaining how to use the MCP server.
@@ -1394,23 +5140,35 @@ async def help_endpoint():
             "test": {
                 "add": "/_test/add?text=...&user_id=...&tags=...",
                 "add_json": "/_test/add_json (POST)",
+                "add_bulk": "/_test/add_bulk (POST) - {\"items\": [{\"text\": ..., \"tags\": [...]}], \"batch_size\": 64}",
                 "search": "/_test/search?query=...&user_id=...&tags=...&limit=..."
+            },
+            "metrics": {
+                "url": "/metrics",
+                "description": "Prometheus metrics: per-tool latency histograms split by phase, cache hit ratios, queue depths, infer fallback rate"
             }
         },
         "mcp_tools": {
-            "add_memory": "Add new memory with text, tags, and metadata",
-            "search_memory": "Semantic search with tags (OR logic) and filters",
-            "list_memories": "List all memories for a user (paginated)",
-            "list_all_user_ids": "Get all user_ids in the system",
+            "add_memory": "Add new memory with text, tags, and metadata (mode: auto/raw/infer/infer_async)",
+            "add_memories_bulk": "Bulk raw ingestion with batched embeddings (per-item status + items/s)",
+            "search_memory": "Semantic search with tags (OR logic, 'a.b.*' prefixes) and filters",
+            "list_memories": "List memories for a user (offset or cursor pagination, field projection)",
+            "list_all_user_ids": "Get all user_ids with per-user counts and storage stats",
             "delete_memory": "Delete a specific memory by ID",
+            "get_memory_job_status": "Poll background LLM extraction jobs (mode='infer_async')",
             "add_plan": "Create a plan with checklist items",
-            "list_plans": "List plans with optional filters (status, tag, only_open)",
+            "list_plans": "List plans with indexed filters (plan_id, status, priority, tag, only_open, due_date range), sorting and pagination",
             "get_plan": "Fetch a single plan by plan_id",
+            "update_plan": "Update plan title/status/priority/due_date/tags (re-embeds only on title change)",
             "update_plan_item": "Mark/update a checklist item in a plan",
             "add_plan_item": "Append a new item to a plan",
             "delete_plan": "Remove a plan and its checklist",
             "add_programming_rule": "Add programming rule with structured metadata and validation",
             "search_rules": "Search rules with hybrid filtering (exact + semantic) and caching",
+            "find_duplicate_rules": "Cluster duplicate rules (normalized hash, MinHash and stored vectors)",
+            "get_performance_stats": "Cache hit/miss/eviction counters and background queue state",
+            "get_slow_calls": "Slowest tool calls recorded by tracing (TRACING_ENABLED), with per-phase spans and bottleneck",
+            "rebuild_memory_index": "Rebuild the tag, listing and per-user stats indexes for existing memories",
             "list_llm_options": "Show available LLM configurations",
             "change_llm_config": "Switch LLM provider/model dynamically"
         },
@@ -1444,27 +5202,31 @@ async def help_endpoint():
         },
         "usage": {
             "add_memory": {
-                "example": "add_memory(text='Repository pattern for Delphi', tags=['delphi', 'architecture'], metadata={'priority': 'should'})"
+                "example": "add_memory(text='Repository pattern for Delphi', tags=['delphi', 'architecture'], metadata={'priority': 'should'})",
+                "notes": "mode='raw' skips LLM extraction (embedding only); mode='auto' does it for short structured text"
             },
             "search_memory": {
                 "example": "search_memory(query='delphi repository', tags=['delphi', 'architecture'], limit=10)",
                 "notes": "Multiple tags use OR logic - returns memories matching ANY tag"
             },
             "list_memories": {
-                "example": "list_memories(user_id='johnc', limit=50, offset=0)"
+                "example": "list_memories(user_id='johnc', limit=50, offset=0)",
+                "notes": "Pass the returned next_cursor as cursor for stable paging; fields=['memory', 'tags'] projects the items"
             },
             "add_plan": {
                 "example": "add_plan(title='Entrega sprint', items=['Planejar tarefas', 'Implementar feature A'])"
             },
             "list_plans": {
-                "example": "list_plans(status='active', only_open=True, limit=10)"
+                "example": "list_plans(status='active', only_open=True, limit=10)",
+                "notes": "Also filters by plan_id, priority, tag ('proj.*') and due_from/due_to; sort_by created_at/updated_at/due_date/priority"
             },
             "update_plan_item": {
                 "example": "update_plan_item(plan_id='abc', item_id='123', status='done')"
             },
             "add_programming_rule": {
                 "example": "add_programming_rule(rule_text='Use parameterized queries', language='python', category='security', severity='MUST', framework='django')",
-                "notes": "Automatically creates hierarchical tags and validates schema. Checks for duplicates by default."
+                "notes": "Automatically creates hierarchical tags and validates schema. Checks for duplicates by default. "
+                         "Short rules are stored without LLM extraction (mode='auto'); pass mode='infer' to force it."
             },
             "search_rules": {
                 "example": "search_rules(query='SQL injection', language='python', category='security', min_score=0.7)",
@@ -1481,7 +5243,7 @@ async def help_endpoint():
             "hierarchical_tags": "Automatic tag expansion (python.django.security -> python, django, security)",
             "schema_validation": "Validates rule metadata (severity, category, context)",
             "deduplication": "Automatic detection of duplicate rules (configurable)",
-            "query_caching": "15-minute cache for frequent searches (cleared on add/delete)",
+            "query_caching": "LRU/TTL search cache bounded by entries and bytes, invalidated per user on add/delete",
             "hybrid_search": "Combines exact filtering with semantic similarity"
         },
         "links": {
@@ -1491,25 +5253,75 @@ async def help_endpoint():
         }
     }
 
-# montar o endpoint MCP SSE ----------------------------------------------------
 
-sse_app = mcp.sse_app()
-main_app.mount("/mcp", sse_app)  # sse_app tem /sse, então será acessível em /mcp/sse
-
-app = main_app
+def create_http_app():
+    """Monta o app FastAPI: rotas de teste, ajuda e o endpoint MCP SSE."""
+    started = time.perf_counter()
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse, ORJSONResponse
+
+    http_app = FastAPI(default_response_class=ORJSONResponse if orjson is not None else JSONResponse)
+    http_app.router.lifespan_context = lifespan
+    http_app.add_api_route("/_test/add", test_add, methods=["GET"])
+    http_app.add_api_route("/_test/search", test_search, methods=["GET"])
+    http_app.add_api_route("/_test/add_json", test_add_json, methods=["POST"])
+    http_app.add_api_route("/_test/add_bulk", test_add_bulk, methods=["POST"])
+    http_app.add_api_route("/metrics", metrics_endpoint, methods=["GET"])
+    http_app.add_api_route("/", help_endpoint, methods=["GET"])
+
+    # montar o endpoint MCP SSE
+    sse_app = mcp.sse_app()
+    http_app.mount("/mcp", sse_app)  # sse_app tem /sse, então será acessível em /mcp/sse
+    _mark_startup_phase("http: fastapi + rotas", (time.perf_counter() - started) * 1000)
+    return http_app
+
+
+def __getattr__(name: str):
+    # server.app / server.main_app (uvicorn server:app, TestClient) constroem o app HTTP no primeiro acesso
+    global main_app, app
+    if name in ("app", "main_app"):
+        main_app = app = create_http_app()
+        return main_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _print_startup_profile():
+    """--startup-profile: executa as fases preguiçosas (mem0, app HTTP) e imprime o tempo de cada uma."""
+    module_ms = sum(ms for _, ms in _startup_phases)
+    _ensure_mem0()
+    create_http_app()
+    total = sum(ms for _, ms in _startup_phases)
+    print("=" * 60)
+    print("STARTUP PROFILE")
+    print("=" * 60)
+    print(f"{'fase':<40} | {'ms':>8} | {'%':>5}")
+    print("-" * 60)
+    for name, ms in _startup_phases:
+        print(f"{name:<40} | {ms:>8.1f} | {ms / total * 100:>4.1f}%")
+    print("-" * 60)
+    print(f"{'import do módulo (stdio/scripts)':<40} | {module_ms:>8.1f} |")
+    print(f"{'total com mem0 + HTTP':<40} | {total:>8.1f} |")
+    print("=" * 60)
+    print("Detalhe por módulo: python -X importtime server.py --startup-profile")
+
+
+_mark_startup_phase("module: config, caches, tools")
 
 # --- execução -----------------------------------------------------------------
 
 if __name__ == "__main__":
-    import sys
-
     # Detecta se está sendo chamado via stdio (Claude Desktop) ou SSE (servidor standalone)
     # Quando Claude Desktop chama, sys.stdin é um pipe, não um terminal
     # Permite forçar modo HTTP via variável de ambiente
     force_http = os.getenv("FORCE_HTTP_MODE", "false").lower() == "true"
-    if not sys.stdin.isatty() and not force_http:
+    if "--startup-profile" in sys.argv:
+        _print_startup_profile()
+    elif not sys.stdin.isatty() and not force_http:
         # Modo stdio para Claude Desktop - usa FastMCP diretamente
+        _startup_tasks()
         mcp.run()
     else:
         # Modo SSE para outros clientes - inicia servidor HTTP
-        uvicorn.run(app, host=HOST, port=PORT)
+        import uvicorn
+
+        uvicorn.run(create_http_app(), host=HOST, port=PORT)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Teste dos modos de gravação por chamada (raw, infer, infer_async, auto) contra um Ollama
+stub: resolução do auto, padrões de cada tool, MEM0_INFER=false forçando raw e o modo
+efetivo na resposta.
+"""
+
+import io
+import logging
+import sys
+from pathlib import Path
+from unittest import mock
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import StubOllama, start_stub_environment
+
+start_stub_environment()
+logging.disable(logging.INFO)
+
+import server
+from server import add_memory, add_plan, add_programming_rule
+
+USER_ID = "add_modes"
+LONG_RULE = ("When a service talks to the database it must open a transaction explicitly. " * 5).strip()
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def llm_calls(action) -> tuple[dict, int]:
+    """Executa a gravação e devolve (resposta, chamadas ao LLM)."""
+    StubOllama.reset()
+    response = action()
+    return response, StubOllama.calls.get("chat", 0)
+
+
+def main() -> int:
+    results = []
+    server._ensure_mem0()
+    StubOllama.facts = ["Extracted fact"]
+
+    print_section("1. Resolução do auto")
+    resolve = server._resolve_add_mode
+    results.append(check("frase curta → raw", resolve("auto", "Use tabs in Makefiles") == "raw"))
+    results.append(check("lista curta → raw", resolve("auto", "- lint\n- test\n- deploy") == "raw"))
+    results.append(check("chave-valor curto → raw", resolve("auto", "editor: vim\ntheme: dark") == "raw"))
+    results.append(check("várias frases → infer", resolve("auto", "I moved to Lisbon. I work remotely now.") == "infer"))
+    results.append(check("acima de ADD_AUTO_RAW_MAX_CHARS → infer", resolve("auto", LONG_RULE, structured=True) == "infer",
+                         len(LONG_RULE)))
+    results.append(check("modo explícito preservado", resolve("infer_async", "Use tabs") == "infer_async"))
+    with mock.patch.object(server, "MEM0_INFER", False):
+        results.append(check("MEM0_INFER=false força raw", resolve("infer", "I moved to Lisbon. I work remotely.") == "raw"))
+
+    print_section("2. add_memory: padrão ADD_MEMORY_MODE, modo efetivo na resposta")
+    response, calls = llm_calls(lambda: add_memory("I moved to Lisbon. I work remotely now.", user_id=USER_ID))
+    results.append(check("padrão infer chama o LLM", response.get("mode") == "infer" and calls >= 1, (response.get("mode"), calls)))
+    response, calls = llm_calls(lambda: add_memory("I moved to Porto. I work remotely now.", user_id=USER_ID, mode="raw"))
+    results.append(check("raw sem LLM", response.get("mode") == "raw" and calls == 0, (response.get("mode"), calls)))
+    response, calls = llm_calls(lambda: add_memory("Favorite shell: fish", user_id=USER_ID, mode="auto"))
+    results.append(check("auto com nota curta → raw", response.get("mode") == "raw" and calls == 0, (response.get("mode"), calls)))
+    invalid = add_memory("anything", user_id=USER_ID, mode="fast")
+    results.append(check("modo inválido → erro", invalid.get("status") == "error"))
+
+    print_section("3. Regras e planos: auto por padrão")
+    response, calls = llm_calls(lambda: add_programming_rule("Never commit secrets to the repository", "python", "security",
+                                                             user_id=USER_ID, check_duplicates=False))
+    results.append(check("regra curta sem LLM", response.get("mode") == "raw" and calls == 0, (response.get("mode"), calls)))
+    response, calls = llm_calls(lambda: add_programming_rule(LONG_RULE, "python", "architecture", user_id=USER_ID,
+                                                             check_duplicates=False))
+    results.append(check("regra longa vai ao LLM", response.get("mode") == "infer" and calls >= 1, (response.get("mode"), calls)))
+    response, calls = llm_calls(lambda: add_programming_rule("Pin dependency versions", "python", "general", user_id=USER_ID,
+                                                             check_duplicates=False, mode="infer"))
+    results.append(check("mode=infer mantém o comportamento anterior", response.get("mode") == "infer" and calls >= 1,
+                         (response.get("mode"), calls)))
+    response, calls = llm_calls(lambda: add_plan("Migrate CI to the new runners", items=["Update configs"], user_id=USER_ID))
+    results.append(check("título de plano curto sem LLM", response.get("mode") == "raw" and calls == 0, (response.get("mode"), calls)))
+
+    print_section("4. MEM0_INFER=false")
+    with mock.patch.object(server, "MEM0_INFER", False):
+        response, calls = llm_calls(lambda: add_memory("I moved to Braga. I work remotely now.", user_id=USER_ID, mode="infer"))
+    results.append(check("infer pedido vira raw", response.get("mode") == "raw" and calls == 0, (response.get("mode"), calls)))
+    StubOllama.facts = []
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
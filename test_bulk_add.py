@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Teste da ingestão em lote (add_memories_bulk e POST /_test/add_bulk) contra um Ollama stub:
+embeddings e inserts por lote, status por item, histórico e índices, lock de escrita dos
+usuários do lote e uma invalidação do cache por usuário.
+"""
+
+import asyncio
+import io
+import json
+import logging
+import math
+import sys
+from pathlib import Path
+from unittest import mock
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import StubOllama, start_stub_environment
+
+start_stub_environment()
+logging.disable(logging.INFO)
+
+from fastapi.testclient import TestClient
+
+import server
+from server import add_memories_bulk
+
+USER_ID = "bulk_add"
+OTHER_USER = "bulk_add_other"
+BATCH = 4
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def call_tool(name: str, arguments: dict) -> dict:
+    result = asyncio.run(server.mcp.call_tool(name, arguments))
+    content = result[0] if isinstance(result, tuple) else result
+    return json.loads(content[0].text)
+
+
+def user_stats(user_id: str) -> int:
+    row = server._state_db().execute("SELECT memory_count FROM user_stats WHERE user_id=?", (user_id,)).fetchone()
+    return row["memory_count"] if row else 0
+
+
+def main() -> int:
+    results = []
+    server._ensure_mem0()
+    server.rebuild_memory_index()
+
+    items = [{"text": f"bulk note number {i} about topic {i * 7}", "tags": ["bulk"]} for i in range(7)]
+    items += [{"text": f"other user bulk note {i}", "user_id": OTHER_USER} for i in range(3)]
+    items.insert(5, {"text": "   "})
+    valid = len(items) - 1
+
+    print_section("1. Lote: um embed e um insert por lote, sem LLM")
+    StubOllama.reset()
+    collection_insert = server.mem0.vector_store.insert
+    with mock.patch.object(server.mem0.vector_store, "insert", wraps=collection_insert) as insert, \
+            mock.patch.object(server.search_cache, "invalidate", wraps=server.search_cache.invalidate) as invalidate, \
+            mock.patch.object(server.user_write_locks, "hold_many", wraps=server.user_write_locks.hold_many) as hold_many:
+        response = call_tool("add_memories_bulk", {"items": items, "user_id": USER_ID, "batch_size": BATCH})
+    batches = math.ceil(valid / BATCH)
+    results.append(check("itens válidos gravados", response["added"] == valid and response["failed"] == 1,
+                         (response["added"], response["failed"])))
+    results.append(check("status por índice", [r["index"] for r in response["results"]] == list(range(len(items)))))
+    results.append(check("item sem texto → erro no seu índice", response["results"][5]["status"] == "error", response["results"][5]))
+    results.append(check("um insert por lote", insert.call_count == batches, insert.call_count))
+    embed_calls = StubOllama.calls.get("embed", 0) + StubOllama.calls.get("embeddings", 0)
+    results.append(check("um embed por lote", embed_calls == batches, StubOllama.calls))
+    results.append(check("sem LLM", not StubOllama.calls.get("chat"), StubOllama.calls))
+    results.append(check("uma invalidação por usuário", sorted(c.args[0] for c in invalidate.call_args_list) == [USER_ID, OTHER_USER],
+                         [c.args for c in invalidate.call_args_list]))
+    locked = sorted(hold_many.call_args.args[0]) if hold_many.called else None
+    results.append(check("lock de escrita dos dois usuários", locked == [USER_ID, OTHER_USER], locked))
+    results.append(check("throughput reportado", response["items_per_second"] and response["batch_size"] == BATCH))
+
+    print_section("2. Registros, histórico e índices")
+    added = [r for r in response["results"] if r["status"] == "added"]
+    other_ids = [r["id"] for r in added if r["user_id"] == OTHER_USER]
+    results.append(check("user_id por item", len(other_ids) == 3))
+    payload = server.mem0.vector_store.get(vector_id=added[0]["id"]).payload
+    results.append(check("payload com texto, hash e tags", payload.get("data") == items[0]["text"] and payload.get("hash")
+                         and payload.get("tag:bulk") is True))
+    history = server.mem0.history(added[0]["id"])
+    results.append(check("histórico ADD gravado", [h.get("event") for h in history] == ["ADD"], history))
+    results.append(check("user_stats dos dois usuários", (user_stats(USER_ID), user_stats(OTHER_USER)) == (7, 3),
+                         (user_stats(USER_ID), user_stats(OTHER_USER))))
+
+    print_section("3. Falha num lote não derruba os outros")
+    embed_texts = server._embed_texts
+
+    def fail_second_batch(model, texts, *args):
+        if "partial failure note 3" in texts:
+            raise RuntimeError("embedding backend down")
+        return embed_texts(model, texts, *args)
+
+    more = [{"text": f"partial failure note {i}"} for i in range(6)]
+    with mock.patch.object(server, "_embed_texts", side_effect=fail_second_batch):
+        partial = add_memories_bulk(more, user_id=USER_ID, batch_size=3)
+    statuses = [r["status"] for r in partial["results"]]
+    results.append(check("só o lote com falha marcado como erro", statuses == ["added"] * 3 + ["error"] * 3, statuses))
+    results.append(check("mensagem do erro no item", partial["results"][3]["message"] == "embedding backend down"))
+
+    print_section("4. POST /_test/add_bulk")
+    client = TestClient(server.create_http_app())
+    http = client.post("/_test/add_bulk", json={"items": [{"text": "http bulk one", "user_id": USER_ID},
+                                                          {"text": "http bulk two", "user_id": USER_ID}], "batch_size": 8})
+    body = http.json()
+    results.append(check("rota grava o lote", http.status_code == 200 and body.get("added") == 2, body.get("added")))
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
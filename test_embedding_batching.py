@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Teste do micro-batching de embeddings contra um Ollama stub: embeds concorrentes saem numa
+única requisição ao /api/embed (input em lista), textos iguais em voo compartilham a chamada
+e stores populados pelo /api/embeddings legado continuam nele.
+"""
+
+import io
+import logging
+import sys
+import threading
+import types
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import StubOllama, embed_text, start_stub_environment
+
+start_stub_environment()
+logging.disable(logging.INFO)
+
+import server
+
+CONCURRENT = 8
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def embed_concurrently(batcher: server.BatchingEmbedder, texts: list[str]) -> list:
+    """Dispara os embeds ao mesmo tempo (barreira) e devolve os vetores na ordem dos textos."""
+    barrier = threading.Barrier(len(texts))
+    vectors = [None] * len(texts)
+
+    def run(i: int):
+        barrier.wait()
+        vectors[i] = batcher.embed(texts[i], "search")
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(texts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return vectors
+
+
+def main() -> int:
+    results = []
+    server._ensure_mem0()
+    batcher = server._embedding_batcher()
+    results.append(check("store novo usa /api/embed", isinstance(batcher.inner, server.OllamaBatchEmbedder)))
+
+    print_section("1. Embeds concorrentes viram uma requisição em lote")
+    batcher.window = 0.05
+    texts = [f"concurrent query number {i}" for i in range(CONCURRENT)]
+    StubOllama.reset()
+    before = batcher.stats()
+    vectors = embed_concurrently(batcher, texts)
+    after = batcher.stats()
+    results.append(check("vetores corretos para cada texto", vectors == [embed_text(t) for t in texts]))
+    results.append(check("nenhuma chamada ao /api/embeddings legado", "embeddings" not in StubOllama.calls, StubOllama.calls))
+    results.append(check(f"menos requisições que textos ({CONCURRENT})", StubOllama.calls.get("embed", 0) < CONCURRENT,
+                         StubOllama.calls.get("embed")))
+    results.append(check("batch_calls conta as requisições em lote",
+                         after["batch_calls"] - before["batch_calls"] == StubOllama.calls.get("embed"),
+                         after["batch_calls"] - before["batch_calls"]))
+    results.append(check("nenhuma chamada unitária", after["single_calls"] == before["single_calls"]))
+
+    print_section("2. Textos iguais em voo compartilham a chamada")
+    StubOllama.reset()
+    before = batcher.stats()
+    vectors = embed_concurrently(batcher, ["same shared query"] * CONCURRENT)
+    after = batcher.stats()
+    results.append(check("um único texto enviado ao provedor", StubOllama.embedded == ["same shared query"], StubOllama.embedded))
+    results.append(check("coalesced conta os demais", after["coalesced"] - before["coalesced"] == CONCURRENT - 1))
+    results.append(check("todos recebem o mesmo vetor", all(v == vectors[0] for v in vectors)))
+
+    print_section("3. Embed unitário e lote usam o mesmo endpoint (mesmo vetor)")
+    single = batcher.inner.embed("consistency check", "add")
+    in_batch = batcher.inner.embed_batch(["other text", "consistency check"], "add")[1]
+    results.append(check("vetor unitário == vetor no lote", single == in_batch))
+
+    print_section("4. OLLAMA_EMBED_API=auto respeita stores legados")
+    conn = server._state_db()
+    results.append(check("endpoint registrado no state_meta",
+                         conn.execute("SELECT value FROM state_meta WHERE key='ollama_embed_api'").fetchone()["value"] == "embed"))
+    with conn:
+        conn.execute("DELETE FROM state_meta WHERE key='ollama_embed_api'")
+    populated = types.SimpleNamespace(vector_store=types.SimpleNamespace(collection=types.SimpleNamespace(count=lambda: 3)))
+    results.append(check("store populado sem registro → legado", server._resolve_ollama_embed_api(populated) == "embeddings"))
+    empty = types.SimpleNamespace(vector_store=types.SimpleNamespace(collection=types.SimpleNamespace(count=lambda: 0)))
+    results.append(check("registro prevalece sobre a contagem", server._resolve_ollama_embed_api(empty) == "embeddings"))
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
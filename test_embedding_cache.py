@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Teste do cache de embeddings (EmbeddingCache + CachedEmbedder) contra um Ollama stub: buscas
+repetidas não voltam ao provedor, lotes só embedam os textos que faltam, a LRU em memória é
+limitada, o SQLite sobrevive a uma nova instância e as chaves separam provedor/modelo/dims.
+"""
+
+import io
+import logging
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import StubOllama, embed_text, start_stub_environment
+
+start_stub_environment()
+logging.disable(logging.INFO)
+
+import server
+from server import EmbeddingCache, get_performance_stats, search_memory
+
+USER_ID = "embedding_cache"
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def close(a: list[float], b: list[float]) -> bool:
+    return len(a) == len(b) and all(abs(x - y) < 1e-6 for x, y in zip(a, b))
+
+
+def main() -> int:
+    results = []
+    server._ensure_mem0()
+    embedder = server.mem0.embedding_model
+
+    print_section("1. Busca repetida não volta ao Ollama")
+    query = "which editor theme do I prefer"
+    StubOllama.reset()
+    before = server.embedding_cache.stats()
+    search_memory(query, user_id=USER_ID)
+    server.search_cache.clear()  # força a segunda busca até o embedder
+    search_memory(query, user_id=USER_ID)
+    after = server.embedding_cache.stats()
+    results.append(check("query embedada uma única vez", StubOllama.embedded.count(query) == 1, StubOllama.embedded))
+    results.append(check("hit na LRU em memória", after["memory_hits"] - before["memory_hits"] >= 1))
+    stats = get_performance_stats()["embedding_cache"]
+    results.append(check("get_performance_stats reporta o cache", stats.get("memory_hits", 0) >= 1 and stats.get("hit_ratio"), stats))
+
+    print_section("2. Lote: só os textos ausentes vão ao provedor")
+    StubOllama.reset()
+    vectors = embedder.embed_batch([query, "brand new text one", "brand new text two"])
+    results.append(check("só os novos embedados", StubOllama.embedded == ["brand new text one", "brand new text two"], StubOllama.embedded))
+    results.append(check("vetores na ordem pedida", close(vectors[0], embedder.embed(query))
+                         and close(vectors[1], embed_text("brand new text one"))))
+
+    print_section("3. Dois níveis: LRU limitada e SQLite persistente")
+    path = os.path.join(tempfile.mkdtemp(prefix="embedding-cache-"), "cache.db")
+    cache = EmbeddingCache(path, max_memory_entries=2, max_rows=0)
+    keys = [cache.make_key("ns", f"text {i}") for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, "ns", embed_text(f"text {i}"))
+    results.append(check("LRU respeita o limite", cache.stats()["memory_entries"] == 2))
+    results.append(check("mais antigo sai da memória", cache.peek(keys[0]) is None and cache.peek(keys[2]) is not None))
+    vector = cache.get(keys[0])
+    results.append(check("mais antigo vem do disco", vector is not None and cache.stats()["disk_hits"] == 1))
+    results.append(check("vetor float32 preservado", close(vector, embed_text("text 0"))))
+    reopened = EmbeddingCache(path, max_memory_entries=2, max_rows=0)
+    results.append(check("nova instância lê o disco (restart)", close(reopened.get(keys[1]), embed_text("text 1"))
+                         and reopened.stats()["disk_hits"] == 1))
+    results.append(check("texto desconhecido conta miss", reopened.get(reopened.make_key("ns", "unknown")) is None
+                         and reopened.stats()["misses"] == 1))
+
+    print_section("4. Chaves por provedor/modelo/dims")
+    results.append(check("namespace muda a chave", cache.make_key("ollama:a:64", "x") != cache.make_key("ollama:b:64", "x")))
+    namespace = embedder.namespace
+    results.append(check("namespace do embedder inclui modelo e dims",
+                         server.EMBEDDING_MODEL in namespace and str(server.EMBEDDING_DIMS) in namespace, namespace))
+    other = server.CachedEmbedder(embedder.inner, server.embedding_cache, namespace + ":other-model")
+    StubOllama.reset()
+    other.embed(query)
+    results.append(check("outro modelo não reaproveita o vetor", StubOllama.embedded == [query], StubOllama.embedded))
+
+    print_section("5. Poda do SQLite em max_rows")
+    pruned = EmbeddingCache(os.path.join(os.path.dirname(path), "pruned.db"), max_memory_entries=10, max_rows=50)
+    for i in range(1000):
+        pruned.put(pruned.make_key("ns", str(i)), "ns", [float(i)])
+    rows = pruned._db().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    results.append(check("linhas podadas ao limite", rows == 50, rows))
+    results.append(check("mais recentes mantidos", pruned._db().execute(
+        "SELECT 1 FROM embeddings WHERE key=?", (pruned.make_key("ns", "999"),)).fetchone() is not None))
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
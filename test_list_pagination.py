@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Teste da paginação do list_memories (offset e cursor keyset sobre o memory_index) contra um
+Ollama stub: páginas cobrem tudo sem repetir, o cursor é estável com escritas no meio da
+listagem e cursores inválidos são rejeitados.
+"""
+
+import io
+import logging
+import sys
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import start_stub_environment
+
+start_stub_environment()
+logging.disable(logging.INFO)
+
+from server import add_memories_bulk, add_memory, delete_memory, list_memories, rebuild_memory_index
+
+USER_ID = "list_pagination"
+TOTAL = 25
+PAGE = 10
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def walk_cursor(limit: int, on_page=None) -> list[str]:
+    """Percorre todas as páginas pelo next_cursor; on_page(i) roda depois de cada página."""
+    ids, cursor, pages = [], None, 0
+    while True:
+        page = list_memories(user_id=USER_ID, limit=limit, cursor=cursor)
+        ids.extend(m["id"] for m in page["memories"])
+        pages += 1
+        if on_page:
+            on_page(pages)
+        cursor = page["next_cursor"]
+        if not cursor:
+            return ids
+
+
+def main() -> int:
+    results = []
+    add_memories_bulk([{"text": f"pagination note {i:02d}", "tags": ["paging"]} for i in range(TOTAL)], user_id=USER_ID)
+
+    print_section("0. Antes do índice: offset direto no Chroma, cursor indisponível")
+    page = list_memories(user_id=USER_ID, limit=PAGE, offset=PAGE)
+    results.append(check("offset funciona sem índice", len(page["memories"]) == PAGE and page["total"] == TOTAL, page["total"]))
+    error = list_memories(user_id=USER_ID, cursor="anything")
+    results.append(check("cursor recusado até o índice existir", error.get("status") == "error", error.get("message")))
+    rebuild = rebuild_memory_index()
+    results.append(check("rebuild_memory_index indexa as memórias", rebuild.get("status") == "ok", rebuild))
+
+    print_section("1. Offset: páginas cobrem tudo, mais antigas primeiro")
+    pages = [list_memories(user_id=USER_ID, limit=PAGE, offset=offset) for offset in range(0, TOTAL, PAGE)]
+    by_offset = [m["id"] for page in pages for m in page["memories"]]
+    results.append(check("total do usuário", pages[0]["total"] == TOTAL, pages[0]["total"]))
+    results.append(check("tamanhos das páginas", [len(p["memories"]) for p in pages] == [10, 10, 5]))
+    results.append(check("sem repetições", len(set(by_offset)) == TOTAL))
+    texts = [m["memory"] for page in pages for m in page["memories"]]
+    results.append(check("ordem de inserção", texts == [f"pagination note {i:02d}" for i in range(TOTAL)], texts[:3]))
+
+    print_section("2. Cursor: mesma ordem do offset, última página sem next_cursor")
+    by_cursor = walk_cursor(PAGE)
+    results.append(check("cursor percorre a mesma sequência", by_cursor == by_offset))
+    last = list_memories(user_id=USER_ID, limit=TOTAL)
+    results.append(check("página exata com next_cursor", last["next_cursor"] is not None))
+    after_last = list_memories(user_id=USER_ID, limit=PAGE, cursor=last["next_cursor"])
+    results.append(check("depois do fim: página vazia sem cursor", after_last["memories"] == [] and after_last["next_cursor"] is None))
+
+    print_section("3. Cursor estável com escritas durante a listagem")
+    removed = by_offset[0]
+    added = []
+
+    def write_between_pages(page_number: int):
+        if page_number == 1:
+            delete_memory(removed, user_id=USER_ID)  # já listada: não desloca as próximas páginas
+            added.append(add_memory("pagination note late", user_id=USER_ID, mode="raw")["results"][0]["id"])
+
+    walked = walk_cursor(PAGE, on_page=write_between_pages)
+    results.append(check("nada pulado nem repetido", walked == by_offset + added, (len(walked), len(by_offset) + len(added))))
+
+    print_section("4. Projeção e erros")
+    page = list_memories(user_id=USER_ID, limit=2, fields=["memory", "tags"])
+    results.append(check("fields limita as chaves", all(set(m) <= {"id", "memory", "tags"} for m in page["memories"]),
+                         [sorted(m) for m in page["memories"]]))
+    error = list_memories(user_id=USER_ID, cursor="not-a-cursor")
+    results.append(check("cursor inválido → erro", error.get("status") == "error", error))
+    results.append(check("outro usuário não vê as memórias", list_memories(user_id="list_pagination_other")["total"] == 0))
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Teste das consultas de planos no SQLite (list_plans/get_plan) contra um Ollama stub: filtros
+por plan_id, status, prioridade, tag (inclusive hierárquica), only_open e prazo, ordenação por
+prazo/prioridade e paginação resolvidas no store.
+"""
+
+import io
+import logging
+import sys
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import start_stub_environment
+
+start_stub_environment()
+logging.disable(logging.INFO)
+
+from server import add_plan, get_plan, list_plans, update_plan_item
+
+USER_ID = "list_plans"
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def titles(response: dict) -> list[str]:
+    return [plan["title"] for plan in response["plans"]]
+
+
+def main() -> int:
+    results = []
+    search = add_plan("Ship search v2", items=["Benchmark", "Rollout"], tags=["proj.search.v2"], priority="urgent",
+                      due_date="2030-03-10", user_id=USER_ID, mode="raw")
+    auth = add_plan("Refactor auth", items=["Split module"], tags=["proj.auth"], priority="low",
+                    due_date="2030-01-15", user_id=USER_ID, mode="raw")
+    add_plan("Archive old logs", tags=["ops"], status="done", user_id=USER_ID, mode="raw")
+    add_plan("Rotate keys", items=["Generate"], tags=["ops.security"], priority="high", user_id=USER_ID, mode="raw")
+    add_plan("Other user's plan", tags=["proj.auth"], user_id="list_plans_other", mode="raw")
+
+    print_section("1. Filtros")
+    results.append(check("total do usuário", list_plans(user_id=USER_ID)["total"] == 4))
+    results.append(check("plan_id", titles(list_plans(user_id=USER_ID, plan_id=auth["plan_id"])) == ["Refactor auth"]))
+    results.append(check("tag exata", titles(list_plans(user_id=USER_ID, tag="proj.auth")) == ["Refactor auth"]))
+    results.append(check("tag hierárquica proj.*", sorted(titles(list_plans(user_id=USER_ID, tag="proj.*"))) == ["Refactor auth", "Ship search v2"]))
+    results.append(check("tag pai casa as filhas (tags expandidas)", titles(list_plans(user_id=USER_ID, tag="ops")) == ["Archive old logs", "Rotate keys"]))
+    results.append(check("status", titles(list_plans(user_id=USER_ID, status="done")) == ["Archive old logs"]))
+    results.append(check("priority", titles(list_plans(user_id=USER_ID, priority="urgent")) == ["Ship search v2"]))
+    due = titles(list_plans(user_id=USER_ID, due_from="2030-01-01", due_to="2030-01-15"))
+    results.append(check("prazo inclusivo", due == ["Refactor auth"], due))
+
+    print_section("2. only_open acompanha os itens")
+    results.append(check("planos sem itens abertos ficam de fora", "Archive old logs" not in titles(list_plans(user_id=USER_ID, only_open=True))))
+    item_id = auth["plan"]["checklist"][0]["id"]
+    update_plan_item(auth["plan_id"], item_id, "done", user_id=USER_ID)
+    results.append(check("item concluído tira o plano de only_open", "Refactor auth" not in titles(list_plans(user_id=USER_ID, only_open=True))))
+
+    print_section("3. Ordenação e paginação")
+    by_priority = titles(list_plans(user_id=USER_ID, sort_by="priority"))
+    results.append(check("prioridade (urgent > high > normal > low)",
+                         by_priority == ["Ship search v2", "Rotate keys", "Archive old logs", "Refactor auth"], by_priority))
+    by_due = titles(list_plans(user_id=USER_ID, sort_by="due_date"))
+    results.append(check("prazo, sem prazo por último", by_due[:2] == ["Refactor auth", "Ship search v2"], by_due))
+    by_due_desc = titles(list_plans(user_id=USER_ID, sort_by="due_date", sort_order="desc"))
+    results.append(check("prazo desc", by_due_desc[:2] == ["Ship search v2", "Refactor auth"], by_due_desc))
+    pages = [list_plans(user_id=USER_ID, limit=3, offset=offset) for offset in (0, 3)]
+    results.append(check("paginação", [len(p["plans"]) for p in pages] == [3, 1] and pages[0]["total"] == 4))
+    results.append(check("páginas sem repetição", len(set(titles(pages[0]) + titles(pages[1]))) == 4))
+    results.append(check("sort_by inválido → erro", list_plans(user_id=USER_ID, sort_by="title").get("status") == "error"))
+
+    print_section("4. get_plan")
+    plan = get_plan(search["plan_id"], user_id=USER_ID)
+    results.append(check("plano com checklist", plan.get("status") == "ok" and len(plan["plan"]["checklist"]) == 2))
+    results.append(check("outro usuário → not_found", get_plan(search["plan_id"], user_id="list_plans_other").get("status") == "not_found"))
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
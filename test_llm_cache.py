@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Teste do cache de extração do LLM (LLMCache + CachedLLM) contra um Ollama stub: reenvio do
+mesmo texto não paga a extração de novo, chave estável (data do prompt, NFKC, espaços),
+namespace por modelo, TTL, poda, respostas vazias fora do cache e invalidação na troca de LLM.
+"""
+
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import StubOllama, start_stub_environment
+
+start_stub_environment()
+logging.disable(logging.INFO)
+
+import server
+from server import CachedLLM, LLMCache, add_memory, change_llm_config, get_performance_stats
+
+USER_ID = "llm_cache"
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def facts_request(system: str, text: str, **kwargs):
+    messages = [{"role": "system", "content": system}, {"role": "user", "content": f"Input:\n{text}"}]
+    return server._llm_cache_request(messages, kwargs)
+
+
+class FakeLLM:
+    """LLM mínimo: devolve as respostas configuradas e conta as chamadas."""
+
+    def __init__(self, response: str):
+        self.response = response
+        self.calls = 0
+
+    def generate_response(self, messages, **kwargs):
+        self.calls += 1
+        return self.response
+
+
+def main() -> int:
+    results = []
+    server._ensure_mem0()
+    tmp = tempfile.mkdtemp(prefix="llm-cache-")
+
+    print_section("1. Reenvio do mesmo texto não repete a extração")
+    StubOllama.facts = ["User runs the nightly backups"]
+    StubOllama.reset()
+    add_memory("I run the nightly backups", user_id=USER_ID, mode="infer")
+    first = StubOllama.calls.get("chat", 0)
+    before = server.llm_cache.stats()["kinds"].get("facts", {}).get("hits", 0)
+    StubOllama.reset()
+    add_memory("  I run   the nightly backups ", user_id=USER_ID, mode="infer")
+    second = StubOllama.calls.get("chat", 0)
+    hits = server.llm_cache.stats()["kinds"].get("facts", {}).get("hits", 0) - before
+    results.append(check("extração servida do cache", hits == 1 and second == first - 1, (first, second, hits)))
+    stats = get_performance_stats()["llm_cache"]
+    results.append(check("get_performance_stats reporta o cache", stats.get("kinds", {}).get("facts", {}).get("hits", 0) >= 1
+                         and stats.get("rows", 0) >= 1, stats.get("kinds")))
+    StubOllama.facts = []
+
+    print_section("2. Chave da extração")
+    base = facts_request("Extract facts. Today's date is 2025-01-01.", "I like tea")
+    results.append(check("data do prompt ignorada", base == facts_request("Extract facts. Today's date is 2026-10-18.", "I like tea")))
+    results.append(check("NFKC e espaços colapsados", base == facts_request("Extract facts. Today's date is 2025-01-01.", "I  like ｔｅａ")))
+    results.append(check("prompt diferente muda a chave", base != facts_request("Extract entities.", "I like tea")))
+    results.append(check("response_format entra na chave",
+                         base != facts_request("Extract facts. Today's date is 2025-01-01.", "I like tea", response_format={"type": "json_object"})))
+    results.append(check("tools não são cacheadas", facts_request("x", "y", tools=[{"name": "t"}]) is None))
+    update = server._llm_cache_request([{"role": "user", "content": "Old memory: A. New facts: B"}], {})
+    results.append(check("decisão de update pelo prompt inteiro", update and update[0] == "update"))
+
+    print_section("3. CachedLLM: namespace por modelo e respostas vazias")
+    cache = LLMCache(os.path.join(tmp, "cache.db"), ttl=0, max_rows=0)
+    messages = [{"role": "system", "content": "Extract facts."}, {"role": "user", "content": "Input:\nI like tea"}]
+    inner = FakeLLM('{"facts": ["Likes tea"]}')
+    llm = CachedLLM(inner, cache, "ollama:model-a")
+    llm.generate_response(messages)
+    llm.generate_response(messages)
+    results.append(check("segunda chamada do cache", inner.calls == 1, inner.calls))
+    CachedLLM(inner, cache, "ollama:model-b").generate_response(messages)
+    results.append(check("outro modelo não reaproveita", inner.calls == 2, inner.calls))
+    empty = FakeLLM("")
+    empty_llm = CachedLLM(empty, cache, "ollama:model-c")
+    empty_llm.generate_response(messages)
+    empty_llm.generate_response(messages)
+    results.append(check("resposta vazia não é cacheada", empty.calls == 2, empty.calls))
+    removed = cache.invalidate("ollama:model-a")
+    results.append(check("invalidate remove só o namespace", removed == 1 and cache.stats()["rows"] == 1, cache.stats()["rows"]))
+
+    print_section("4. TTL e poda")
+    short = LLMCache(os.path.join(tmp, "ttl.db"), ttl=0.2, max_rows=0)
+    key = short.make_key("ns", "facts", "text")
+    short.put(key, "ns", "facts", "response", 12.5)
+    results.append(check("hit dentro do TTL", short.get(key, "facts") == "response"))
+    time.sleep(0.3)
+    results.append(check("expira após o TTL", short.get(key, "facts") is None and short.stats()["kinds"]["facts"]["expired"] == 1))
+    bounded = LLMCache(os.path.join(tmp, "bounded.db"), ttl=0, max_rows=10)
+    for i in range(100):
+        bounded.put(bounded.make_key("ns", "facts", str(i)), "ns", "facts", "r", 1.0)
+    results.append(check("poda em max_rows", bounded.stats()["rows"] == 10, bounded.stats()["rows"]))
+    results.append(check("tempo economizado reportado", short.stats()["saved_ms"] == 12.5, short.stats()["saved_ms"]))
+
+    print_section("5. change_llm_config descarta o modelo substituído")
+    old_namespace = server._llm_namespace(server.LLM_PROVIDER, server.LLM_MODEL)
+    count = "SELECT COUNT(*) FROM llm_responses WHERE namespace=?"
+    results.append(check("respostas do modelo atual no cache", server.llm_cache._db().execute(count, (old_namespace,)).fetchone()[0] >= 1))
+    change_llm_config("ollama", "stub-llm-next")
+    results.append(check("respostas do modelo anterior removidas",
+                         server.llm_cache._db().execute(count, (old_namespace,)).fetchone()[0] == 0))
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Teste do change_llm_config contra um Ollama stub: troca só o LLM (cliente Chroma, coleção,
+embedder e histórico seguem os mesmos), espera as chamadas em andamento, grava o .env em
+background com substituição atômica e não troca nada quando falha.
+"""
+
+import io
+import logging
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import StubOllama, start_stub_environment
+
+start_stub_environment()
+logging.disable(logging.INFO)
+
+import server
+from server import add_memory, change_llm_config
+
+USER_ID = "llm_swap"
+HOLD = 0.3
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def wait_env_writer():
+    """Espera as gravações do .env enfileiradas até aqui."""
+    server._env_writer.submit(lambda: None).result(timeout=10)
+
+
+def main() -> int:
+    results = []
+    memory = server._ensure_mem0()
+    env_dir = Path(tempfile.mkdtemp(prefix="llm-swap-"))
+    (env_dir / ".env").write_text("# config\nLLM_PROVIDER=ollama\nLLM_MODEL=stub-llm\nOTHER=keep\n", encoding="utf-8")
+    before = {
+        "memory": memory,
+        "vector_store": memory.vector_store,
+        "collection": memory.vector_store.collection,
+        "embedder": memory.embedding_model,
+        "db": memory.db,
+        "llm": memory.llm,
+    }
+
+    print_section("1. Troca só o LLM")
+    with mock.patch.object(server, "BASE_DIR", env_dir):
+        response = change_llm_config("ollama", "stub-llm-2")
+        wait_env_writer()
+    results.append(check("sucesso com latência reportada", response.get("status") == "success"
+                         and "swap_ms" in response and "swap_wait_ms" in response, response.get("status")))
+    results.append(check("mesma instância do Memory", server.mem0 is before["memory"]))
+    results.append(check("vector store, coleção, embedder e histórico reaproveitados",
+                         server.mem0.vector_store is before["vector_store"]
+                         and server.mem0.vector_store.collection is before["collection"]
+                         and server.mem0.embedding_model is before["embedder"]
+                         and server.mem0.db is before["db"]))
+    results.append(check("LLM novo", server.mem0.llm is not before["llm"]
+                         and server.mem0.config.llm.config.get("model") == "stub-llm-2"))
+    results.append(check("globais atualizados", (server.LLM_PROVIDER, server.LLM_MODEL) == ("ollama", "stub-llm-2")))
+
+    StubOllama.facts = ["User deploys on Fridays"]
+    StubOllama.reset()
+    add_memory("I deploy on fridays", user_id=USER_ID, mode="infer")
+    results.append(check("extração usa o modelo novo", StubOllama.chat_models and set(StubOllama.chat_models) == {"stub-llm-2"},
+                         StubOllama.chat_models))
+    StubOllama.facts = []
+
+    print_section("2. .env gravado em background, atômico")
+    env = (env_dir / ".env").read_text(encoding="utf-8")
+    results.append(check("chaves substituídas", "LLM_MODEL=stub-llm-2\n" in env and "LLM_PROVIDER=ollama\n" in env, env))
+    results.append(check("demais linhas preservadas", env.startswith("# config\n") and "OTHER=keep\n" in env))
+    results.append(check("sem arquivo temporário", sorted(p.name for p in env_dir.iterdir()) == [".env"]))
+
+    print_section("3. A troca espera as chamadas em andamento")
+    entered = threading.Event()
+
+    def in_flight_call():
+        with server.mem0_gate.shared():
+            entered.set()
+            time.sleep(HOLD)
+
+    reader = threading.Thread(target=in_flight_call)
+    reader.start()
+    entered.wait(5)
+    with mock.patch.object(server, "BASE_DIR", env_dir):
+        response = change_llm_config("ollama", "stub-llm")
+        wait_env_writer()
+    reader.join()
+    results.append(check("swap_wait_ms cobre a chamada em andamento", response["swap_wait_ms"] >= HOLD * 1000 * 0.8,
+                         response["swap_wait_ms"]))
+
+    print_section("4. Falhas não trocam nada")
+    llm = server.mem0.llm
+    invalid = change_llm_config("anthropic", "claude")
+    results.append(check("provedor inválido → erro", invalid.get("status") == "error" and server.mem0.llm is llm))
+    with mock.patch("mem0.utils.factory.LlmFactory.create", side_effect=RuntimeError("cannot build llm")):
+        failed = change_llm_config("ollama", "broken-model")
+    results.append(check("falha ao criar o LLM → erro", failed.get("status") == "error" and "cannot build llm" in failed["message"]))
+    results.append(check("LLM e configuração mantidos", server.mem0.llm is llm and server.LLM_MODEL == "stub-llm"
+                         and server.mem0.config.llm.config.get("model") == "stub-llm"))
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Teste dos jobs de inferência em background (mode="infer_async") contra um Ollama stub:
+conciliação com o registro bruto, novas tentativas com backoff, limite de tentativas e
+retomada depois de um crash sem repetir a extração nem duplicar memórias.
+"""
+
+import io
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+from uuid import uuid4
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import StubOllama, start_stub_environment
+
+start_stub_environment()
+os.environ.update({"ASYNC_INFER_MAX_ATTEMPTS": "2", "ASYNC_INFER_RETRY_BACKOFF_SECONDS": "30"})
+logging.disable(logging.INFO)
+
+import server
+from server import add_memory, get_memory_job_status
+
+USER_ID = "memory_jobs"
+
+
+class Crash(BaseException):
+    """Interrompe o job como um kill do processo: nenhum except Exception o trata."""
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def stored_texts() -> list[str]:
+    return [m["memory"] for m in server.mem0.get_all(user_id=USER_ID, limit=200).get("results", [])]
+
+
+def job_row(job_id: str) -> dict:
+    return dict(server._state_db().execute("SELECT * FROM memory_jobs WHERE job_id=?", (job_id,)).fetchone())
+
+
+def create_job(text: str) -> tuple[str, str]:
+    """Grava o registro bruto e o job pendente, sem passar pela fila (o teste roda o job)."""
+    job_id = str(uuid4())
+    raw_id = server._extract_id_from_mem0(server._add_raw_memory(text, USER_ID, {"job_id": job_id}))
+    now = datetime.now().isoformat()
+    conn = server._state_db()
+    with conn:
+        conn.execute(
+            "INSERT INTO memory_jobs (job_id, memory_id, user_id, text, metadata, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, NULL, 'pending', ?, ?)",
+            (job_id, raw_id, USER_ID, text, now, now),
+        )
+    return job_id, raw_id
+
+
+def raw_exists(raw_id: str) -> bool:
+    return server.mem0.vector_store.collection.get(ids=[raw_id])["ids"] == [raw_id]
+
+
+def wait_job(job_id: str, timeout: float = 15.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = get_memory_job_status(job_id=job_id, user_id=USER_ID)["job"]
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    return job
+
+
+def main() -> int:
+    results = []
+    server._ensure_mem0()
+
+    print_section("1. infer_async: registro bruto imediato, fato extraído em background")
+    StubOllama.facts = ["Billing deploys happen on Tuesday nights"]
+    queued = add_memory("we usually deploy billing on tuesday nights", user_id=USER_ID, mode="infer_async")
+    results.append(check("resposta imediata com job_id", queued.get("status") == "queued" and queued.get("job_id"), queued.get("status")))
+    job = wait_job(queued["job_id"])
+    results.append(check("job concluído", job["status"] == "done", job["status"]))
+    results.append(check("registro bruto substituído pelo fato", job["result"]["reconciliation"] == "replaced"
+                         and not raw_exists(queued["id"]) and StubOllama.facts[0] in stored_texts()))
+
+    print_section("2. Falha com tentativas restantes: backoff e next_attempt_at")
+    StubOllama.facts = ["Staging refresh runs every Monday"]
+    job_id, raw_id = create_job("staging gets refreshed on mondays")
+    with mock.patch.object(server, "_add_memory_record", side_effect=RuntimeError("ollama down")):
+        delay = server._run_memory_job(job_id)
+    row = job_row(job_id)
+    results.append(check("reagendado com atraso", delay and delay > 0 and row["status"] == "pending", delay))
+    results.append(check("tentativa e erro gravados", row["attempts"] == 1 and row["error"] == "ollama down" and row["next_attempt_at"]))
+    StubOllama.reset()
+    early = server._run_memory_job(job_id)
+    results.append(check("retomado antes da hora espera o agendamento", early and early > 0 and not StubOllama.calls.get("chat"), early))
+    with server._state_db() as conn:
+        conn.execute("UPDATE memory_jobs SET next_attempt_at=? WHERE job_id=?",
+                     ((datetime.now() - timedelta(seconds=1)).isoformat(), job_id))
+    results.append(check("segunda tentativa conclui", server._run_memory_job(job_id) is None and job_row(job_id)["status"] == "done"))
+    results.append(check("erro limpo ao concluir", job_row(job_id)["error"] is None))
+
+    print_section("3. Limite de tentativas")
+    job_id, raw_id = create_job("this one never works")
+    with mock.patch.object(server, "_add_memory_record", side_effect=RuntimeError("boom")):
+        server._run_memory_job(job_id)
+        with server._state_db() as conn:
+            conn.execute("UPDATE memory_jobs SET next_attempt_at=NULL WHERE job_id=?", (job_id,))
+        final = server._run_memory_job(job_id)
+    row = job_row(job_id)
+    results.append(check("falha definitiva após ASYNC_INFER_MAX_ATTEMPTS", final is None and row["status"] == "failed"
+                         and row["attempts"] == 2, (row["status"], row["attempts"])))
+    results.append(check("registro bruto preservado", raw_exists(raw_id)))
+
+    print_section("4. Crash depois da gravação: retomada não repete a extração")
+    fact = "Release notes are written by the on-call engineer"
+    StubOllama.facts = [fact]
+    job_id, raw_id = create_job("the on-call person writes the release notes")
+    with mock.patch.object(server, "_reconcile_raw_memory", side_effect=Crash()):
+        try:
+            server._run_memory_job(job_id)
+        except Crash:
+            pass
+    row = job_row(job_id)
+    results.append(check("job interrompido em running com o resultado gravado", row["status"] == "running" and row["result"],
+                         row["status"]))
+    results.append(check("fato gravado uma vez antes do crash", stored_texts().count(fact) == 1))
+    StubOllama.reset()
+    resumed = server._resume_memory_jobs()
+    job = wait_job(job_id)
+    results.append(check("retomado pelo startup e concluído", resumed >= 1 and job["status"] == "done", (resumed, job["status"])))
+    results.append(check("LLM não chamado de novo", not StubOllama.calls.get("chat"), StubOllama.calls))
+    results.append(check("sem memória duplicada", stored_texts().count(fact) == 1, stored_texts().count(fact)))
+    results.append(check("registro bruto removido na retomada", not raw_exists(raw_id)))
+
+    print_section("5. Crash depois da conciliação: registro bruto já removido")
+    fact = "Incident reviews happen within two days"
+    StubOllama.facts = [fact]
+    job_id, raw_id = create_job("we review incidents within two days")
+    update_job = server._update_job
+
+    def crash_on_done(job, **fields):
+        if fields.get("status") == "done":
+            raise Crash()
+        update_job(job, **fields)
+
+    with mock.patch.object(server, "_update_job", side_effect=crash_on_done):
+        try:
+            server._run_memory_job(job_id)
+        except Crash:
+            pass
+    results.append(check("bruto removido antes do crash", not raw_exists(raw_id) and job_row(job_id)["status"] == "running"))
+    StubOllama.reset()
+    server._run_memory_job(job_id)
+    row = job_row(job_id)
+    results.append(check("retomada conclui sem erro", row["status"] == "done" and json.loads(row["result"])["reconciliation"] == "replaced",
+                         row["status"]))
+    results.append(check("sem nova extração nem duplicata", not StubOllama.calls.get("chat") and stored_texts().count(fact) == 1))
+    StubOllama.facts = []
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Teste do warm-up/keep-alive do Ollama contra um servidor HTTP stub (não precisa de Ollama rodando)
+"""
+
+import io
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from server import OllamaKeepAlive
+
+COLD_LOAD_SECONDS = 0.3
+MODELS = [("embedding", "nomic-embed-text"), ("llm", "llama3.2:latest")]
+
+
+class StubOllama(BaseHTTPRequestHandler):
+    """Simula o Ollama: a primeira requisição de cada modelo paga a carga a frio."""
+
+    loaded: set[str] = set()
+    calls: list[dict] = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        StubOllama.calls.append({"path": self.path, **body})
+        if body.get("model") not in StubOllama.loaded:
+            time.sleep(COLD_LOAD_SECONDS)
+            StubOllama.loaded.add(body.get("model"))
+        if self.path == "/api/embed":
+            payload = {"model": body["model"], "embeddings": [[0.0] * 8]}
+        elif self.path == "/api/generate":
+            payload = {"model": body["model"], "response": "", "done": True, "done_reason": "load"}
+        else:
+            self.send_error(404)
+            return
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def main() -> int:
+    stub = ThreadingHTTPServer(("127.0.0.1", 0), StubOllama)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{stub.server_address[1]}"
+    results = []
+
+    print_section("1. Warm-up: carga a frio dos dois modelos")
+    keepalive = OllamaKeepAlive(base_url, lambda: MODELS, keep_alive="30m", interval=0.2, idle_window=1.5)
+    keepalive.touch()
+    keepalive.start()
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        warm = [m["warm_pings"] for m in keepalive.stats()["models"]]
+        if len(warm) == len(MODELS) and all(warm):
+            break
+        time.sleep(0.05)
+    stats = keepalive.stats()
+    models = {m["model"]: m for m in stats["models"]}
+    results.append(check("ambos os modelos pré-carregados", set(models) == {m for _, m in MODELS}, sorted(models)))
+    paths = {(c["path"], c["model"]) for c in StubOllama.calls}
+    results.append(check("embedding via /api/embed", ("/api/embed", "nomic-embed-text") in paths))
+    results.append(check("LLM via /api/generate sem prompt", ("/api/generate", "llama3.2:latest") in paths))
+    results.append(check("keep_alive enviado", all(c.get("keep_alive") == "30m" for c in StubOllama.calls)))
+
+    print_section("2. Latência a frio x a quente")
+    for model in models.values():
+        print(f"   {model['model']}: cold={model['cold_ms']} ms, warm_avg={model['warm_avg_ms']} ms")
+        results.append(check(
+            f"{model['model']}: cold > warm",
+            model["cold_ms"] is not None and model["warm_avg_ms"] is not None
+            and model["cold_ms"] > model["warm_avg_ms"],
+        ))
+
+    print_section("3. Sem tráfego: pings param após idle_window")
+    time.sleep(2.0)
+    calls_idle = len(StubOllama.calls)
+    time.sleep(0.6)
+    results.append(check("nenhum ping durante ociosidade", len(StubOllama.calls) == calls_idle, keepalive.stats()["skipped_idle"]))
+    keepalive.touch()
+    time.sleep(0.5)
+    results.append(check("tráfego retoma os pings", len(StubOllama.calls) > calls_idle))
+
+    print_section("4. Falhas não derrubam o keep-alive")
+    keepalive.stop(timeout=2)
+    broken = OllamaKeepAlive("http://127.0.0.1:9", lambda: MODELS[:1], interval=60, timeout=1)
+    failed = broken.ping_all()["models"][0]
+    results.append(check("falha contabilizada", failed["failures"] == 1 and failed["last_error"], failed["last_error"]))
+    results.append(check("thread parada", not keepalive.stats()["running"]))
+
+    stub.shutdown()
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Teste do GET /metrics e da atribuição de tempo por fase (embedding/llm/vector_query) nos
+tools, contra um Ollama stub. Falha se o patch de contexto no mem0 deixar de se aplicar
+(ex.: upgrade do mem0 que muda a forma de criar o ThreadPoolExecutor interno).
+"""
+
+import asyncio
+import importlib
+import io
+import json
+import logging
+import sys
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import StubOllama, start_stub_environment
+
+start_stub_environment()
+logging.disable(logging.INFO)
+
+from fastapi.testclient import TestClient
+
+import server
+
+USER_ID = "phase_metrics"
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def call_tool(name: str, arguments: dict) -> dict:
+    result = asyncio.run(server.mcp.call_tool(name, arguments))
+    content = result[0] if isinstance(result, tuple) else result
+    return json.loads(content[0].text)
+
+
+def phase_counts(tool: str) -> dict[str, int]:
+    """Número de observações por fase do tool no histograma de fases."""
+    with server.tool_phase_latency._lock:
+        series = dict(server.tool_phase_latency._series)
+    return {dict(labels)["phase"]: s[2] for labels, s in series.items() if dict(labels)["tool"] == tool}
+
+
+def phase_seconds(tool: str) -> dict[str, float]:
+    with server.tool_phase_latency._lock:
+        series = dict(server.tool_phase_latency._series)
+    return {dict(labels)["phase"]: s[1] for labels, s in series.items() if dict(labels)["tool"] == tool}
+
+
+def main() -> int:
+    results = []
+
+    print_section("1. Patch de contexto aplica no mem0 instalado")
+    server._ensure_mem0()
+    main_module = importlib.import_module("mem0.memory.main")
+    results.append(check("executor do mem0.memory.main propaga contextvars", server._context_propagated(main_module)))
+    results.append(check("_propagate_context idempotente", server._propagate_context(main_module)))
+
+    print_section("2. add_memory (infer) atribui as fases internas do mem0")
+    StubOllama.facts = ["User prefers dark mode in every editor"]
+    call_tool("add_memory", {"text": "I always use dark mode in my editors", "user_id": USER_ID, "mode": "infer"})
+    seconds = phase_seconds("add_memory")
+    print(f"   fases: { {k: round(v * 1000, 2) for k, v in seconds.items()} }")
+    for phase in ("llm", "embedding", "vector_query"):
+        results.append(check(f"fase {phase} medida", seconds.get(phase, 0) > 0, round(seconds.get(phase, 0) * 1000, 2)))
+
+    print_section("3. search_memory mede embedding e consulta vetorial")
+    call_tool("search_memory", {"query": "dark mode", "user_id": USER_ID})
+    seconds = phase_seconds("search_memory")
+    for phase in ("embedding", "vector_query"):
+        results.append(check(f"fase {phase} medida", seconds.get(phase, 0) > 0, round(seconds.get(phase, 0) * 1000, 2)))
+    results.append(check("uma observação por fase e chamada", set(phase_counts("search_memory").values()) == {1}))
+
+    print_section("4. GET /metrics no formato do Prometheus")
+    call_tool("search_memory", {"query": "dark mode", "user_id": USER_ID})
+    call_tool("add_memory", {"text": "x", "user_id": USER_ID, "mode": "bogus"})
+    response = TestClient(server.create_http_app()).get("/metrics")
+    body = response.text
+    results.append(check("200 text/plain", response.status_code == 200 and response.headers["content-type"].startswith("text/plain"),
+                         response.headers.get("content-type")))
+    results.append(check("linhas HELP/TYPE", "# TYPE mem0_tool_duration_seconds histogram" in body))
+    results.append(check("histograma por tool", 'mem0_tool_duration_seconds_count{tool="search_memory"} 2' in body))
+    results.append(check("bucket +Inf", 'mem0_tool_duration_seconds_bucket{tool="add_memory",le="+Inf"} 2' in body))
+    results.append(check("chamadas ok e error", 'mem0_tool_calls_total{tool="add_memory",status="ok"} 1' in body
+                         and 'mem0_tool_calls_total{tool="add_memory",status="error"} 1' in body))
+    results.append(check("fases por tool", 'mem0_tool_phase_duration_seconds_count{tool="search_memory",phase="cache_lookup"} 2' in body))
+    results.append(check("hit do cache de busca exportado", "mem0_search_cache_hits_total 1" in body))
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Teste do plan store (tabelas plans/plan_items/plan_tags no SQLite) contra um Ollama stub:
+migração dos planos antigos (checklist no metadata do Chroma), contadores dos itens,
+re-embed do título só quando ele muda e âncora vetorial do plano no modo infer.
+"""
+
+import io
+import json
+import logging
+import sys
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import StubOllama, embed_text, start_stub_environment
+
+start_stub_environment()
+logging.disable(logging.INFO)
+
+import server
+from server import add_memory, add_plan, add_plan_item, delete_plan, get_plan, list_plans, update_plan, update_plan_item
+
+USER_ID = "plan_store"
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def titles(response: dict) -> list[str]:
+    return [plan["title"] for plan in response["plans"]]
+
+
+def insert_legacy_plan() -> str:
+    """Grava um plano no formato antigo: checklist em JSON no metadata do registro vetorial."""
+    checklist = [
+        {"id": "legacy-1", "title": "Write migration", "status": "done"},
+        {"id": "legacy-2", "title": "Backfill data", "status": "todo"},
+    ]
+    server.mem0.vector_store.insert(
+        vectors=[embed_text("Legacy rollout plan")],
+        payloads=[{
+            "data": "Legacy rollout plan", "user_id": USER_ID, "rule_type": "plan", "plan_id": "legacy-plan",
+            "title": "Legacy rollout plan", "status": "active", "priority": "high", "tags": "planning,ops",
+            "checklist": json.dumps(checklist), "created_at": "2024-01-01T00:00:00",
+        }],
+        ids=["legacy-memory"],
+    )
+    return "legacy-plan"
+
+
+def main() -> int:
+    results = []
+    server._ensure_mem0()
+
+    print_section("1. Migração dos planos antigos para o SQLite")
+    legacy_id = insert_legacy_plan()
+    plan = get_plan(legacy_id, user_id=USER_ID)
+    results.append(check("plano antigo importado", plan.get("status") == "ok", plan.get("status")))
+    plan = plan.get("plan", {})
+    results.append(check("checklist importado na ordem", [i["title"] for i in plan.get("checklist", [])] == ["Write migration", "Backfill data"]))
+    results.append(check("contadores calculados", (plan.get("open_items"), plan.get("total_items")) == (1, 2)))
+    results.append(check("tags indexadas", titles(list_plans(user_id=USER_ID, tag="ops")) == ["Legacy rollout plan"]))
+    version = server._state_db().execute("SELECT value FROM state_meta WHERE key='plan_store_version'").fetchone()
+    results.append(check("versão do plan store gravada", version and int(version["value"]) == server.PLAN_STORE_VERSION))
+
+    print_section("2. Plano novo grava só o título no vetor")
+    created = add_plan("Refactor auth", items=["Split module"], tags=["proj.auth"], priority="low",
+                       due_date="2030-01-15", user_id=USER_ID, mode="raw")
+    plan_id = created["plan_id"]
+    payload = server.mem0.vector_store.get(vector_id=created["plan"]["id"]).payload
+    results.append(check("registro vetorial sem checklist", "checklist" not in payload and payload.get("plan_id") == plan_id))
+    results.append(check("status inválido → erro", add_plan("Bad", status="completed", user_id=USER_ID).get("status") == "error"))
+
+    print_section("3. Itens e contadores")
+    item_id = get_plan(plan_id, user_id=USER_ID)["plan"]["checklist"][0]["id"]
+    plan = update_plan_item(plan_id, item_id, "done", note="merged", user_id=USER_ID)["plan"]
+    results.append(check("item concluído fecha o plano", (plan["open_items"], plan["total_items"]) == (0, 1)))
+    results.append(check("nota gravada", plan["checklist"][0]["note"] == "merged"))
+    plan = add_plan_item(plan_id, "Update docs", user_id=USER_ID)["plan"]
+    results.append(check("novo item no fim", [i["title"] for i in plan["checklist"]] == ["Split module", "Update docs"]))
+    results.append(check("contadores atualizados", (plan["open_items"], plan["total_items"]) == (1, 2)))
+    missing = update_plan_item(plan_id, "missing-item", "done", user_id=USER_ID)
+    results.append(check("item inexistente → not_found", missing.get("status") == "not_found"))
+
+    print_section("4. Título re-embedado só quando muda")
+    StubOllama.reset()
+    update_plan(plan_id, status="paused", priority="high", user_id=USER_ID)
+    results.append(check("status/prioridade sem embedding", not StubOllama.embedded, StubOllama.embedded))
+    update_plan(plan_id, title="Refactor auth and sessions", user_id=USER_ID)
+    results.append(check("título novo embedado uma vez", StubOllama.embedded == ["Refactor auth and sessions"], StubOllama.embedded))
+    memory_id = get_plan(plan_id, user_id=USER_ID)["plan"]["id"]
+    payload = server.mem0.vector_store.get(vector_id=memory_id).payload
+    results.append(check("registro vetorial atualizado", payload.get("data") == "Refactor auth and sessions"
+                         and payload.get("status") == "paused", (payload.get("data"), payload.get("status"))))
+
+    print_section("5. Remoção e isolamento por usuário")
+    results.append(check("outro usuário não acessa o plano", get_plan(plan_id, user_id="someone_else").get("status") == "not_found"))
+    deleted = delete_plan(plan_id, user_id=USER_ID)
+    results.append(check("plano removido", deleted.get("status") == "deleted" and get_plan(plan_id, user_id=USER_ID)["status"] == "not_found"))
+    leftover = server._state_db().execute("SELECT COUNT(*) FROM plan_items WHERE plan_id=?", (plan_id,)).fetchone()[0]
+    results.append(check("itens removidos", leftover == 0))
+
+    print_section("6. mode=infer: a âncora do plano nunca é uma memória que o LLM atualizou")
+    existing = add_memory("Team standup happens at 9am", user_id=USER_ID, mode="raw")["results"][0]["id"]
+    StubOllama.facts = ["Team standup happens at 9am every weekday"]
+    StubOllama.memory_event = "UPDATE"
+    created = add_plan("Improve the team standup", user_id=USER_ID, mode="infer")
+    StubOllama.memory_event = "ADD"
+    updated = server.mem0.vector_store.get(vector_id=existing).payload
+    results.append(check("LLM atualizou a memória existente", updated.get("data") == StubOllama.facts[0], updated.get("data")))
+    anchor = created["plan"]["id"]
+    results.append(check("plano ancorado num registro próprio", anchor and anchor != existing, anchor))
+    delete_plan(created["plan_id"], user_id=USER_ID)
+    results.append(check("delete_plan preserva a memória atualizada",
+                         server.mem0.vector_store.collection.get(ids=[existing])["ids"] == [existing]))
+    StubOllama.facts = []
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
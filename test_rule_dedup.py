@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Teste da deduplicação de regras (hash normalizado + MinHash) e do find_duplicate_rules,
+contra um Ollama stub (não precisa de Ollama rodando)
+"""
+
+import io
+import logging
+import sys
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import StubOllama, start_stub_environment
+
+start_stub_environment()
+logging.disable(logging.INFO)
+
+import server
+from server import _minhash_similarity, _rule_signature, add_programming_rule, find_duplicate_rules
+
+USER_ID = "rule_dedup"
+RULE = "Always use parameterized queries to prevent SQL injection in database access code."
+# Maiúsculas, espaços e pontuação normalizam para o mesmo texto (hash); plural e typo caem no MinHash
+VARIANTS = {
+    "exata (maiúsculas/espaços)": "always use  PARAMETERIZED queries to prevent SQL injection in database access code",
+    "plural": "Always use parameterized query to prevent SQL injections in database access code.",
+    "typo": "Always use parametrized queries to prevent SQL injection in database access code.",
+    "pontuação": "Always use parameterized queries -- to prevent SQL injection, in database access code!",
+}
+DISTINCT = [
+    "Never use parameterized queries to prevent SQL injection in database access code.",
+    "Keep functions under 50 lines and with a single responsibility.",
+]
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def similarity(a: str, b: str) -> float:
+    return _minhash_similarity(_rule_signature(a)[1], _rule_signature(b)[1])
+
+
+def main() -> int:
+    results = []
+    threshold = server.RULE_NEAR_DUPLICATE_THRESHOLD
+
+    print_section("1. Assinaturas: variações acima do limite, regras distintas abaixo")
+    results.append(check("texto normalizado igual → mesmo hash", _rule_signature(RULE)[0] == _rule_signature(VARIANTS["exata (maiúsculas/espaços)"])[0]))
+    for name, text in VARIANTS.items():
+        score = similarity(RULE, text)
+        results.append(check(f"{name} ≥ {threshold}", score >= threshold, round(score, 3)))
+    for text in DISTINCT:
+        score = similarity(RULE, text)
+        results.append(check(f"distinta < {threshold}: {text[:40]}", score < threshold, round(score, 3)))
+
+    print_section("2. add_programming_rule rejeita as variações sem chamar o embedder")
+    first = add_programming_rule(RULE, language="python", category="security", user_id=USER_ID, mode="raw")
+    results.append(check("regra original gravada", first.get("status") == "added", first.get("status")))
+    embedded = len(StubOllama.embedded)
+    for name, text in VARIANTS.items():
+        result = add_programming_rule(text, language="python", category="security", user_id=USER_ID, mode="raw")
+        expected = "minhash" if name in ("plural", "typo") else "exact"
+        results.append(check(f"{name} → duplicate ({expected})",
+                             result.get("status") == "duplicate" and result.get("match") == expected,
+                             (result.get("status"), result.get("match"))))
+    results.append(check("nenhum embedding para as duplicatas", len(StubOllama.embedded) == embedded, len(StubOllama.embedded) - embedded))
+    negated = add_programming_rule(DISTINCT[0], language="python", category="security", user_id=USER_ID, mode="raw")
+    results.append(check("negação não é duplicata", negated.get("status") == "added", negated.get("status")))
+    other_category = add_programming_rule(VARIANTS["typo"], language="python", category="style", user_id=USER_ID, mode="raw")
+    results.append(check("outra categoria não é comparada", other_category.get("status") == "added"))
+
+    print_section("3. find_duplicate_rules agrupa as regras gravadas")
+    forced = add_programming_rule(VARIANTS["plural"], language="python", category="security",
+                                  user_id=USER_ID, mode="raw", check_duplicates=False)
+    results.append(check("variação gravada com check_duplicates=False", forced.get("status") == "added"))
+    report = find_duplicate_rules(user_id=USER_ID, use_embeddings=False)
+    clusters = report.get("clusters", [])
+    members = [rule["memory"] for cluster in clusters for rule in cluster["rules"]]
+    results.append(check("um cluster com original + plural", len(clusters) == 1 and clusters[0]["size"] == 2, [c["size"] for c in clusters]))
+    results.append(check("ligados por minhash", clusters and all("minhash" in r["matched_by"] for r in clusters[0]["rules"])))
+    results.append(check("regra negada fora dos clusters", DISTINCT[0] not in members))
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
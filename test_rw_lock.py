@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Teste da coordenação de acesso ao mem0 (ReadWriteLock + KeyedLocks): leitores em paralelo,
+escritor exclusivo com preferência sobre novos leitores, modo compartilhado reentrante,
+escritas serializadas por usuário e lotes que se cruzam sem deadlock.
+"""
+
+import io
+import logging
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import start_stub_environment
+
+start_stub_environment()
+logging.disable(logging.INFO)
+
+import server
+from server import KeyedLocks, ReadWriteLock
+
+HOLD = 0.2
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def run_threads(*targets) -> float:
+    """Roda os alvos em threads e devolve o tempo total."""
+    started = time.perf_counter()
+    threads = [threading.Thread(target=t) for t in targets]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+    return time.perf_counter() - started
+
+
+def main() -> int:
+    results = []
+
+    print_section("1. Leitores em paralelo, escritor exclusivo")
+    gate = ReadWriteLock()
+
+    def reader():
+        with gate.shared():
+            time.sleep(HOLD)
+
+    elapsed = run_threads(reader, reader, reader)
+    results.append(check("três leitores ao mesmo tempo", elapsed < HOLD * 2, round(elapsed, 3)))
+
+    events = []
+
+    def slow_reader():
+        with gate.shared():
+            events.append("reader-in")
+            time.sleep(HOLD)
+            events.append("reader-out")
+
+    def writer():
+        time.sleep(HOLD / 4)
+        with gate.exclusive():
+            events.append("writer")
+
+    def late_reader():
+        time.sleep(HOLD / 2)  # chega com o escritor já esperando
+        with gate.shared():
+            events.append("late-reader")
+
+    run_threads(slow_reader, writer, late_reader)
+    results.append(check("escritor espera o leitor em andamento", events.index("writer") > events.index("reader-out"), events))
+    results.append(check("novo leitor espera o escritor pendente", events.index("late-reader") > events.index("writer"), events))
+    stats = gate.stats()
+    results.append(check("espera contada como contenção", stats["exclusive"]["contended"] >= 1 and stats["shared"]["contended"] >= 1,
+                         stats))
+
+    print_section("2. Modo compartilhado reentrante com escritor pendente")
+    gate = ReadWriteLock()
+    reentered = threading.Event()
+
+    def nested_reader():
+        with gate.shared():
+            time.sleep(HOLD / 2)  # o escritor começa a esperar aqui
+            with gate.shared():
+                reentered.set()
+
+    def waiting_writer():
+        time.sleep(HOLD / 4)
+        with gate.exclusive():
+            pass
+
+    run_threads(nested_reader, waiting_writer)
+    results.append(check("reentrada não trava atrás do escritor", reentered.is_set()))
+    results.append(check("estado limpo no fim", gate.stats()["readers"] == 0 and not gate.stats()["writer"]))
+
+    print_section("3. Escritas por usuário")
+    locks = KeyedLocks()
+
+    def write(user):
+        def target():
+            with locks.hold(user):
+                time.sleep(HOLD)
+        return target
+
+    elapsed = run_threads(write("alice"), write("alice"))
+    results.append(check("mesmo usuário serializado", elapsed >= HOLD * 2, round(elapsed, 3)))
+    elapsed = run_threads(write("alice"), write("bob"))
+    results.append(check("usuários diferentes em paralelo", elapsed < HOLD * 2, round(elapsed, 3)))
+
+    def batch(users):
+        def target():
+            for _ in range(50):
+                with locks.hold_many(users):
+                    pass
+        return target
+
+    elapsed = run_threads(batch(["alice", "bob"]), batch(["bob", "alice"]), batch(["carol", "alice"]))
+    results.append(check("lotes cruzados sem deadlock", elapsed < 5, round(elapsed, 3)))
+    results.append(check("contenção registrada", locks.stats()["contended"] >= 1, locks.stats()))
+
+    print_section("4. _mem0_access e get_performance_stats")
+    server._ensure_mem0()
+    inside = []
+
+    def guarded_write():
+        server._call_guarded("alice", lambda: (inside.append(server.mem0_gate.stats()["readers"]), time.sleep(HOLD)))
+
+    elapsed = run_threads(guarded_write, guarded_write)
+    results.append(check("escritas guardadas do mesmo usuário serializadas", elapsed >= HOLD * 2 and inside == [1, 1],
+                         (round(elapsed, 3), inside)))
+    locks_stats = server.get_performance_stats()["locks"]
+    results.append(check("locks em get_performance_stats", {"mem0_instance", "user_writes"} <= set(locks_stats)))
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
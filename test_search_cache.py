@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Teste do cache de buscas: despejo LRU (entradas e bytes), TTL, invalidação por usuário e
+rule_type, descarte de resultados calculados antes de uma escrita e integração com
+search_memory/add_memory, contra um Ollama stub.
+"""
+
+import io
+import logging
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import StubOllama, start_stub_environment
+
+start_stub_environment()
+logging.disable(logging.INFO)
+
+import server
+from server import SearchCache, add_memory, add_programming_rule, search_memory, search_cache
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def new_cache(max_entries: int = 10, max_bytes: int = 1_000_000, ttl: float = 60.0) -> SearchCache:
+    return SearchCache(max_entries=max_entries, max_bytes=max_bytes, ttl=timedelta(seconds=ttl), sweep_interval=3600)
+
+
+def main() -> int:
+    results = []
+
+    print_section("1. LRU por número de entradas e por bytes")
+    cache = new_cache(max_entries=3)
+    for key in ("a", "b", "c"):
+        cache.put(key, {"results": [key]}, user_id="u1")
+    cache.get("a")  # "a" passa a ser a mais recente
+    cache.put("d", {"results": ["d"]}, user_id="u1")
+    results.append(check("despeja a menos usada (b)", cache.get("b") is None and cache.get("a") is not None))
+    results.append(check("evictions contado", cache.stats()["evictions"] == 1))
+    small = new_cache(max_bytes=200)
+    small.put("x", {"results": ["x" * 80]})
+    small.put("y", {"results": ["y" * 80]})
+    small.put("z", {"results": ["z" * 80]})
+    results.append(check("respeita o limite de bytes", small.stats()["bytes"] <= 200 and small.get("x") is None, small.stats()["bytes"]))
+    small.put("big", {"results": ["w" * 500]})
+    results.append(check("resultado maior que o limite não entra", small.get("big") is None))
+
+    print_section("2. TTL")
+    cache = new_cache(ttl=0.05)
+    cache.put("k", {"results": []}, user_id="u1")
+    results.append(check("válida antes do TTL", cache.get("k") is not None))
+    time.sleep(0.08)
+    results.append(check("expira depois do TTL", cache.get("k") is None and cache.stats()["expirations"] == 1))
+
+    print_section("3. Invalidação por usuário e por rule_type")
+    cache = new_cache()
+    cache.put("u1-all", {"results": []}, user_id="u1")
+    cache.put("u1-rules", {"results": []}, user_id="u1", rule_type="programming_rule")
+    cache.put("u1-plans", {"results": []}, user_id="u1", rule_type="plan")
+    cache.put("u2-all", {"results": []}, user_id="u2")
+    removed = cache.invalidate("u1", "plan")
+    results.append(check("escrita de plano remove buscas de planos e sem tipo", removed == 2 and cache.get("u1-plans") is None
+                         and cache.get("u1-all") is None, removed))
+    results.append(check("preserva buscas de outro tipo", cache.get("u1-rules") is not None))
+    results.append(check("preserva outros usuários", cache.get("u2-all") is not None))
+    cache.invalidate()
+    results.append(check("invalidate() sem usuário limpa tudo", len(cache) == 0))
+
+    print_section("4. Resultado calculado antes de uma escrita não entra no cache")
+    cache = new_cache()
+    generation = cache.generation("u1")
+    cache.invalidate("u1")
+    cache.put("late", {"results": []}, user_id="u1", generation=generation)
+    results.append(check("put com geração antiga descartado", cache.get("late") is None and cache.stats()["stale_puts"] == 1))
+    generation = cache.generation("u1")
+    cache.invalidate("u2")
+    cache.put("ok", {"results": []}, user_id="u1", generation=generation)
+    results.append(check("escrita de outro usuário não descarta", cache.get("ok") is not None))
+
+    print_section("5. search_memory usa o cache e add_memory invalida só o usuário")
+    add_memory("Prefers pytest fixtures over setUp methods", user_id="cache_a", mode="raw")
+    add_memory("Prefers pytest fixtures over setUp methods", user_id="cache_b", mode="raw")
+    search_memory("pytest fixtures", user_id="cache_a")
+    search_memory("pytest fixtures", user_id="cache_b")
+    StubOllama.reset()
+    hits = search_cache.stats()["hits"]
+    search_memory("pytest fixtures", user_id="cache_a")
+    results.append(check("segunda busca vem do cache", search_cache.stats()["hits"] == hits + 1 and not StubOllama.calls,
+                         StubOllama.calls))
+    add_memory("Runs mypy in strict mode", user_id="cache_a", mode="raw")
+    response = search_memory("pytest fixtures", user_id="cache_a", limit=10)
+    results.append(check("após escrita do usuário a busca vê a memória nova",
+                         any("mypy" in r["memory"] for r in response["results"]), len(response["results"])))
+    hits = search_cache.stats()["hits"]
+    search_memory("pytest fixtures", user_id="cache_b")
+    results.append(check("busca de outro usuário segue no cache", search_cache.stats()["hits"] == hits + 1))
+    search_memory("fixtures", user_id="cache_a", filters={"rule_type": "programming_rule"})
+    add_programming_rule("Use fixtures for shared test setup.", language="python", category="testing",
+                         user_id="cache_a", mode="raw")
+    hits = search_cache.stats()["hits"]
+    response = search_memory("fixtures", user_id="cache_a", filters={"rule_type": "programming_rule"})
+    results.append(check("nova regra invalida buscas de regras",
+                         search_cache.stats()["hits"] == hits and response["results"], len(response["results"])))
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Teste do search_rules sem query contra um Ollama stub: uma única consulta de metadata no
+Chroma ($in para várias severidades), ordem por severidade e created_at, paginação e
+filters_applied.
+"""
+
+import io
+import logging
+import sys
+from pathlib import Path
+from unittest import mock
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import StubOllama, embed_text, start_stub_environment
+
+start_stub_environment()
+logging.disable(logging.INFO)
+
+import server
+from server import add_programming_rule, search_rules
+
+USER_ID = "search_rules_filters"
+
+# (texto, severidade, framework) na ordem de gravação
+RULES = [
+    ("Prefer pathlib over os.path for file handling", "SHOULD", None),
+    ("Never build SQL queries with string formatting", "MUST", "django"),
+    ("Avoid mutable default arguments in functions", "MUST", None),
+    ("Stop using the imp module for dynamic imports", "DEPRECATED", None),
+    ("Consider dataclasses for plain data containers", "MAY", None),
+    ("Always enable CSRF middleware in production", "MUST", "django"),
+    ("Log exceptions with the traceback attached", "SHOULD", "django"),
+]
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def texts(response: dict) -> list[str]:
+    return [rule["memory"] for rule in response["results"]]
+
+
+def expected(severities: list[str] | None = None, framework: str | None = None) -> list[str]:
+    """Ordem esperada: severidade e, dentro dela, ordem de gravação."""
+    order = {sev: rank for rank, sev in enumerate(server.VALID_SEVERITIES)}
+    chosen = [(i, text, sev) for i, (text, sev, fw) in enumerate(RULES)
+              if (not severities or sev in severities) and (framework is None or fw == framework)]
+    return [text for _, text, _ in sorted(chosen, key=lambda r: (order[r[2]], r[0]))]
+
+
+def main() -> int:
+    results = []
+    server._ensure_mem0()
+    for text, severity, framework in RULES:
+        add_programming_rule(text, "python", "style", severity=severity, framework=framework,
+                             user_id=USER_ID, check_duplicates=False, mode="raw")
+    add_programming_rule("Never build SQL queries with string formatting", "python", "style", severity="MUST",
+                         user_id="search_rules_other", check_duplicates=False, mode="raw")
+
+    print_section("1. Ordem por severidade e created_at")
+    everything = search_rules(language="python", user_id=USER_ID, limit=20)
+    results.append(check("todas as regras do usuário", everything["total"] == len(RULES), everything["total"]))
+    results.append(check("MUST > SHOULD > MAY > DEPRECATED, depois created_at", texts(everything) == expected(), texts(everything)))
+
+    # Gravada por último, mas com created_at antigo (ex.: importada): vem antes das outras MUST
+    imported = "Pin every dependency in requirements files"
+    server.mem0.vector_store.insert(
+        vectors=[embed_text(imported)],
+        payloads=[{"data": imported, "user_id": USER_ID, "rule_type": "programming_rule", "language": "python",
+                   "category": "style", "severity": "MUST", "created_at": "2020-01-01T00:00:00-08:00"}],
+        ids=["imported-rule"],
+    )
+    must = texts(search_rules(language="python", severity=["MUST"], user_id=USER_ID))
+    results.append(check("created_at, não a ordem de gravação", must == [imported] + expected(["MUST"]), must))
+    server.mem0.vector_store.delete(vector_id="imported-rule")
+
+    print_section("2. Várias severidades: um único get com $in")
+    StubOllama.reset()
+    with mock.patch.object(server.mem0.vector_store.collection, "get",
+                           wraps=server.mem0.vector_store.collection.get) as get:
+        response = search_rules(language="python", severity=["SHOULD", "MUST"], user_id=USER_ID, limit=20)
+    results.append(check("uma ida ao Chroma", get.call_count == 1, get.call_count))
+    where = get.call_args.kwargs.get("where", {})
+    results.append(check("severidades no $in", {"severity": {"$in": ["SHOULD", "MUST"]}} in where.get("$and", []), where))
+    results.append(check("ordem entre as severidades pedidas", texts(response) == expected(["MUST", "SHOULD"]), texts(response)))
+    results.append(check("filters_applied lista as severidades", response["filters_applied"].get("severity") == ["SHOULD", "MUST"],
+                         response["filters_applied"]))
+    results.append(check("sem embeddings", not StubOllama.embedded, StubOllama.embedded))
+    single = search_rules(language="python", severity=["MUST"], framework="django", user_id=USER_ID)
+    results.append(check("severidade única + framework", texts(single) == expected(["MUST"], "django"), texts(single)))
+    results.append(check("filters_applied com severidade única", single["filters_applied"].get("severity") == "MUST"))
+
+    print_section("3. Paginação")
+    pages = [search_rules(language="python", user_id=USER_ID, limit=3, offset=offset) for offset in (0, 3, 6)]
+    results.append(check("páginas na ordem global", sum((texts(p) for p in pages), []) == expected()))
+    results.append(check("total em todas as páginas", {p["total"] for p in pages} == {len(RULES)}))
+    beyond = search_rules(language="python", user_id=USER_ID, limit=3, offset=50)
+    results.append(check("offset além do fim", beyond["results"] == [] and beyond["total"] == len(RULES)))
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Teste do tracing por chamada (TRACING_ENABLED) contra um Ollama stub: entradas do slow-call
+log com fases e spans, argumentos só em hash e o resumo do get_slow_calls.
+"""
+
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import start_stub_environment
+
+start_stub_environment()
+# Toda chamada entra no slow-call log
+os.environ.update({"TRACING_ENABLED": "true", "TRACE_SLOW_MS": "0"})
+logging.disable(logging.INFO)
+
+import server
+
+USER_ID = "slow_calls"
+SECRET = "the launch code is 0000-1111"
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def call_tool(name: str, arguments: dict) -> dict:
+    result = asyncio.run(server.mcp.call_tool(name, arguments))
+    content = result[0] if isinstance(result, tuple) else result
+    return json.loads(content[0].text)
+
+
+def main() -> int:
+    results = []
+    call_tool("add_memory", {"text": SECRET, "user_id": USER_ID, "mode": "raw"})
+    call_tool("search_memory", {"query": "launch code", "user_id": USER_ID})
+    call_tool("search_memory", {"query": "launch code", "user_id": USER_ID})
+    call_tool("add_memory", {"text": "x", "user_id": USER_ID, "mode": "bogus"})
+
+    print_section("1. Slow-call log")
+    server.slow_call_log.flush()
+    entries = server.slow_call_log.read()
+    tools = [e["tool"] for e in entries]
+    results.append(check("todas as chamadas registradas", tools.count("search_memory") == 2 and tools.count("add_memory") == 2, tools))
+    raw = Path(os.environ["TRACE_SLOW_LOG_PATH"]).read_text(encoding="utf-8")
+    results.append(check("texto dos argumentos não vai para o log", SECRET not in raw and "launch code" not in raw))
+    add_entry = next(e for e in entries if e["tool"] == "add_memory" and e["status"] == "ok")
+    results.append(check("argumentos em hash com tamanho", isinstance(add_entry["args"].get("text"), dict), add_entry["args"].get("text")))
+    results.append(check("fases e spans na entrada", add_entry["phases_ms"] and add_entry["spans"] is not None,
+                         sorted(add_entry["phases_ms"])))
+
+    print_section("2. get_slow_calls")
+    summary = call_tool("get_slow_calls", {"limit": 5})
+    offenders = {o["tool"]: o for o in summary["top_offenders"]}
+    results.append(check("ofensores agrupados por tool", offenders.get("search_memory", {}).get("calls") == 2, list(offenders)))
+    results.append(check("fase gargalo informada", all(o.get("bottleneck") for o in offenders.values())))
+    filtered = call_tool("get_slow_calls", {"tool": "add_memory"})
+    results.append(check("filtro por tool", {o["tool"] for o in filtered["top_offenders"]} == {"add_memory"}))
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
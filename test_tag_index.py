@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Teste do índice de tags contra um Ollama stub: chaves booleanas tag:<nome> no metadata do
+Chroma, tabela memory_tags (padrões hierárquicos 'a.b.*'), OR entre tags numa única busca e
+migração das memórias antigas que só têm o CSV "tags".
+"""
+
+import io
+import logging
+import sys
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import embed_text, start_stub_environment
+
+start_stub_environment()
+logging.disable(logging.INFO)
+
+import server
+from server import add_memory, delete_memory, rebuild_memory_index, search_memory
+
+USER_ID = "tag_index"
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def found(tags: list[str], query: str = "framework notes") -> list[str]:
+    return sorted(m["memory"] for m in search_memory(query, user_id=USER_ID, tags=tags, limit=10)["results"])
+
+
+def indexed_tags(memory_id: str) -> list[str]:
+    rows = server._state_db().execute("SELECT tag FROM memory_tags WHERE memory_id=? ORDER BY tag", (memory_id,))
+    return [r["tag"] for r in rows]
+
+
+def insert_legacy_memory() -> str:
+    """Grava uma memória no formato anterior ao índice: tags só como CSV no metadata."""
+    server.mem0.vector_store.insert(
+        vectors=[embed_text("Legacy framework notes about flask")],
+        payloads=[{"data": "Legacy framework notes about flask", "user_id": USER_ID,
+                   "tags": "python.flask,legacy", "created_at": "2024-01-01T00:00:00"}],
+        ids=["legacy-tagged"],
+    )
+    return "legacy-tagged"
+
+
+def main() -> int:
+    results = []
+    server._ensure_mem0()
+    rebuild_memory_index()
+
+    print_section("1. Gravação: chaves tag:<nome> no Chroma e linhas no memory_tags")
+    django = add_memory("Django framework notes", user_id=USER_ID, tags=["python", "python.django"], mode="raw")
+    django_id = django["results"][0]["id"]
+    fastapi_id = add_memory("FastAPI framework notes", user_id=USER_ID, tags=["python.fastapi"], mode="raw")["results"][0]["id"]
+    add_memory("Rust framework notes", user_id=USER_ID, tags=["rust"], mode="raw")
+    payload = server.mem0.vector_store.get(vector_id=django_id).payload
+    results.append(check("chave booleana por tag", payload.get("tag:python") is True and payload.get("tag:python.django") is True,
+                         sorted(k for k in payload if k.startswith("tag:"))))
+    results.append(check("CSV original preservado", payload.get("tags") == "python,python.django", payload.get("tags")))
+    results.append(check("memory_tags indexado", indexed_tags(django_id) == ["python", "python.django"], indexed_tags(django_id)))
+    metadata = django["results"][0].get("metadata") or {}
+    results.append(check("chaves internas fora da resposta", not any(k.startswith("tag:") for k in metadata), metadata))
+
+    print_section("2. Filtros por tag")
+    results.append(check("memória com várias tags casa qualquer uma", found(["python.django"]) == ["Django framework notes"]))
+    results.append(check("tag exata não casa filhas", found(["python"]) == ["Django framework notes"]))
+    results.append(check("padrão hierárquico python.*", found(["python.*"]) == ["Django framework notes", "FastAPI framework notes"]))
+    results.append(check("OR entre tags", found(["python.fastapi", "rust"]) == ["FastAPI framework notes", "Rust framework notes"]))
+    results.append(check("tag inexistente → vazio", found(["golang"]) == [] and found(["golang.*"]) == []))
+    hits = search_memory("framework notes", user_id=USER_ID, tags=["python.*"], limit=10)["results"]
+    results.append(check("resultados sem chaves tag:", all(not any(k.startswith("tag:") for k in (m.get("metadata") or {})) for m in hits)))
+
+    print_section("3. Remoção limpa o índice")
+    delete_memory(fastapi_id, user_id=USER_ID)
+    results.append(check("linhas removidas do memory_tags", indexed_tags(fastapi_id) == []))
+    results.append(check("busca hierárquica sem a memória removida", found(["python.*"]) == ["Django framework notes"]))
+
+    print_section("4. Migração de memórias antigas (só CSV)")
+    legacy_id = insert_legacy_memory()
+    results.append(check("antes do rebuild: fora do índice", found(["python.flask"]) == []))
+    rebuild = rebuild_memory_index()
+    results.append(check("rebuild atualiza a memória antiga", rebuild.get("updated") == 1, rebuild.get("updated")))
+    payload = server.mem0.vector_store.get(vector_id=legacy_id).payload
+    results.append(check("chaves tag: gravadas na antiga", payload.get("tag:python.flask") is True and payload.get("tag:legacy") is True))
+    results.append(check("tags antigas indexadas", indexed_tags(legacy_id) == ["legacy", "python.flask"], indexed_tags(legacy_id)))
+    results.append(check("padrão hierárquico inclui a antiga", found(["python.*"]) == ["Django framework notes", "Legacy framework notes about flask"]))
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Teste do user_stats contra um Ollama stub: os triggers de memory_index mantêm contagens de
+memórias/planos/regras, bytes e last_write_at na mesma transação das escritas, e o
+list_all_user_ids responde pela tabela sem varrer o Chroma.
+"""
+
+import io
+import logging
+import sys
+from pathlib import Path
+from unittest import mock
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_stub import start_stub_environment
+
+start_stub_environment()
+logging.disable(logging.INFO)
+
+import server
+from server import (add_memory, add_plan, add_programming_rule, delete_memory, delete_plan, list_all_user_ids,
+                    rebuild_memory_index, update_plan)
+
+USER_ID = "user_stats"
+OTHER_USER = "user_stats_other"
+COUNTERS = ("memory_count", "plan_count", "rule_count", "storage_bytes")
+
+
+def print_section(title: str):
+    """Imprime cabeçalho de seção"""
+    print("\n" + "=" * 80)
+    print(f"  {title}")
+    print("=" * 80)
+
+
+def check(name: str, condition: bool, detail=None) -> bool:
+    condition = bool(condition)
+    status = "✅ PASS" if condition else "❌ FAIL"
+    print(f"{status} {name}" + (f": {detail}" if detail is not None else ""))
+    return condition
+
+
+def stats(user_id: str) -> dict:
+    return list_all_user_ids()["stats"].get(user_id, {})
+
+
+def counters(user_id: str) -> tuple:
+    current = stats(user_id)
+    return tuple(current.get(k) for k in COUNTERS)
+
+
+def main() -> int:
+    results = []
+    server._ensure_mem0()
+    rebuild_memory_index()
+
+    print_section("1. Escritas atualizam os contadores")
+    add_memory("User stats first note", user_id=USER_ID, mode="raw")
+    note_id = add_memory("User stats second note", user_id=USER_ID, mode="raw")["results"][0]["id"]
+    plan = add_plan("User stats plan", items=["One"], user_id=USER_ID, mode="raw")
+    add_programming_rule("Always close database cursors", "python", "performance", user_id=USER_ID, mode="raw")
+    other_id = add_memory("Other user note", user_id=OTHER_USER, mode="raw")["results"][0]["id"]
+    current = stats(USER_ID)
+    results.append(check("memórias, planos e regras", (current.get("memory_count"), current.get("plan_count"),
+                                                        current.get("rule_count")) == (4, 1, 1), current))
+    results.append(check("bytes e last_write_at", current.get("storage_bytes", 0) > 0 and current.get("last_write_at")))
+    listing = list_all_user_ids()
+    results.append(check("usuários e contagens", listing["user_ids"] == [USER_ID, OTHER_USER]
+                         and listing["counts"] == {USER_ID: 4, OTHER_USER: 1}, listing["counts"]))
+
+    print_section("2. Sem varrer o Chroma")
+    with mock.patch.object(server.mem0.vector_store.collection, "get", wraps=server.mem0.vector_store.collection.get) as get, \
+            mock.patch.object(server.mem0.vector_store.client, "get_collection") as get_collection:
+        list_all_user_ids()
+    results.append(check("nenhuma leitura do Chroma", get.call_count == 0 and get_collection.call_count == 0,
+                         (get.call_count, get_collection.call_count)))
+
+    print_section("3. Atualização e remoção")
+    before = stats(USER_ID)
+    update_plan(plan["plan_id"], title="User stats plan with a much longer title than before", user_id=USER_ID)
+    after = stats(USER_ID)
+    results.append(check("re-embed do título troca os bytes sem recontar", after["memory_count"] == before["memory_count"]
+                         and after["plan_count"] == 1 and after["storage_bytes"] > before["storage_bytes"],
+                         (before["storage_bytes"], after["storage_bytes"])))
+    incremental = counters(USER_ID)
+    rebuild_memory_index()
+    results.append(check("rebuild chega aos mesmos bytes (memória, plano, regra)", counters(USER_ID) == incremental,
+                         (incremental, counters(USER_ID))))
+    delete_memory(note_id, user_id=USER_ID)
+    delete_plan(plan["plan_id"], user_id=USER_ID)
+    current = stats(USER_ID)
+    results.append(check("remoções decrementam", (current["memory_count"], current["plan_count"], current["rule_count"]) == (2, 0, 1),
+                         current))
+    delete_memory(other_id, user_id=OTHER_USER)
+    results.append(check("usuário sem memórias sai da lista", OTHER_USER not in list_all_user_ids()["user_ids"]))
+
+    print_section("4. rebuild_memory_index recalcula os mesmos valores")
+    incremental = counters(USER_ID)
+    rebuild_memory_index()
+    results.append(check("triggers == recálculo", counters(USER_ID) == incremental, (incremental, counters(USER_ID))))
+
+    print_section(f"RESUMO: {sum(results)}/{len(results)} verificações")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())